@@ -0,0 +1,104 @@
+"""Synthetic images for benchmarks.
+
+The images are deterministic, so the results are comparable between runs.
+"""
+from __future__ import annotations
+
+import docked as d
+
+
+def make_stage(
+    index: int,
+    steps: int,
+    base: d.Stage | d.BaseImage,
+    prev: d.Stage | None = None,
+) -> d.Stage:
+    """A stage with a mix of RUN with mounts, COPY, ENV, and WORKDIR.
+
+    If ``prev`` stage is specified, some steps copy files from it.
+    """
+    build: list[d.BuildStep] = [d.ARG('VERSION', '1.0'), d.WORKDIR('/app')]
+    for i in range(steps - len(build)):
+        kind = i % 6
+        if kind == 0:
+            build.append(d.RUN(
+                f'make -j4 target-{i}', f'make install-{i}',
+                mount=d.CacheMount(f'/root/.cache/{i % 7}', sharing='locked'),
+            ))
+        elif kind == 1:
+            build.append(d.COPY(f'src/pkg{i}/', f'/app/pkg{i}/', link=i % 4 == 1))
+        elif kind == 2:
+            build.append(d.ENV(f'VAR_{i}', f'value-{i}-$VERSION'))
+        elif kind == 3 and prev is not None:
+            build.append(d.RUN(
+                f'cp -r /mnt/app/pkg{i} /app/',
+                mount=[d.BindMount('/mnt', from_stage=prev), d.CacheMount('/tmp/cache')],
+            ))
+        elif kind == 4 and prev is not None:
+            build.append(d.COPY(f'/app/pkg{i}', f'/app/lib{i}', from_stage=prev))
+        else:
+            build.append(d.RUN(['python3', '-c', f'print({i})'], shell=False, network='none'))
+    return d.Stage(
+        base=base,
+        name=f'stage{index}',
+        build=build,
+        run=[d.ENTRYPOINT(['/app/bin/run']), d.CMD(['--port', '8080'])],
+        labels={'org.opencontainers.image.version': str(index)},
+    )
+
+
+def make_image(stages: int = 100, steps: int = 1000) -> d.Image:
+    """An image with many stages, each with many steps.
+
+    Every 10 stages share a chain of bases, and each stage
+    copies files from the previous one.
+    """
+    result: list[d.Stage] = []
+    for i in range(stages):
+        prev = result[-1] if result else None
+        base: d.Stage | d.BaseImage = d.BaseImage('python', '3.11-slim')
+        if prev is not None and i % 10:
+            base = prev
+        result.append(make_stage(i, steps, base=base, prev=prev))
+    return d.Image(*result)
+
+
+def make_images(count: int = 50, stages: int = 5, steps: int = 50) -> list[d.Image]:
+    """Many small images for benchmarking Fleet.
+
+    All images start with the same stage, so there are stages to share.
+    """
+    shared = make_stage(0, steps, base=d.BaseImage('python', '3.11-slim'))
+    images = []
+    for i in range(count):
+        result = [shared]
+        for j in range(1, stages):
+            result.append(make_stage(i * stages + j, steps, base=result[-1], prev=result[-1]))
+        images.append(d.Image(*result))
+    return images
+
+
+def make_steps(count: int = 1_000_000) -> list[d.BuildStep]:
+    """Many steps of all kinds, with and without mounts, for measuring memory.
+    """
+    base = d.BaseImage('python', '3.11-slim')
+    result: list[d.BuildStep] = []
+    for i in range(count):
+        kind = i % 8
+        if kind == 0:
+            result.append(d.RUN(f'make target-{i}', mount=d.CacheMount(f'/root/.cache/{i}', sharing='locked')))
+        elif kind == 1:
+            result.append(d.RUN(f'cp -r /mnt/{i} /app/', mount=d.BindMount('/mnt', from_stage=base)))
+        elif kind == 2:
+            result.append(d.COPY(f'src/pkg{i}/', f'/app/pkg{i}/', link=True))
+        elif kind == 3:
+            result.append(d.COPY(f'/app/pkg{i}', f'/app/lib{i}', from_stage=base))
+        elif kind == 4:
+            result.append(d.DOWNLOAD(f'https://example.com/{i}.tar', f'/opt/{i}.tar'))
+        elif kind == 5:
+            result.append(d.CLONE(f'https://example.com/{i}.git', f'/src/{i}'))
+        elif kind == 6:
+            result.append(d.EXTRACT(f'dist/{i}.tar.gz', '/opt/'))
+        else:
+            result.append(d.ENV(f'VAR_{i}', f'value-{i}'))
+    return result
@@ -0,0 +1,64 @@
+"""
+Benchmark linting of huge stages and of many images in parallel.
+
+    python3 -m benchmarks.lint
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import docked as d
+from docked._linter import lint
+
+from .generators import make_image, make_stage
+
+
+STEPS = 100_000
+IMAGES = 200
+MODULE = f'''
+import sys
+sys.path.insert(0, {str(Path(__file__).parent.parent)!r})
+from benchmarks.generators import make_image
+image = make_image(stages=5, steps=200)
+'''
+
+
+def main() -> None:
+    stage = make_stage(0, STEPS, base=d.BaseImage('python', '3.11-slim'))
+    # steps that are checked for being the first or the last of their type
+    stage.run.extend(d.CMD(['echo', str(i)]) for i in range(STEPS // 10))
+    stage.build.extend(d.USER(f'user{i}') for i in range(STEPS // 10))
+    image = d.Image(stage)
+    start = perf_counter()
+    count = sum(1 for _ in lint(image))
+    total = perf_counter() - start
+    steps = len(stage.build) + len(stage.run)
+    print(f'lint {steps} steps:  {total * 1000:10.2f} ms, {count} violations')
+
+    images = [make_image(stages=5, steps=200) for _ in range(IMAGES)]
+    start = perf_counter()
+    for image in images:
+        list(lint(image))
+    total = perf_counter() - start
+    print(f'lint {IMAGES} images:    {total * 1000:10.2f} ms sequentially')
+    start = perf_counter()
+    d.lint_many(images)
+    total = perf_counter() - start
+    print(f'lint {IMAGES} images:    {total * 1000:10.2f} ms in parallel, pickled')
+
+    with TemporaryDirectory() as tmp_dir:
+        modules = []
+        for i in range(IMAGES):
+            module = Path(tmp_dir, f'image{i}.py')
+            module.write_text(MODULE)
+            modules.append(module)
+        start = perf_counter()
+        d.lint_many(modules)
+        total = perf_counter() - start
+    print(f'lint {IMAGES} modules:   {total * 1000:10.2f} ms in parallel')
+
+
+if __name__ == '__main__':
+    main()
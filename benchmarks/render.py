@@ -0,0 +1,40 @@
+"""
+Benchmark rendering of a big Image multiple times.
+
+    python3 -m benchmarks.render
+"""
+from __future__ import annotations
+
+from timeit import timeit
+
+import docked as d
+
+
+STEPS = 5_000
+RENDERS = 1_000
+
+
+def make_image(steps: int = STEPS) -> d.Image:
+    build: list[d.BuildStep] = []
+    for i in range(steps // 2):
+        build.append(d.ENV(f'VAR_{i}', str(i)))
+        build.append(d.RUN(
+            f'echo {i}', 'echo done',
+            mount=d.CacheMount(f'/cache/{i % 10}'),
+        ))
+    stage = d.Stage(base=d.BaseImage('alpine', tag='3.18'), build=build)
+    return d.Image(stage)
+
+
+def main() -> None:
+    image = make_image()
+    first = timeit(image.as_str, number=1)
+    print(f'first render:    {first * 1000:8.2f} ms')
+    total = timeit(image.as_str, number=RENDERS)
+    print(f'cached renders:  {total * 1000 / RENDERS:8.4f} ms per render')
+    total = timeit(lambda: image.syntax, number=RENDERS)
+    print(f'cached syntax:   {total * 1000 / RENDERS:8.4f} ms per call')
+
+
+if __name__ == '__main__':
+    main()
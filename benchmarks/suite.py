@@ -0,0 +1,243 @@
+"""
+Benchmark suite for rendering, linting, and build orchestration.
+
+    python3 -m benchmarks.suite               # run and compare with the baseline
+    python3 -m benchmarks.suite --save        # run and update the baseline
+    python3 -m benchmarks.suite --stages 10   # a quick run, without comparison
+
+The timings depend on the machine, so the baseline should be saved
+on the same machine (or CI runner) where the comparison is done.
+The exit code is the number of benchmarks that got slower than the baseline
+by more than the threshold.
+"""
+from __future__ import annotations
+
+import json
+import shutil
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, NamedTuple
+
+import docked as d
+
+from .generators import make_image, make_images, make_steps
+
+
+BASELINE = Path(__file__).parent / 'baseline.json'
+# How many steps to keep in memory for measuring the memory they take.
+MEMORY_STEPS = 1_000_000
+
+
+class Params(NamedTuple):
+    stages: int
+    steps: int
+    images: int
+
+
+# Each benchmark gets a function that makes a new image (not measured)
+# and returns a function to measure.
+Setup = Callable[[Params], Callable[[], object]]
+BENCHMARKS: dict[str, Setup] = {}
+
+
+def benchmark(name: str) -> Callable[[Setup], Setup]:
+    def wrapper(setup: Setup) -> Setup:
+        BENCHMARKS[name] = setup
+        return setup
+    return wrapper
+
+
+@benchmark('as_str')
+def bench_as_str(params: Params) -> Callable[[], object]:
+    return make_image(params.stages, params.steps).as_str
+
+
+@benchmark('as_str_cached')
+def bench_as_str_cached(params: Params) -> Callable[[], object]:
+    image = make_image(params.stages, params.steps)
+    image.as_str()
+    return image.as_str
+
+
+@benchmark('iter_lines')
+def bench_iter_lines(params: Params) -> Callable[[], object]:
+    image = make_image(params.stages, params.steps)
+    return lambda: list(image.iter_lines())
+
+
+@benchmark('save')
+def bench_save(params: Params) -> Callable[[], object]:
+    image = make_image(params.stages, params.steps)
+    tmp_dir = TemporaryDirectory()
+
+    def run() -> None:
+        with tmp_dir:
+            image.save(Path(tmp_dir.name, 'Dockerfile'))
+    return run
+
+
+@benchmark('lint')
+def bench_lint(params: Params) -> Callable[[], object]:
+    image = make_image(params.stages, params.steps)
+    return lambda: image.lint(stdout=StringIO(), exit_on_failure=False)
+
+
+@benchmark('parse')
+def bench_parse(params: Params) -> Callable[[], object]:
+    lines = list(make_image(params.stages, params.steps).iter_lines())
+    return lambda: d.parse_dockerfile(lines)
+
+
+@benchmark('min_version')
+def bench_min_version(params: Params) -> Callable[[], object]:
+    image = make_image(params.stages, params.steps)
+    return lambda: image.min_version
+
+
+@benchmark('prune')
+def bench_prune(params: Params) -> Callable[[], object]:
+    image = make_image(params.stages, params.steps)
+    return lambda: image.prune(image.stages[-1])
+
+
+@benchmark('intern')
+def bench_intern(params: Params) -> Callable[[], object]:
+    return make_image(params.stages, params.steps).intern
+
+
+@benchmark('as_str_interned')
+def bench_as_str_interned(params: Params) -> Callable[[], object]:
+    image = make_image(params.stages, params.steps)
+    image.intern()
+    return image.as_str
+
+
+@benchmark('fleet_as_bake')
+def bench_fleet_as_bake(params: Params) -> Callable[[], object]:
+    fleet = d.Fleet()
+    for i, image in enumerate(make_images(params.images)):
+        fleet.add(image, tags=[f'image{i}'])
+    return fleet.as_bake
+
+
+@benchmark('fleet_build')
+def bench_fleet_build(params: Params) -> Callable[[], object]:
+    # `true` ignores all arguments, so only the orchestration is measured
+    binary = shutil.which('true') or 'true'
+    fleet = d.Fleet(jobs=8, binary=binary)
+    for i, image in enumerate(make_images(params.images)):
+        fleet.add(image, tags=[f'image{i}'])
+    return fleet.build
+
+
+def measure(setup: Setup, params: Params, repeat: int) -> float:
+    """The best time of a few runs, in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        run = setup(params)
+        start = perf_counter()
+        run()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def measure_memory(params: Params) -> int:
+    """Peak memory in bytes used for generating and rendering the image.
+    """
+    tracemalloc.start()
+    try:
+        make_image(params.stages, params.steps).as_str()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def measure_steps_memory(count: int = MEMORY_STEPS) -> int:
+    """Memory in bytes taken by the given number of steps, without rendering them.
+    """
+    tracemalloc.start()
+    try:
+        steps = make_steps(count)
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del steps
+    return current
+
+
+def compare(
+    results: dict[str, float],
+    baseline: dict[str, float],
+    threshold: float,
+) -> list[str]:
+    """Print the results compared to the baseline and return the regressed names.
+
+    The benchmarks missing in the baseline are reported but never regress.
+    """
+    regressed = []
+    missing = []
+    for name, value in results.items():
+        old = baseline.get(name)
+        if not old:
+            print(f'{name:16} {value:12.4f} {"-":>12}')
+            missing.append(name)
+            continue
+        ratio = value / old
+        status = ''
+        if ratio > 1 + threshold:
+            status = 'SLOWER'
+            regressed.append(name)
+        elif ratio < 1 - threshold:
+            status = 'faster'
+        print(f'{name:16} {value:12.4f} {old:12.4f} {ratio:6.2f}x {status}')
+    if baseline and missing:
+        print(f'not in the baseline (run with --save to add): {", ".join(missing)}')
+    return regressed
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = ArgumentParser(prog='python3 -m benchmarks.suite')
+    parser.add_argument('--stages', type=int, default=100)
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--images', type=int, default=50, help='images in the fleet')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--threshold', type=float, default=.2, help='allowed slowdown, .2 is 20%%')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='save the results as the baseline')
+    parser.add_argument('-k', dest='only', default='', help='run only benchmarks with it in the name')
+    args = parser.parse_args(argv)
+
+    params = Params(stages=args.stages, steps=args.steps, images=args.images)
+    results: dict[str, float] = {}
+    for name, setup in BENCHMARKS.items():
+        if args.only in name:
+            results[name] = measure(setup, params, args.repeat)
+    if 'memory' in args.only or not args.only:
+        # in MiB, so it's on the same scale as the timings in seconds
+        results['peak_memory_mib'] = measure_memory(params) / 1024 / 1024
+        results['steps_memory_mib'] = measure_steps_memory() / 1024 / 1024
+
+    baseline: dict[str, float] = {}
+    if args.baseline.exists():
+        stored = json.loads(args.baseline.read_text())
+        if stored['params'] == list(params):
+            baseline = stored['results']
+        else:
+            print(f'the baseline was recorded with different params: {stored["params"]}')
+    print(f'{"benchmark":16} {"current":>12} {"baseline":>12}')
+    regressed = compare(results, baseline, args.threshold)
+    if args.save:
+        content = {'params': list(params), 'python': sys.version.split()[0], 'results': results}
+        args.baseline.write_text(json.dumps(content, indent=2) + '\n')
+    return len(regressed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,6 +4,9 @@ A human-friendly alternative to Dockerfile.
 It's a Python library for generating Docker images,
 with API designed to be safe, secure, and easy-to-use correctly.
 """
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
 
 from . import cmd
 from ._image import Image
@@ -15,25 +18,68 @@ from ._steps import (
 )
 from ._types import (
     BaseImage, BindMount, CacheMount, Checksum, Mount, SecretMount, SSHMount,
+    replace,
 )
 
 
+if TYPE_CHECKING:
+    from ._async import AsyncBuild
+    from ._cli import entrypoint
+    from ._fleet import BuildResult, Fleet, Target
+    from ._intern import intern
+    from ._linter import lint_many
+    from ._optimizers import find_shared_prefixes, git_churn
+    from ._parser import parse_dockerfile
+    from ._profile import BuildProfile, StepTiming, parse_progress
+
+# Names that are imported only on the first access, so that generating
+# Dockerfiles doesn't load the build machinery, the linter, and the rest.
+_LAZY = {
+    'AsyncBuild': '_async',
+    'BuildProfile': '_profile',
+    'BuildResult': '_fleet',
+    'entrypoint': '_cli',
+    'find_shared_prefixes': '_optimizers',
+    'Fleet': '_fleet',
+    'git_churn': '_optimizers',
+    'intern': '_intern',
+    'lint_many': '_linter',
+    'parse_dockerfile': '_parser',
+    'parse_progress': '_profile',
+    'StepTiming': '_profile',
+    'Target': '_fleet',
+}
+
 __version__ = '0.1.0'
 __all__ = [
     # classes and things
+    'AsyncBuild',
     'BaseImage',
     'BindMount',
+    'BuildProfile',
+    'BuildResult',
     'BuildStep',
     'CacheMount',
     'Checksum',
     'cmd',
+    'entrypoint',
+    'find_shared_prefixes',
+    'git_churn',
+    'Fleet',
     'Image',
+    'intern',
+    'lint_many',
     'Mount',
+    'parse_dockerfile',
+    'parse_progress',
+    'replace',
     'RunStep',
     'SecretMount',
     'SSHMount',
     'Stage',
     'Step',
+    'StepTiming',
+    'Target',
 
     # steps
     'ARG',
@@ -54,3 +100,17 @@ __all__ = [
     'VOLUME',
     'WORKDIR',
 ]
+
+
+def __getattr__(name: str) -> object:
+    module_name = _LAZY.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    from importlib import import_module
+    value = getattr(import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,6 @@
+import sys
+
+from ._cli import entrypoint
+
+
+sys.exit(entrypoint())
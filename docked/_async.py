@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import signal
+from time import perf_counter
+from typing import TYPE_CHECKING, AsyncGenerator, AsyncIterator
+
+from ._fleet import BuildResult
+
+
+if TYPE_CHECKING:
+    from asyncio.subprocess import Process
+    from types import TracebackType
+
+
+# The max length of a single log line.
+LINE_LIMIT = 1024 * 1024
+
+
+class AsyncBuild:
+    """A build running in the background, controlled from asyncio.
+
+    The build is started on the first iteration or ``wait`` call.
+    Iterate over it to get the log lines (stdout and stderr together)
+    as they are produced:
+
+        build = image.abuild(['--tag', 'app', '.'])
+        async for line in build:
+            print(line)
+        result = await build.wait()
+
+    When used as an async context manager, the build is killed
+    on exit if it's still running.
+
+    Args:
+        cmd: the docker CLI command to run.
+        dockerfile: the Dockerfile content to pass into the command stdin.
+        name: the name to use in the result.
+        timeout: how many seconds the build may take before it's killed.
+    """
+    __slots__ = (
+        'cmd', 'dockerfile', 'name', 'timeout',
+        '_proc', '_lines', '_start', '_timed_out',
+    )
+
+    def __init__(
+        self,
+        cmd: list[str],
+        dockerfile: bytes,
+        *,
+        name: str,
+        timeout: float | None = None,
+    ) -> None:
+        self.cmd = cmd
+        self.dockerfile = dockerfile
+        self.name = name
+        self.timeout = timeout
+        self._proc: Process | None = None
+        self._lines = self._iter_lines()
+        self._start = 0.
+        self._timed_out = False
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._lines
+
+    async def __aenter__(self) -> AsyncBuild:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.kill()
+        await self._lines.aclose()
+        if self._proc is not None:
+            await self._proc.wait()
+
+    async def wait(self) -> BuildResult:
+        """Wait for the build to finish, skipping the log lines that weren't read yet.
+        """
+        async for _ in self._lines:
+            pass
+        returncode = 127
+        if self._proc is not None:
+            returncode = await self._proc.wait()
+        return BuildResult(
+            name=self.name,
+            returncode=returncode,
+            duration=perf_counter() - self._start,
+            timed_out=self._timed_out,
+        )
+
+    def kill(self) -> None:
+        """Kill the build with all processes it started.
+        """
+        proc = self._proc
+        if proc is None or proc.returncode is not None:
+            return
+        try:
+            if hasattr(os, 'killpg'):
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except ProcessLookupError:
+            pass
+
+    def _on_timeout(self) -> None:
+        self._timed_out = True
+        self.kill()
+
+    async def _iter_lines(self) -> AsyncGenerator[str, None]:
+        self._start = perf_counter()
+        loop = asyncio.get_running_loop()
+        deadline = None if self.timeout is None else loop.time() + self.timeout
+        try:
+            # a new session, so that killing the group also kills the builder
+            # processes that docker CLI started
+            self._proc = await asyncio.create_subprocess_exec(
+                *self.cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                start_new_session=True,
+                limit=LINE_LIMIT,
+            )
+        except OSError as exc:
+            # the binary is not found or not executable
+            yield str(exc)
+            return
+        proc = self._proc
+        assert proc.stdin is not None
+        assert proc.stdout is not None
+        try:
+            proc.stdin.write(self.dockerfile)
+            try:
+                # the process may never read the Dockerfile, so the deadline covers it too
+                timeout = None if deadline is None else deadline - loop.time()
+                await asyncio.wait_for(proc.stdin.drain(), timeout)
+            except (BrokenPipeError, ConnectionResetError):
+                # the process exited without reading the Dockerfile
+                pass
+            except asyncio.TimeoutError:
+                self._on_timeout()
+                return
+            proc.stdin.close()
+            while True:
+                timeout = None if deadline is None else deadline - loop.time()
+                try:
+                    line = await asyncio.wait_for(proc.stdout.readline(), timeout)
+                except asyncio.TimeoutError:
+                    self._on_timeout()
+                    return
+                if not line:
+                    return
+                yield line.decode('utf8', errors='replace').rstrip('\n')
+        except asyncio.CancelledError:
+            self.kill()
+            # reap the killed process, so it doesn't outlive the event loop
+            await proc.wait()
+            raise
+        except BaseException:
+            # the iteration was stopped
+            self.kill()
+            raise
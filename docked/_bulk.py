@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import sys
+import traceback
+from collections import deque
+from dataclasses import dataclass
+from hashlib import sha256
+from importlib.util import module_from_spec, spec_from_file_location
+from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+
+if TYPE_CHECKING:
+    from multiprocessing.connection import Connection
+    from types import FrameType
+
+    from ._image import Image
+
+
+# How long to wait for a worker to report back after the module timeout,
+# before killing it. The timeout inside of the worker can't interrupt C code.
+GRACE_PERIOD = 5.0
+
+
+@dataclass(frozen=True)
+class RenderResult:
+    """The result of rendering a single image module.
+    """
+    module: Path
+    dockerfile: Path
+    duration: float
+    error: str | None = None
+    digest: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def as_dict(self) -> dict[str, object]:
+        return {
+            'module': str(self.module),
+            'dockerfile': self.dockerfile.name if self.ok else None,
+            'duration': round(self.duration, 6),
+            'error': self.error,
+            'sha256': self.digest,
+        }
+
+    def __str__(self) -> str:
+        status = 'ok' if self.ok else 'FAIL'
+        result = f'{status:4} {self.duration:8.3f}s  {self.module}'
+        if self.error:
+            result += f'\n     {self.error.strip().splitlines()[-1]}'
+        return result
+
+
+def load_image(path: Path) -> Image:
+    """Import a Python module by its path and get the Image it defines.
+
+    The module must have either ``image`` attribute or ``get_image`` function.
+    """
+    name = f'_docked_module_{sha256(str(path).encode()).hexdigest()[:16]}'
+    spec = spec_from_file_location(name, path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f'cannot import {path}')
+    module = module_from_spec(spec)
+    sys.path.insert(0, str(path.parent))
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(str(path.parent))
+    try:
+        return module.image
+    except AttributeError:
+        return module.get_image()
+
+
+def _on_alarm(signum: int, frame: FrameType | None) -> None:
+    raise TimeoutError('the module took too long to render')
+
+
+def _render_module(
+    module: Path,
+    dockerfile: Path,
+    timeout: float,
+) -> RenderResult:
+    """Render a single module. Runs inside of a worker process.
+    """
+    start = perf_counter()
+    can_alarm = hasattr(signal, 'setitimer')
+    if can_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        content = load_image(module).as_str() + '\n'
+        dockerfile.write_text(content, encoding='utf8')
+    except BaseException:
+        return RenderResult(
+            module=module,
+            dockerfile=dockerfile,
+            duration=perf_counter() - start,
+            error=traceback.format_exc(),
+        )
+    finally:
+        if can_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return RenderResult(
+        module=module,
+        dockerfile=dockerfile,
+        duration=perf_counter() - start,
+        digest=sha256(content.encode()).hexdigest(),
+    )
+
+
+def _render_in_worker(
+    conn: Connection,
+    module: Path,
+    dockerfile: Path,
+    timeout: float,
+) -> None:
+    with conn:
+        conn.send(_render_module(module, dockerfile, timeout))
+
+
+def _dockerfile_names(modules: list[Path]) -> Iterator[str]:
+    """Generate unique Dockerfile names based on the module paths.
+    """
+    resolved = [module.resolve() for module in modules]
+    parents = [p.parent.parts for p in resolved]
+    common = 0
+    for parts in zip(*parents):
+        if len(set(parts)) != 1:
+            break
+        common += 1
+    for path in resolved:
+        parts = path.with_suffix('').parts[common:]
+        yield '.'.join(parts) + '.Dockerfile'
+
+
+def render_modules(
+    modules: Iterable[Path],
+    output: Path,
+    *,
+    jobs: int | None = None,
+    timeout: float = 60,
+) -> list[RenderResult]:
+    """Render Dockerfiles for the given Python modules in a pool of processes.
+
+    Every Dockerfile is written into the ``output`` directory, together with
+    ``manifest.json`` describing the results. A module that fails or takes
+    longer than ``timeout`` seconds is reported as failed without stopping the rest.
+    Each module is rendered in its own process, which is killed if it doesn't
+    report back in time, counting from the moment the module started.
+
+    Args:
+        modules: paths to Python modules defining ``image`` or ``get_image``.
+        output: the directory where to write Dockerfiles and the manifest.
+        jobs: how many processes to run. Default: number of CPUs.
+        timeout: how many seconds a single module may take.
+    """
+    modules = list(modules)
+    output.mkdir(parents=True, exist_ok=True)
+    dockerfiles = [output / name for name in _dockerfile_names(modules)]
+    jobs = jobs or os.cpu_count() or 1
+    queue = deque(enumerate(zip(modules, dockerfiles)))
+    results: dict[int, RenderResult] = {}
+    running: dict[int, tuple[multiprocessing.Process, Connection, float]] = {}
+    try:
+        while queue or running:
+            while queue and len(running) < jobs:
+                index, (module, dockerfile) = queue.popleft()
+                reader, writer = multiprocessing.Pipe(duplex=False)
+                proc = multiprocessing.Process(
+                    target=_render_in_worker,
+                    args=(writer, module, dockerfile, timeout),
+                    daemon=True,
+                )
+                proc.start()
+                writer.close()
+                running[index] = (proc, reader, perf_counter())
+            deadline = min(start for _, _, start in running.values()) + timeout + GRACE_PERIOD
+            ready = multiprocessing.connection.wait(
+                [reader for _, reader, _ in running.values()],
+                timeout=max(0., deadline - perf_counter()),
+            )
+            for index, (proc, reader, start) in list(running.items()):
+                module, dockerfile = modules[index], dockerfiles[index]
+                if reader in ready:
+                    try:
+                        result = reader.recv()
+                    except EOFError:
+                        proc.join()
+                        result = RenderResult(
+                            module=module,
+                            dockerfile=dockerfile,
+                            duration=perf_counter() - start,
+                            error=f'RuntimeError: the worker exited with code {proc.exitcode}',
+                        )
+                elif perf_counter() - start >= timeout + GRACE_PERIOD:
+                    proc.kill()
+                    result = RenderResult(
+                        module=module,
+                        dockerfile=dockerfile,
+                        duration=perf_counter() - start,
+                        error='TimeoutError: the worker did not respond',
+                    )
+                else:
+                    continue
+                proc.join()
+                reader.close()
+                del running[index]
+                results[index] = result
+    finally:
+        # kill workers that are still stuck on something
+        for proc, reader, _ in running.values():
+            proc.kill()
+            proc.join()
+            reader.close()
+
+    ordered = [results[index] for index in range(len(modules))]
+    manifest = [result.as_dict() for result in ordered]
+    with (output / 'manifest.json').open('w', encoding='utf8') as stream:
+        json.dump(manifest, stream, indent=2)
+    return ordered
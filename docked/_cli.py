@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import sys
+from argparse import ArgumentParser, Namespace
+from glob import glob
+from pathlib import Path
+from time import perf_counter
+from typing import TextIO
+
+
+def entrypoint(argv: list[str] | None = None, stdout: TextIO = sys.stdout) -> int:
+    """The entry point for the ``docked`` command-line tool.
+
+    Returns the exit code.
+    """
+    parser = ArgumentParser(prog='docked')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    render = subparsers.add_parser(
+        'render',
+        help='render Dockerfiles for many image modules in parallel',
+    )
+    render.add_argument(
+        'modules', nargs='+',
+        help='paths or glob patterns of Python modules defining `image` or `get_image`',
+    )
+    render.add_argument(
+        '-o', '--output', type=Path, default=Path('dockerfiles'),
+        help='directory where to write the Dockerfiles and manifest.json',
+    )
+    render.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: number of CPUs)',
+    )
+    render.add_argument(
+        '--timeout', type=float, default=60,
+        help='how many seconds a single module may take to render',
+    )
+    render.set_defaults(func=_render)
+
+    context = subparsers.add_parser(
+        'context',
+        help='report how much of the build context each COPY uses',
+    )
+    context.add_argument(
+        'module', type=Path,
+        help='path to Python module defining `image` or `get_image`',
+    )
+    context.add_argument(
+        '-p', '--path', type=Path, default=Path('.'),
+        help='the build context directory',
+    )
+    context.add_argument(
+        '-t', '--target', default=None,
+        help='analyze only the stages required for this stage',
+    )
+    context.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help='number of threads for walking the directory',
+    )
+    context.add_argument(
+        '--top', type=int, default=5,
+        help='how many of the largest files to show for each step',
+    )
+    context.add_argument(
+        '--budget', default=None,
+        help='fail if a step uses more than this size, like 100M',
+    )
+    context.add_argument(
+        '--json', action='store_true',
+        help='print the report as JSON',
+    )
+    context.set_defaults(func=_context)
+
+    args = parser.parse_args(argv)
+    return args.func(args, stdout)
+
+
+def _render(args: Namespace, stdout: TextIO) -> int:
+    from ._bulk import render_modules
+
+    modules: list[Path] = []
+    for pattern in args.modules:
+        paths = sorted(glob(pattern, recursive=True)) or [pattern]
+        modules.extend(Path(path) for path in paths)
+    start = perf_counter()
+    results = render_modules(
+        modules,
+        args.output,
+        jobs=args.jobs,
+        timeout=args.timeout,
+    )
+    total = perf_counter() - start
+    failed = 0
+    for result in results:
+        print(result, file=stdout)
+        if not result.ok:
+            failed += 1
+    rendered = len(results) - failed
+    print(f'rendered {rendered}/{len(results)} modules in {total:.3f}s', file=stdout)
+    return min(failed, 100)
+
+
+def _context(args: Namespace, stdout: TextIO) -> int:
+    from ._bulk import load_image
+    from ._context import format_size, parse_size
+
+    image = load_image(args.module)
+    report = image.analyze_context(
+        args.path,
+        args.target,
+        jobs=args.jobs,
+        top=args.top,
+    )
+    if args.json:
+        print(report.as_json(), file=stdout)
+    else:
+        print(report, file=stdout)
+    if args.budget is None:
+        return 0
+    budget = parse_size(args.budget)
+    over = report.over_budget(budget)
+    if not args.json:
+        for usage in over:
+            size = format_size(usage.size)
+            print(f'over budget ({size} > {format_size(budget)}): {usage.title}', file=stdout)
+    return min(len(over), 100)
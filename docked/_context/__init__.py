@@ -0,0 +1,37 @@
+from ._analyze import (
+    ContextReport, StepUsage, analyze, format_size, parse_size, walk,
+)
+from ._builds import BuildHistory, BuildOptions, parse_build_args
+from ._index import HashIndex, hash_file
+from ._keys import CachePrediction, StageKeys, fingerprint, predict_cache
+from ._sources import (
+    Source, iter_dockerignore, iter_sources, matches, normalize,
+)
+from ._tar import DOCKERFILE, context_paths, write_context
+
+
+__all__ = [
+    'analyze',
+    'BuildHistory',
+    'BuildOptions',
+    'context_paths',
+    'DOCKERFILE',
+    'CachePrediction',
+    'ContextReport',
+    'fingerprint',
+    'format_size',
+    'hash_file',
+    'HashIndex',
+    'iter_dockerignore',
+    'iter_sources',
+    'matches',
+    'normalize',
+    'parse_build_args',
+    'parse_size',
+    'predict_cache',
+    'Source',
+    'StageKeys',
+    'StepUsage',
+    'walk',
+    'write_context',
+]
@@ -0,0 +1,240 @@
+"""Find out how much of the build context each step uses.
+
+The build context is sent into the builder before the build starts,
+so big contexts make every build slow, even when everything is cached.
+The analyzer resolves the context sources of each step against a local directory
+and reports how many files and bytes the step needs.
+
+Symlinks are not followed, the same as when Docker sends the context.
+The root ``.dockerignore`` is not applied.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+from bisect import bisect_left
+from concurrent.futures import (
+    FIRST_COMPLETED, Future, ThreadPoolExecutor, wait,
+)
+from dataclasses import dataclass
+from heapq import nlargest
+from pathlib import Path
+from stat import S_ISDIR
+from typing import TYPE_CHECKING, Any, Iterable, Iterator
+
+from ._sources import iter_sources, matches
+
+
+if TYPE_CHECKING:
+    from .._image import Image
+    from .._stage import Stage
+    from .._steps import Step
+
+
+GLOB_CHARS = re.compile(r'[*?\[]')
+SIZE = re.compile(r'(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?', re.IGNORECASE)
+UNITS = ('B', 'KiB', 'MiB', 'GiB', 'TiB')
+
+
+@dataclass(frozen=True)
+class StepUsage:
+    """Files of the build context used by a single step.
+
+    ``largest`` are paths and sizes of the biggest files, largest first.
+    """
+    stage: Stage
+    step: Step
+    files: int
+    size: int
+    largest: tuple[tuple[str, int], ...]
+
+    @property
+    def title(self) -> str:
+        """The first line of the step instruction.
+        """
+        return str(self.step).splitlines()[0]
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'stage': self.stage.name,
+            'step': self.title,
+            'files': self.files,
+            'size': self.size,
+            'largest': [{'path': path, 'size': size} for path, size in self.largest],
+        }
+
+
+@dataclass(frozen=True)
+class ContextReport:
+    """The build context usage by all steps of an image.
+
+    ``files`` and ``size`` are for the whole directory, including the files
+    that no step uses but that are still sent into the builder.
+    """
+    steps: tuple[StepUsage, ...]
+    files: int
+    size: int
+
+    def over_budget(self, budget: int) -> tuple[StepUsage, ...]:
+        """Steps that use more than ``budget`` bytes of the build context.
+        """
+        return tuple(usage for usage in self.steps if usage.size > budget)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'files': self.files,
+            'size': self.size,
+            'steps': [usage.as_dict() for usage in self.steps],
+        }
+
+    def as_json(self) -> str:
+        return json.dumps(self.as_dict(), indent=2)
+
+    def __str__(self) -> str:
+        lines = [f'{"SIZE":>10} {"FILES":>7}  {"STAGE":12} STEP']
+        for usage in self.steps:
+            size = format_size(usage.size)
+            lines.append(f'{size:>10} {usage.files:>7}  {usage.stage.name:12} {usage.title}')
+            for path, file_size in usage.largest:
+                lines.append(f'{format_size(file_size):>10} {"":>7}  {"":12}   {path}')
+        lines.append(f'{format_size(self.size):>10} {self.files:>7}  {"":12} total')
+        return '\n'.join(lines)
+
+
+def analyze(
+    image: Image,
+    path: Path | str = '.',
+    *,
+    jobs: int | None = None,
+    top: int = 5,
+) -> ContextReport:
+    """Resolve the build context sources of all steps against the given directory.
+
+    Args:
+        image: the image which steps to analyze.
+        path: the build context directory.
+        jobs: how many threads to use for walking the directory.
+        top: how many of the largest files to report for each step.
+    """
+    sizes = walk(Path(path), jobs=jobs)
+    steps = []
+    for stage, step, used in resolve_sources(image, sorted(sizes)):
+        steps.append(StepUsage(
+            stage=stage,
+            step=step,
+            files=len(used),
+            size=sum(sizes[name] for name in used),
+            largest=tuple(
+                (name, sizes[name])
+                for name in nlargest(top, used, key=lambda name: (sizes[name], name))
+            ),
+        ))
+    return ContextReport(
+        steps=tuple(steps),
+        files=len(sizes),
+        size=sum(sizes.values()),
+    )
+
+
+def resolve_sources(image: Image, paths: list[str]) -> Iterator[tuple[Stage, Step, list[str]]]:
+    """Find which of the sorted paths each step uses from the build context.
+
+    Steps that don't use the build context are not included.
+    """
+    grouped: dict[tuple[int, int], tuple[Stage, Step, set[int]]] = {}
+    for source in iter_sources(image):
+        key = (id(source.stage), id(source.step))
+        if key not in grouped:
+            grouped[key] = (source.stage, source.step, set())
+        grouped[key][2].update(_resolve(paths, source.path))
+    for stage, step, indices in grouped.values():
+        yield stage, step, [paths[i] for i in sorted(indices)]
+
+
+def walk(root: Path, *, jobs: int | None = None, paths: Iterable[str] | None = None) -> dict[str, int]:
+    """Find all files in the directory tree and their sizes.
+
+    Directories are scanned in parallel. The returned paths are relative
+    to the root and use forward slashes. If ``paths`` are specified,
+    only these files and directories of the tree are scanned.
+    """
+    sizes: dict[str, int] = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending: set[Future[list[str]]] = set()
+        for path in [''] if paths is None else paths:
+            if path:
+                stat = os.lstat(root / path)
+                if not S_ISDIR(stat.st_mode):
+                    sizes[path] = stat.st_size
+                    continue
+            pending.add(executor.submit(_scan, root, path, sizes))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for subdir in future.result():
+                    pending.add(executor.submit(_scan, root, subdir, sizes))
+    return sizes
+
+
+def _scan(root: Path, prefix: str, sizes: dict[str, int]) -> list[str]:
+    """Record sizes of the files in the directory and return its subdirectories.
+    """
+    subdirs = []
+    with os.scandir(root / prefix) as entries:
+        for entry in entries:
+            name = f'{prefix}/{entry.name}' if prefix else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(name)
+            else:
+                sizes[name] = entry.stat(follow_symlinks=False).st_size
+    return subdirs
+
+
+def _resolve(paths: list[str], pattern: str) -> range | list[int]:
+    """Indices of the sorted paths that the source pattern matches.
+    """
+    if not pattern:
+        return range(len(paths))
+    if '$' in pattern:
+        # the value is known only during the build
+        return []
+    if GLOB_CHARS.search(pattern):
+        return [i for i, path in enumerate(paths) if matches(path, pattern)]
+    # the pattern is a file or a directory, all matches are next to each other
+    result: list[int] = []
+    i = bisect_left(paths, pattern)
+    if i < len(paths) and paths[i] == pattern:
+        result.append(i)
+        i += 1
+    prefix = pattern + '/'
+    i = max(i, bisect_left(paths, prefix))
+    while i < len(paths) and paths[i].startswith(prefix):
+        result.append(i)
+        i += 1
+    return result
+
+
+def format_size(size: float) -> str:
+    """Human-readable size, like ``1.5 MiB``.
+    """
+    for unit in UNITS[:-1]:
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = UNITS[-1]
+    if unit == 'B':
+        return f'{size:.0f} B'
+    return f'{size:.1f} {unit}'
+
+
+def parse_size(text: str) -> int:
+    """Parse size in bytes, like ``512``, ``100K``, or ``1.5GiB``.
+    """
+    match = SIZE.fullmatch(text.strip())
+    if match is None:
+        raise ValueError(f'invalid size: {text!r}')
+    number, unit = match.groups()
+    power = ' KMGT'.index(unit.upper() or ' ')
+    return int(float(number) * 1024 ** power)
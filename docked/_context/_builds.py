@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import NamedTuple
+
+
+# Options of `docker buildx build` that don't take a value.
+FLAGS = frozenset({
+    '--load', '--push', '--no-cache', '--pull', '--check', '--quiet', '-q',
+    '--rm', '--force-rm', '--squash', '--compress', '--debug', '-D',
+})
+# Short aliases of the options, to normalize them.
+ALIASES = {'-t': '--tag', '-o': '--output', '-q': '--quiet', '-D': '--debug'}
+# Options that don't affect what is built or where it goes.
+OUTPUT_ONLY = frozenset({'--progress', '--quiet', '--debug'})
+
+
+class BuildOptions(NamedTuple):
+    """Options of ``docker buildx build`` that affect what is built.
+    """
+    tags: tuple[str, ...]
+    build_args: dict[str, str]
+    # None if the context is not a local directory (stdin, URL, git repo)
+    context: Path | None
+    # all other options, normalized to `--name=value` and sorted
+    options: tuple[str, ...] = ()
+
+
+class BuildHistory:
+    """Fingerprints of the last successful build of each tag.
+
+    Args:
+        path: the directory where to keep the history and the file hash index.
+    """
+    __slots__ = ('path', '_builds')
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._builds: dict[str, str] = {}
+        builds_path = path / 'builds.json'
+        if builds_path.exists():
+            self._builds = json.loads(builds_path.read_text(encoding='utf8'))
+
+    @property
+    def index_path(self) -> Path:
+        return self.path / 'index.json'
+
+    def unchanged(self, tags: tuple[str, ...], fingerprint: str) -> bool:
+        """Check if all the tags were successfully built with the same fingerprint.
+        """
+        return all(self._builds.get(tag) == fingerprint for tag in tags or ('',))
+
+    def record(self, tags: tuple[str, ...], fingerprint: str) -> None:
+        """Remember the fingerprint of a successful build and save it on the disk.
+        """
+        for tag in tags or ('',):
+            self._builds[tag] = fingerprint
+        self.path.mkdir(parents=True, exist_ok=True)
+        builds_path = self.path / 'builds.json'
+        tmp_path = builds_path.with_name(f'builds.json.{os.getpid()}.tmp')
+        tmp_path.write_text(json.dumps(self._builds, indent=2), encoding='utf8')
+        os.replace(tmp_path, builds_path)
+
+
+def parse_build_args(args: list[str]) -> BuildOptions:
+    """Extract tags, build args, the build context, and other options from the docker CLI arguments.
+    """
+    tags: list[str] = []
+    build_args: dict[str, str] = {}
+    options: list[str] = []
+    positional: list[str] = []
+    args_iter = iter(args)
+    for arg in args_iter:
+        if arg == '-' or not arg.startswith('-'):
+            positional.append(arg)
+            continue
+        name, sep, value = arg.partition('=')
+        if not sep and not name.startswith('--') and len(name) > 2:
+            # short option with the value attached, like `-tapp:latest`
+            name, sep, value = name[:2], '=', name[2:]
+        if not sep and name not in FLAGS:
+            sep, value = '=', next(args_iter, '')
+        name = ALIASES.get(name, name)
+        if name == '--tag':
+            tags.append(value)
+        elif name == '--build-arg':
+            key, eq, val = value.partition('=')
+            # without a value, docker takes it from the environment
+            build_args[key] = val if eq else os.environ.get(key, '')
+        elif name not in OUTPUT_ONLY:
+            options.append(f'{name}{sep}{value}')
+    context: Path | None = None
+    if len(positional) == 1:
+        path = Path(positional[0])
+        if positional[0] != '-' and '://' not in positional[0] and path.is_dir():
+            context = path
+    return BuildOptions(tuple(tags), build_args, context, tuple(sorted(options)))
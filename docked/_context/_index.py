@@ -0,0 +1,81 @@
+"""Persistent index of file content hashes.
+
+Hashing a big build context on every build is slow. The index remembers
+the hash of each file together with its size, modification time, and inode,
+so the next time only the files that changed are read, the rest are only stat-ed.
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import time
+from hashlib import sha256
+from pathlib import Path
+
+
+CHUNK_SIZE = 1024 * 1024
+# Files bigger than that are hashed using mmap instead of reading in chunks.
+MMAP_THRESHOLD = 4 * 1024 * 1024
+# A file modified within that many seconds before hashing can be modified
+# again without changing mtime, so its hash isn't remembered.
+RACY_PERIOD = 2.0
+
+
+class HashIndex:
+    """sha256 hashes of files, stored in a JSON file between runs.
+
+    Args:
+        path: the file where to store the index. Created on save if doesn't exist.
+    """
+    __slots__ = ('path', '_entries', '_dirty')
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._entries: dict[str, list] = {}
+        self._dirty = False
+        if path.exists():
+            self._entries = json.loads(path.read_text(encoding='utf8'))['files']
+
+    def hash(self, path: Path) -> str:
+        """sha256 of the file content, taken from the index if the file didn't change.
+        """
+        name = os.path.abspath(path)
+        stat = os.stat(name)
+        key = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        entry = self._entries.get(name)
+        if entry is not None and entry[:3] == key:
+            return entry[3]
+        digest = hash_file(path)
+        if time.time_ns() - stat.st_mtime_ns > RACY_PERIOD * 1e9:
+            self._entries[name] = key + [digest]
+            self._dirty = True
+        return digest
+
+    def save(self) -> None:
+        """Write the index on the disk, if anything changed.
+        """
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        with tmp_path.open('w', encoding='utf8') as stream:
+            json.dump({'files': self._entries}, stream)
+        # atomic, so a concurrent build never reads a half-written index
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+
+def hash_file(path: Path) -> str:
+    """sha256 of the file content.
+    """
+    hasher = sha256()
+    with path.open('rb') as stream:
+        size = os.fstat(stream.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher.update(mapped)
+        else:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+    return hasher.hexdigest()
@@ -0,0 +1,212 @@
+"""Predict which steps will miss the build cache, without running the build.
+
+The keys imitate the BuildKit cache keys: the key of a step depends on the key
+of the previous step, the instruction itself, the content of the files
+it copies from the build context, the ARG values it can see,
+and the keys of the stages it copies files from.
+
+BuildKit knows more than that (for example, it checks if the base image
+was updated in the registry), so the prediction is a lower bound
+of what will be rebuilt.
+"""
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from hashlib import sha256
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable, Mapping
+
+from .._stage import Stage
+from .._steps import ARG, COPY, RUN
+from ._analyze import resolve_sources, walk
+from ._index import HashIndex, hash_file
+from ._tar import context_paths
+
+
+if TYPE_CHECKING:
+    from .._image import Image
+    from .._steps import Step
+
+
+VAR_REF = re.compile(r'\$\{?([A-Za-z_][A-Za-z0-9_]*)')
+
+
+@dataclass(frozen=True)
+class StageKeys:
+    """Predicted cache keys of all build steps of a single Stage.
+
+    ``first_miss`` is the index of the first step in ``stage.build`` which key
+    wasn't there in the last successful build. None if all steps are cached.
+    """
+    stage: Stage
+    keys: tuple[str, ...]
+    first_miss: int | None
+
+    @property
+    def step(self) -> Step | None:
+        """The first step that will be rebuilt.
+        """
+        if self.first_miss is None:
+            return None
+        return self.stage.build[self.first_miss]
+
+    def __str__(self) -> str:
+        if self.step is None:
+            return f'{self.stage.name}: cached'
+        title = str(self.step).splitlines()[0]
+        return f'{self.stage.name}: rebuilds from step {self.first_miss}: {title}'
+
+
+@dataclass(frozen=True)
+class CachePrediction:
+    """Predicted cache keys of all stages of an Image.
+    """
+    stages: tuple[StageKeys, ...]
+
+    @property
+    def cached(self) -> bool:
+        """True if no step is expected to be rebuilt.
+        """
+        return all(stage.first_miss is None for stage in self.stages)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {'stages': {s.stage.name: list(s.keys) for s in self.stages}}
+
+    def save(self, path: Path) -> None:
+        """Remember the keys as the keys of the last successful build.
+        """
+        with path.open('w', encoding='utf8') as stream:
+            json.dump(self.as_dict(), stream, indent=2)
+
+    def __str__(self) -> str:
+        return '\n'.join(str(stage) for stage in self.stages)
+
+
+def predict_cache(
+    image: Image,
+    path: Path | str = '.',
+    *,
+    state: Path | None = None,
+    build_args: Mapping[str, str] | None = None,
+    jobs: int | None = None,
+    index: HashIndex | None = None,
+) -> CachePrediction:
+    """Calculate cache keys for all steps and compare them with the last successful build.
+
+    Args:
+        image: the image to predict the cache for.
+        path: the build context directory.
+        state: the file with keys of the last successful build,
+            saved by ``CachePrediction.save``. If not specified or doesn't exist,
+            all steps are predicted to be rebuilt.
+        build_args: values for ARG instructions.
+        jobs: how many threads to use for walking the build context.
+        index: persistent index of file hashes. If not specified,
+            all used files of the build context are read.
+    """
+    root = Path(path)
+    # scan only the parts of the context the image uses
+    sizes = walk(root, jobs=jobs, paths=context_paths(image, root))
+    files = {
+        (id(stage), id(step)): used
+        for stage, step, used in resolve_sources(image, sorted(sizes))
+    }
+    previous: dict[str, list[str]] = {}
+    if state is not None and state.exists():
+        previous = json.loads(state.read_text(encoding='utf8'))['stages']
+
+    hashes: dict[str, str] = {}
+    memo: dict[Stage, tuple[str, ...]] = {}
+
+    def file_hash(name: str) -> str:
+        if name not in hashes:
+            hasher = hash_file if index is None else index.hash
+            hashes[name] = hasher(root / name)
+        return hashes[name]
+
+    def last_key(stage: Stage) -> str:
+        """The key of the stage result: its last step or, if none, its base.
+        """
+        keys = stage_keys(stage)
+        if keys:
+            return keys[-1]
+        if isinstance(stage.base, Stage):
+            return last_key(stage.base)
+        return _hash('FROM', str(stage.base), stage.platform or '')
+
+    def stage_keys(stage: Stage) -> tuple[str, ...]:
+        if stage in memo:
+            return memo[stage]
+        base = stage.base
+        if isinstance(base, Stage):
+            key = last_key(base)
+        else:
+            key = _hash('FROM', str(base), stage.platform or '')
+        args: dict[str, str] = {}
+        keys = []
+        for step in stage.build:
+            text = str(step)
+            if isinstance(step, ARG):
+                args[step.name] = (build_args or {}).get(step.name, step.default or '')
+            # RUN sees all args as env vars, other steps only the ones they expand
+            names = args if isinstance(step, RUN) else VAR_REF.findall(text)
+            parts = [key, text]
+            parts.extend(f'{name}={args[name]}' for name in sorted(set(names)) if name in args)
+            for name in files.get((id(stage), id(step)), ()):
+                parts.append(f'{name}:{file_hash(name)}')
+            for dep in _step_stages(step):
+                parts.append(last_key(dep))
+            key = _hash(*parts)
+            keys.append(key)
+        memo[stage] = tuple(keys)
+        return memo[stage]
+
+    result = []
+    for stage in image.toposort():
+        keys = stage_keys(stage)
+        old = previous.get(stage.name, [])
+        first_miss = None
+        for i, key in enumerate(keys):
+            if i >= len(old) or old[i] != key:
+                first_miss = i
+                break
+        result.append(StageKeys(stage=stage, keys=keys, first_miss=first_miss))
+    return CachePrediction(stages=tuple(result))
+
+
+def fingerprint(
+    image: Image,
+    path: Path | str = '.',
+    *,
+    build_args: Mapping[str, str] | None = None,
+    index: HashIndex | None = None,
+    options: Iterable[str] = (),
+) -> str:
+    """Hash of the rendered Dockerfile and everything its build steps depend on.
+
+    If the fingerprint didn't change since the last build,
+    building the image again will produce the same result.
+    The ``options`` are other docker CLI options that affect the result
+    (like ``--platform`` or ``--output``), see ``BuildOptions.options``.
+    """
+    prediction = predict_cache(image, path, build_args=build_args, index=index)
+    keys = [stage.keys[-1] for stage in prediction.stages if stage.keys]
+    return _hash(image.as_str(), *keys, '', *options)
+
+
+def _hash(*parts: str) -> str:
+    return sha256('\0'.join(parts).encode()).hexdigest()
+
+
+def _step_stages(step: Step) -> list[Stage]:
+    """Stages the step copies files from.
+    """
+    if isinstance(step, COPY):
+        from_stages = [step.from_stage]
+    elif isinstance(step, RUN):
+        from_stages = [getattr(m, 'from_stage', None) for m in step.mounts]
+    else:
+        return []
+    return [s for s in from_stages if isinstance(s, Stage)]
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from fnmatch import fnmatchcase
+from typing import TYPE_CHECKING, Iterator, NamedTuple
+
+from .._steps import COPY, EXTRACT, RUN
+from .._types import BindMount
+
+
+if TYPE_CHECKING:
+    from .._image import Image
+    from .._stage import Stage
+    from .._steps import Step
+
+
+class Source(NamedTuple):
+    """A path in the build context used by a step.
+
+    The path is relative to the context root. Empty path means the whole context.
+    """
+    stage: Stage
+    step: Step
+    path: str
+
+
+def iter_sources(image: Image) -> Iterator[Source]:
+    """Iterate over all paths in the build context used by the image.
+
+    Includes sources of COPY and EXTRACT and bind mounts of RUN,
+    except the ones that refer to another stage or image.
+    """
+    for stage in image.stages:
+        for step in stage.build:
+            if isinstance(step, (COPY, EXTRACT)):
+                if getattr(step, 'from_stage', None) is not None:
+                    continue
+                for src in step._sources:
+                    yield Source(stage, step, normalize(src))
+            elif isinstance(step, RUN):
+                for mount in step.mounts:
+                    if not isinstance(mount, BindMount) or mount.from_stage is not None:
+                        continue
+                    yield Source(stage, step, normalize(str(mount.source or '')))
+
+
+def normalize(path: str) -> str:
+    """Make the path relative to the context root.
+    """
+    while path.startswith('./'):
+        path = path[2:]
+    path = path.strip('/')
+    if path == '.':
+        return ''
+    return path
+
+
+def matches(path: str, pattern: str) -> bool:
+    """Check if the path is matched by the normalized source pattern or is inside of it.
+    """
+    if not pattern:
+        return True
+    depth = pattern.count('/') + 1
+    prefix = '/'.join(path.split('/')[:depth])
+    return fnmatchcase(prefix, pattern)
+
+
+def iter_dockerignore(image: Image) -> Iterator[str]:
+    """Generate lines of .dockerignore that excludes everything not used by the image.
+    """
+    paths: set[str] = set()
+    for source in iter_sources(image):
+        # The whole context is needed or the path is unknown before the build.
+        if not source.path or '$' in source.path:
+            return
+        paths.add(source.path)
+    yield '# generated by docked, includes only files used by the Dockerfile'
+    yield '*'
+    for path in sorted(paths):
+        yield f'!{path}'
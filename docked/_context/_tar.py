@@ -0,0 +1,81 @@
+"""Build the context tar in-process, with only the files the image uses.
+
+The tar is written into a stream (like the stdin of docker CLI)
+as it's being generated, without temporary files.
+"""
+from __future__ import annotations
+
+import tarfile
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import IO, TYPE_CHECKING
+
+from ._analyze import GLOB_CHARS
+from ._sources import iter_sources
+
+
+if TYPE_CHECKING:
+    from .._image import Image
+
+
+# The name of the Dockerfile inside of the tar.
+DOCKERFILE = '.docked.Dockerfile'
+# BuildKit uses the Dockerfile-specific .dockerignore instead of the one in the root.
+DOCKERIGNORE = f'{DOCKERFILE}.dockerignore'
+
+
+def context_paths(image: Image, root: Path) -> list[str] | None:
+    """Paths relative to the root that the image uses from the build context.
+
+    Nested paths are omitted if their parent is already included.
+    Returns None if the whole context is needed.
+    """
+    paths: set[str] = set()
+    for source in iter_sources(image):
+        # The whole context is needed or the path is unknown before the build.
+        if not source.path or '$' in source.path:
+            return None
+        if GLOB_CHARS.search(source.path):
+            paths.update(p.relative_to(root).as_posix() for p in root.glob(source.path))
+        elif (root / source.path).exists():
+            paths.add(source.path)
+    return [path for path in sorted(paths) if not _has_parent(path, paths)]
+
+
+def _has_parent(path: str, paths: set[str]) -> bool:
+    parts = path.split('/')
+    return any('/'.join(parts[:i]) in paths for i in range(1, len(parts)))
+
+
+def write_context(stream: IO[bytes], root: Path, image: Image) -> None:
+    """Write the build context tar with the Dockerfile and all files the image uses.
+
+    The Dockerfile is written into the root of the tar as ``.docked.Dockerfile``.
+    It's excluded from the context by ``.docked.Dockerfile.dockerignore``,
+    so that ``COPY . .`` doesn't copy it and the cache doesn't depend on it.
+    The patterns from ``.dockerignore`` of the root are kept in it.
+    """
+    paths = context_paths(image, root)
+    ignore = ''
+    if (root / '.dockerignore').is_file():
+        ignore = (root / '.dockerignore').read_text(encoding='utf8').rstrip('\n') + '\n'
+    ignore += f'{DOCKERFILE}\n{DOCKERIGNORE}\n'
+    with tarfile.open(fileobj=stream, mode='w|') as tar:
+        _add_file(tar, DOCKERFILE, image.as_str() + '\n')
+        _add_file(tar, DOCKERIGNORE, ignore)
+        if paths is None:
+            for path in sorted(root.iterdir()):
+                tar.add(path, arcname=path.name)
+            return
+        for name in paths:
+            tar.add(root / name, arcname=name)
+
+
+def _add_file(tar: tarfile.TarFile, name: str, text: str) -> None:
+    content = text.encode()
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    tar.addfile(info, BytesIO(content))
@@ -0,0 +1,331 @@
+"""Resolve tags of base images into digests using the registry HTTP API.
+
+https://distribution.github.io/distribution/spec/api/
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Mapping
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from . import _steps as steps
+from ._types import BaseImage, replace
+
+
+if TYPE_CHECKING:
+    from ._image import Image
+
+
+DOCKER_HUB = 'registry-1.docker.io'
+# Multi-platform indexes go first, so that the digest is the same for all platforms.
+MANIFEST_TYPES = (
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+)
+# How long a resolved digest is trusted, in seconds.
+DEFAULT_TTL = 24 * 60 * 60
+CHALLENGE_PARAM = re.compile(r'(\w+)="([^"]*)"')
+
+
+class DigestCache:
+    """Digests of image tags, stored in a JSON file between runs.
+
+    Tags can be moved to another image at any time, so a digest
+    is used only for ``ttl`` seconds after it was resolved.
+
+    Args:
+        path: the file where to store the cache. Created on save if doesn't exist.
+        ttl: for how many seconds a resolved digest is used.
+    """
+    __slots__ = ('path', 'ttl', '_entries', '_dirty', '_lock')
+
+    def __init__(self, path: Path, ttl: float = DEFAULT_TTL) -> None:
+        self.path = path
+        self.ttl = ttl
+        self._entries: dict[str, list] = {}
+        self._dirty = False
+        self._lock = Lock()
+        if path.exists():
+            self._entries = json.loads(path.read_text(encoding='utf8'))['digests']
+
+    def get(self, ref: str) -> str | None:
+        """The digest of the image reference, if it was resolved recently.
+        """
+        entry = self._entries.get(ref)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def set(self, ref: str, digest: str) -> None:
+        with self._lock:
+            self._entries[ref] = [digest, time.time()]
+            self._dirty = True
+
+    def save(self) -> None:
+        """Write the cache on the disk, if anything changed.
+
+        Expired entries are dropped.
+        """
+        if not self._dirty:
+            return
+        now = time.time()
+        entries = {ref: e for ref, e in self._entries.items() if now - e[1] <= self.ttl}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        with tmp_path.open('w', encoding='utf8') as stream:
+            json.dump({'digests': entries}, stream)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+
+class Resolver:
+    """Resolve image tags into digests, querying the registry concurrently.
+
+    Only anonymous access is supported, including the bearer token
+    that Docker Hub and most other registries require even for public images.
+    Registries on localhost are accessed using plain HTTP, the same as Docker does.
+
+    Args:
+        cache: where to keep the resolved digests between runs.
+        jobs: how many requests to send at the same time.
+        timeout: how many seconds a single request may take.
+    """
+    __slots__ = ('cache', 'jobs', 'timeout', '_tokens')
+
+    def __init__(
+        self,
+        cache: DigestCache | None = None,
+        *,
+        jobs: int = 8,
+        timeout: float = 30,
+    ) -> None:
+        assert jobs > 0
+        self.cache = cache
+        self.jobs = jobs
+        self.timeout = timeout
+        self._tokens: dict[str, str] = {}
+
+    def resolve(self, refs: Iterable[str]) -> dict[str, str]:
+        """Resolve each image reference (like ``python:3.11``) into a digest.
+
+        Raises LookupError if any of the references can't be resolved.
+        The digests of the other references are still saved in the cache.
+        """
+        result: dict[str, str] = {}
+        missing: list[str] = []
+        for ref in dict.fromkeys(refs):
+            digest = self.cache.get(ref) if self.cache is not None else None
+            if digest is None:
+                missing.append(ref)
+            else:
+                result[ref] = digest
+        errors: list[LookupError] = []
+        try:
+            if missing:
+                with ThreadPoolExecutor(max_workers=min(self.jobs, len(missing))) as executor:
+                    futures = [executor.submit(self._resolve, ref) for ref in missing]
+                for ref, future in zip(missing, futures):
+                    try:
+                        digest = future.result()
+                    except LookupError as exc:
+                        errors.append(exc)
+                        continue
+                    result[ref] = digest
+                    if self.cache is not None:
+                        self.cache.set(ref, digest)
+        finally:
+            if self.cache is not None:
+                self.cache.save()
+        if len(errors) == 1:
+            raise errors[0]
+        if errors:
+            raise LookupError('\n'.join(str(exc) for exc in errors))
+        return result
+
+    def _resolve(self, ref: str) -> str:
+        registry, repository, tag = split_reference(ref)
+        scheme = 'http' if _is_local(registry) else 'https'
+        url = f'{scheme}://{registry}/v2/{repository}/manifests/{tag}'
+        try:
+            return self._fetch_digest(url)
+        except (OSError, ValueError) as exc:
+            raise LookupError(f'cannot resolve {ref}: {exc}') from exc
+
+    def _fetch_digest(self, url: str) -> str:
+        headers = {'Accept': ', '.join(MANIFEST_TYPES)}
+        token = self._tokens.get(url)
+        if token is not None:
+            headers['Authorization'] = f'Bearer {token}'
+        request = Request(url, method='HEAD', headers=headers)
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                digest = response.headers.get('Docker-Content-Digest')
+        except HTTPError as exc:
+            challenge = exc.headers.get('WWW-Authenticate', '')
+            if exc.code != 401 or token is not None or not challenge.startswith('Bearer '):
+                raise
+            self._tokens[url] = self._fetch_token(challenge)
+            return self._fetch_digest(url)
+        if digest:
+            return digest
+        # the registry doesn't report the digest, calculate it from the manifest
+        with urlopen(Request(url, headers=headers), timeout=self.timeout) as response:
+            return f'sha256:{sha256(response.read()).hexdigest()}'
+
+    def _fetch_token(self, challenge: str) -> str:
+        params = dict(CHALLENGE_PARAM.findall(challenge))
+        realm = params.pop('realm', None)
+        if not realm:
+            raise ValueError(f'invalid auth challenge: {challenge}')
+        with urlopen(f'{realm}?{urlencode(params)}', timeout=self.timeout) as response:
+            content = json.load(response)
+        token = content.get('token') or content.get('access_token')
+        if not token:
+            raise ValueError('no token in the auth response')
+        return token
+
+
+def split_reference(ref: str) -> tuple[str, str, str]:
+    """Split the image reference into the registry, the repository, and the tag.
+
+    Images without a registry are taken from Docker Hub, the same as Docker does.
+    """
+    name, sep, tag = ref.rpartition(':')
+    if not sep or '/' in tag:
+        name, tag = ref, 'latest'
+    first, sep, rest = name.partition('/')
+    if sep and ('.' in first or ':' in first or first == 'localhost'):
+        return first, rest, tag
+    if not sep:
+        name = f'library/{name}'
+    return DOCKER_HUB, name, tag
+
+
+def iter_base_images(image: Image) -> Iterator[BaseImage]:
+    """All images the Image refers to: bases of stages, ``COPY --from``, and mounts.
+    """
+    for stage in image.stages:
+        if isinstance(stage.base, BaseImage):
+            yield stage.base
+        for step in stage.build:
+            if isinstance(step, steps.COPY):
+                if isinstance(step.from_stage, BaseImage):
+                    yield step.from_stage
+            elif isinstance(step, steps.RUN):
+                for mount in step.mounts:
+                    from_stage = getattr(mount, 'from_stage', None)
+                    if isinstance(from_stage, BaseImage):
+                        yield from_stage
+
+
+def image_ref(base: BaseImage) -> str | None:
+    """The reference to resolve for the image, or None if it's already pinned.
+    """
+    if base.digest or base.name == 'scratch' or '$' in base.name:
+        return None
+    return f'{base.name}:{base.tag or "latest"}'
+
+
+def pin_images(
+    images: Iterable[Image],
+    cache: Path | None = None,
+    *,
+    ttl: float = DEFAULT_TTL,
+    jobs: int = 8,
+) -> int:
+    """Resolve the tags of all images the given Images refer to and pin the digests.
+
+    Each tag is resolved only once, even if used by many images.
+    Returns how many references were pinned.
+    """
+    images = list(images)
+    refs = []
+    for image in images:
+        for base in iter_base_images(image):
+            ref = image_ref(base)
+            if ref is not None:
+                refs.append(ref)
+    if not refs:
+        return 0
+    resolver = Resolver(None if cache is None else DigestCache(cache, ttl), jobs=jobs)
+    digests = resolver.resolve(refs)
+    return sum(apply_digests(image, digests) for image in images)
+
+
+def apply_digests(image: Image, digests: Mapping[str, str]) -> int:
+    """Replace tags of the images the Image refers to with the given digests.
+
+    The tag is kept in the name for readability, like ``python:3.11@sha256:...``,
+    BuildKit uses only the digest. Returns how many references were pinned.
+    """
+    pinned: dict[BaseImage, BaseImage] = {}
+
+    def pin(base: BaseImage) -> BaseImage:
+        if base in pinned:
+            return pinned[base]
+        ref = image_ref(base)
+        digest = digests.get(ref) if ref is not None else None
+        if digest is None:
+            return base
+        new = pinned[base] = BaseImage(str(base), digest=digest)
+        return new
+
+    count = 0
+    for stage in image.stages:
+        if isinstance(stage.base, BaseImage):
+            base = pin(stage.base)
+            if base is not stage.base:
+                stage.base = base
+                count += 1
+        build = []
+        for step in stage.build:
+            new_step = _pin_step(step, pin)
+            if new_step is not step:
+                count += 1
+            build.append(new_step)
+        stage.build = build
+    return count
+
+
+def _pin_step(step: steps.BuildStep, pin: Callable[[BaseImage], BaseImage]) -> steps.BuildStep:
+    if isinstance(step, steps.COPY):
+        if isinstance(step.from_stage, BaseImage):
+            from_stage = pin(step.from_stage)
+            if from_stage is not step.from_stage:
+                return replace(step, from_stage=from_stage)
+        return step
+    if not isinstance(step, steps.RUN) or step.mount is None:
+        return step
+    mounts = []
+    for mount in step.mounts:
+        mount_from: object = getattr(mount, 'from_stage', None)
+        if isinstance(mount_from, BaseImage):
+            pinned = pin(mount_from)
+            if pinned is not mount_from:
+                mount = replace(mount, from_stage=pinned)
+        mounts.append(mount)
+    if all(new is old for new, old in zip(mounts, step.mounts)):
+        return step
+    return steps.RUN(
+        step.first, *step.rest,
+        mount=mounts,
+        network=step.network,
+        security=step.security,
+        shell=step.shell,
+    )
+
+
+def _is_local(registry: str) -> bool:
+    host = registry.rsplit(':', 1)[0]
+    return host in ('localhost', '127.0.0.1', '::1', '[::1]')
@@ -0,0 +1,542 @@
+from __future__ import annotations
+
+import json
+import re
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Iterable, Mapping, TextIO
+
+from ._image import Image
+from ._stage import Stage
+
+
+if TYPE_CHECKING:
+    from ._optimizers import SharedPrefixes
+    from ._steps import Step
+
+
+@dataclass(frozen=True)
+class BuildResult:
+    """The result of building a single image of a Fleet.
+
+    The ``error`` is set if the build couldn't be started,
+    for example, if the Dockerfile couldn't be generated or saved.
+    """
+    name: str
+    returncode: int
+    duration: float
+    timed_out: bool = False
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+    def __str__(self) -> str:
+        status = 'ok' if self.ok else f'FAIL({self.returncode})'
+        if self.timed_out:
+            status = 'TIMEOUT'
+        if self.error:
+            status = 'ERROR'
+        result = f'{status:8} {self.duration:8.3f}s  {self.name}'
+        if self.error:
+            result += f'\n         {self.error}'
+        return result
+
+
+class Target:
+    """An Image to build as a part of a Fleet, together with its build options.
+
+    Args:
+        image: the image to build.
+        tags: tags to assign to the built image.
+        context: path to the build context.
+        name: the name to use in reports. Default: the first tag.
+        platforms: platforms to build the image for.
+        build_args: values for ARG instructions.
+        target: the Stage (or its name) to build. Default: the last stage.
+        args: additional CLI arguments to pass into ``docker buildx build``.
+        log: where to write the build log (both stdout and stderr).
+            Can be a stream or a file path. Default: discard the log.
+        builder: the buildx builder instance to use. Default: the current one.
+    """
+    __slots__ = (
+        'image', 'tags', 'context', 'name', 'platforms', 'build_args', 'target',
+        'args', 'log', 'builder',
+    )
+
+    def __init__(
+        self,
+        image: Image,
+        *,
+        tags: Iterable[str] = (),
+        context: str | Path = '.',
+        name: str | None = None,
+        platforms: Iterable[str] = (),
+        build_args: Mapping[str, str] | None = None,
+        target: Stage | str | None = None,
+        args: Iterable[str] = (),
+        log: TextIO | Path | None = None,
+        builder: str | None = None,
+    ) -> None:
+        self.image = image
+        self.tags = list(tags)
+        self.context = context
+        self.name = name or next(iter(self.tags), None) or f'image-{id(image):x}'
+        self.platforms = list(platforms)
+        self.build_args = dict(build_args or {})
+        self.target = target
+        self.args = list(args)
+        self.log = log
+        self.builder = builder
+
+    @property
+    def stage(self) -> Stage:
+        """The Stage that produces the target image.
+        """
+        if self.target is None:
+            return self.image.stages[-1]
+        if isinstance(self.target, Stage):
+            return self.target
+        return self.image.get_stage(self.target)
+
+    def command(self, binary: str, dockerfile: Path | str) -> list[str]:
+        """The docker CLI command to build the target.
+
+        Pass ``-`` as the ``dockerfile`` to read the Dockerfile from stdin.
+        """
+        cmd = [binary, 'buildx', 'build', '-f', str(dockerfile)]
+        if self.builder is not None:
+            cmd.extend(('--builder', self.builder))
+        for tag in self.tags:
+            cmd.extend(('--tag', tag))
+        if self.platforms:
+            cmd.extend(('--platform', ','.join(self.platforms)))
+        for name, value in self.build_args.items():
+            cmd.extend(('--build-arg', f'{name}={value}'))
+        if self.target is not None:
+            target = self.target if isinstance(self.target, str) else self.target.name
+            cmd.extend(('--target', target))
+        cmd.extend(self.args)
+        cmd.append(str(self.context))
+        return cmd
+
+
+class Fleet:
+    """Many images built together, in parallel.
+
+    Unlike ``Image.build``, a failed build never calls ``sys.exit``,
+    the exit code of each build is reported in the results instead.
+
+    Args:
+        *targets: images to build, with their build options.
+        jobs: how many builds to run at the same time.
+        binary: docker binary to use. Must be either a path or in $PATH.
+    """
+    __slots__ = ('targets', 'jobs', 'binary')
+
+    def __init__(
+        self,
+        *targets: Target,
+        jobs: int = 4,
+        binary: str = 'docker',
+    ) -> None:
+        assert jobs > 0
+        self.targets = list(targets)
+        self.jobs = jobs
+        self.binary = binary
+
+    def add(self, image: Image, **kwargs) -> Target:
+        """Add an Image into the fleet.
+
+        Accepts the same keyword arguments as Target.
+        """
+        target = Target(image, **kwargs)
+        self.targets.append(target)
+        return target
+
+    def add_platforms(
+        self,
+        image: Image,
+        platforms: Iterable[str],
+        *,
+        builders: Mapping[str, str] | None = None,
+        **kwargs,
+    ) -> list[Target]:
+        """Add an Image to build for each platform separately.
+
+        Each platform becomes its own Target, so the platforms are built
+        in parallel and each gets its own BuildResult with the timing.
+        The platform is added to the name of each target and to its tags
+        (``app:1.0`` becomes ``app:1.0-linux-arm64``), so that the builds
+        don't overwrite each other's images.
+
+        Args:
+            image: the image to build.
+            platforms: platforms to build the image for, like ``linux/arm64``.
+            builders: the buildx builder to use for each platform,
+                for example, a native arm64 node instead of emulation.
+                The platforms not in the mapping use ``builder`` of Target.
+
+        Accepts the same keyword arguments as Target, except ``platforms``.
+        """
+        tags = list(kwargs.pop('tags', ()))
+        name = kwargs.pop('name', None) or next(iter(tags), None) or f'image-{id(image):x}'
+        builder = kwargs.pop('builder', None)
+        builders = builders or {}
+        targets = []
+        for platform in platforms:
+            target = Target(
+                image,
+                tags=[_platform_tag(tag, platform) for tag in tags],
+                name=f'{name} {platform}',
+                platforms=[platform],
+                builder=builders.get(platform, builder),
+                **kwargs,
+            )
+            self.targets.append(target)
+            targets.append(target)
+        return targets
+
+    def pin_digests(
+        self,
+        cache: Path | None = None,
+        *,
+        ttl: float = 24 * 60 * 60,
+        jobs: int = 8,
+    ) -> int:
+        """Replace tags of base images with digests in all images of the fleet.
+
+        Each tag is resolved only once, even if many images use it.
+        See ``Image.pin_digests``.
+        """
+        from ._digests import pin_images
+        return pin_images([target.image for target in self.targets], cache, ttl=ttl, jobs=jobs)
+
+    def intern(self) -> int:
+        """Replace equal steps in all images of the fleet with a single shared instance.
+
+        See ``Image.intern``. Returns how many steps were replaced.
+        """
+        from ._intern import intern_images
+        return intern_images(target.image for target in self.targets)
+
+    def share_prefixes(
+        self,
+        *,
+        min_users: int = 2,
+        durations: Mapping[Step, float] | None = None,
+    ) -> SharedPrefixes:
+        """Find steps that many images of the fleet start with.
+
+        See ``docked.find_shared_prefixes``. Call ``apply`` on the result to move
+        the shared steps into shared stages, which ``bake`` builds only once.
+        """
+        from ._optimizers import find_shared_prefixes
+        images = [target.image for target in self.targets]
+        return find_shared_prefixes(images, min_users=min_users, durations=durations)
+
+    def build(self) -> list[BuildResult]:
+        """Build all images, running at most ``jobs`` builds at the same time.
+
+        Returns the results in the same order as targets.
+        """
+        with TemporaryDirectory(prefix='docked-') as tmp_dir:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                futures = [
+                    executor.submit(self._build, target, Path(tmp_dir, f'{i}.Dockerfile'))
+                    for i, target in enumerate(self.targets)
+                ]
+                return [future.result() for future in futures]
+
+    async def abuild(self, timeout: float | None = None) -> list[BuildResult]:
+        """Build all images from asyncio, running at most ``jobs`` builds at the same time.
+
+        The log of each build is written into the target ``log`` line-by-line.
+        A build that takes longer than ``timeout`` seconds is killed.
+        If the task is cancelled, all running builds are killed.
+
+        Returns the results in the same order as targets.
+        """
+        import asyncio
+        semaphore = asyncio.Semaphore(self.jobs)
+
+        async def build(target: Target) -> BuildResult:
+            async with semaphore:
+                start = perf_counter()
+                try:
+                    return await _abuild(target, self.binary, timeout)
+                except Exception as exc:
+                    return _failed(target, exc, start)
+
+        return list(await asyncio.gather(*[build(t) for t in self.targets]))
+
+    def as_bake(self) -> dict[str, Any]:
+        """Generate the content of ``docker-bake.json`` for the fleet.
+
+        Each Target becomes a bake target with an inline Dockerfile.
+        Stages shared by multiple images (the same steps, with the same
+        stages they depend on) become separate bake targets, and the images
+        reference them as named contexts. So, BuildKit builds them only once.
+        A stage is shared only by the targets with the same build context,
+        platforms, and build arguments, since they affect what the stage produces.
+
+        https://docs.docker.com/build/bake/reference/
+        """
+        # find all stages used by more than one image
+        memo: dict[Stage, str] = {}
+        keys: list[dict[Stage, str]] = []
+        users: dict[str, set[int]] = {}
+        for i, target in enumerate(self.targets):
+            options = _build_options(target)
+            target_keys = {}
+            for stage in target.image.required_stages(target.stage):
+                fp = _stage_fingerprint(stage, memo)
+                key = target_keys[stage] = sha256(f'{fp}\n{options}'.encode()).hexdigest()
+                users.setdefault(key, set()).add(i)
+            keys.append(target_keys)
+
+        bake_targets: dict[str, dict[str, Any]] = {}
+        group: list[str] = []
+        for target, target_keys in zip(self.targets, keys):
+            output = target.stage
+            shared = {
+                stage: _bake_name(f'{stage.name}-{key[:12]}')
+                for stage, key in target_keys.items()
+                if len(users[key]) > 1
+            }
+            own: list[Stage] = []
+            for stage in target.image.required_stages(output):
+                shared_name = shared.get(stage)
+                if shared_name is None or stage is output:
+                    own.append(stage)
+                    continue
+                # build a shared stage only once, as its own bake target
+                if shared_name not in bake_targets:
+                    bake_targets[shared_name] = _bake_target(target, [stage], shared, stage.name)
+                    if target.build_args:
+                        bake_targets[shared_name]['args'] = target.build_args
+            name = _unique(_bake_name(target.name), bake_targets)
+            group.append(name)
+            bake_targets[name] = _bake_target(target, own, shared, output.name)
+            bake_targets[name].update(_target_options(target))
+        return {
+            'group': {'default': {'targets': group}},
+            'target': bake_targets,
+        }
+
+    def save_bake(self, path: Path) -> None:
+        """Save ``docker-bake.json`` for the fleet in the given file path.
+        """
+        with path.open('w', encoding='utf8') as stream:
+            json.dump(self.as_bake(), stream, indent=2)
+
+    def bake(
+        self,
+        args: list[str] | None = None,
+        stdout: TextIO = sys.stdout,
+        stderr: TextIO = sys.stderr,
+    ) -> int:
+        """Build all images in a single ``docker buildx bake`` call.
+
+        Unlike ``Fleet.build``, it runs all the builds in a single BuildKit session,
+        and so the work shared between images is done only once.
+        The concurrency is controlled by BuildKit, ``jobs`` is ignored.
+
+        Args:
+            args: additional CLI arguments to pass into ``docker buildx bake``.
+            stdout: stream to pipe Docker CLI stdout into.
+            stderr: stream to pipe Docker CLI stderr into.
+
+        Returns the exit code.
+        """
+        with NamedTemporaryFile(mode='w+', suffix='.json') as stream:
+            json.dump(self.as_bake(), stream)
+            stream.flush()
+            cmd = [self.binary, 'buildx', 'bake', '-f', stream.name, *(args or [])]
+            result = subprocess.run(cmd, stdout=stdout, stderr=stderr)
+        return result.returncode
+
+    def _build(self, target: Target, dockerfile: Path) -> BuildResult:
+        start = perf_counter()
+        try:
+            returncode = self._run(target, dockerfile)
+        except Exception as exc:
+            # a broken target doesn't stop the builds of the other ones
+            return _failed(target, exc, start)
+        return BuildResult(
+            name=target.name,
+            returncode=returncode,
+            duration=perf_counter() - start,
+        )
+
+    def _run(self, target: Target, dockerfile: Path) -> int:
+        target.image.save(dockerfile, target.target)
+        cmd = target.command(self.binary, dockerfile)
+        log = target.log
+        try:
+            if isinstance(log, Path):
+                with log.open('w', encoding='utf8') as stream:
+                    returncode = subprocess.call(cmd, stdout=stream, stderr=subprocess.STDOUT)
+            elif log is None:
+                returncode = subprocess.call(
+                    cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                )
+            else:
+                returncode = _stream(cmd, log)
+        except OSError as exc:
+            # the binary is not found or not executable
+            if log is not None and not isinstance(log, Path):
+                print(exc, file=log)
+            returncode = 127
+        return returncode
+
+
+def _failed(target: Target, exc: Exception, start: float) -> BuildResult:
+    """The result of a target which build couldn't be started.
+    """
+    error = f'{type(exc).__name__}: {exc}'
+    if target.log is not None and not isinstance(target.log, Path):
+        print(error, file=target.log)
+    return BuildResult(
+        name=target.name,
+        returncode=1,
+        duration=perf_counter() - start,
+        error=error,
+    )
+
+
+async def _abuild(target: Target, binary: str, timeout: float | None) -> BuildResult:
+    from ._async import AsyncBuild
+
+    content = target.image.as_str(target.target) + '\n'
+    build = AsyncBuild(
+        target.command(binary, '-'),
+        content.encode(),
+        name=target.name,
+        timeout=timeout,
+    )
+    log = target.log
+    async with build:
+        if isinstance(log, Path):
+            with log.open('w', encoding='utf8') as stream:
+                async for line in build:
+                    print(line, file=stream)
+        elif log is not None:
+            async for line in build:
+                print(line, file=log)
+        return await build.wait()
+
+
+def _stream(cmd: list[str], log: TextIO) -> int:
+    """Run the command, copying its output line-by-line into the given stream.
+    """
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        encoding='utf8',
+        errors='replace',
+    )
+    assert proc.stdout is not None
+    with proc:
+        for line in proc.stdout:
+            log.write(line)
+    return proc.returncode
+
+
+def _stage_fingerprint(stage: Stage, memo: dict[Stage, str]) -> str:
+    """Content hash of the stage and all stages it depends on.
+    """
+    fp = memo.get(stage)
+    if fp is not None:
+        return fp
+    hasher = sha256(stage.as_str().encode())
+    for dep in stage.dependencies:
+        hasher.update(_stage_fingerprint(dep, memo).encode())
+    fp = memo[stage] = hasher.hexdigest()
+    return fp
+
+
+def _build_options(target: Target) -> str:
+    """The options of the target that affect what any of its stages produces.
+    """
+    return json.dumps([str(target.context), sorted(target.platforms), sorted(target.build_args.items())])
+
+
+def _bake_target(
+    target: Target,
+    stages: list[Stage],
+    shared: Mapping[Stage, str],
+    output: str,
+) -> dict[str, Any]:
+    """Generate bake target that builds the given stages.
+
+    The ``shared`` maps stages built by other bake targets to their names.
+    """
+    own = set(stages)
+    contexts: dict[str, str] = {}
+    for stage in stages:
+        for dep in stage.dependencies:
+            if dep not in own and dep in shared:
+                contexts[dep.name] = f'target:{shared[dep]}'
+    image = target.image
+    syntax_version = image.syntax_version
+    if contexts and syntax_version is None:
+        # named contexts were introduced in 1.4
+        syntax_version = max(image.min_version, '1.4')
+    subset = Image(
+        *stages,
+        syntax_channel=image.syntax_channel,
+        syntax_version=syntax_version,
+        escape=image.escape,
+    )
+    result: dict[str, Any] = {
+        'context': str(target.context),
+        'dockerfile-inline': subset.as_str() + '\n',
+        'target': output,
+    }
+    if target.platforms:
+        result['platforms'] = target.platforms
+    if contexts:
+        result['contexts'] = contexts
+    return result
+
+
+def _target_options(target: Target) -> dict[str, Any]:
+    result: dict[str, Any] = {}
+    if target.tags:
+        result['tags'] = target.tags
+    if target.build_args:
+        result['args'] = target.build_args
+    return result
+
+
+def _platform_tag(tag: str, platform: str) -> str:
+    """Add the platform to the image tag, like ``app:1.0-linux-arm64``.
+    """
+    suffix = platform.replace('/', '-')
+    _, sep, version = tag.rpartition(':')
+    if not sep or '/' in version:
+        # no tag, the colon (if any) is a part of the registry address
+        return f'{tag}:{suffix}'
+    return f'{tag}-{suffix}'
+
+
+def _bake_name(name: str) -> str:
+    return re.sub(r'[^a-zA-Z0-9_-]', '-', name)
+
+
+def _unique(name: str, taken: Mapping[str, object]) -> str:
+    result = name
+    index = 1
+    while result in taken:
+        index += 1
+        result = f'{name}-{index}'
+    return result
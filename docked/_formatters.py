@@ -1,7 +1,5 @@
 from __future__ import annotations
 
-import json
-import shlex
 from typing import TYPE_CHECKING
 
 
@@ -10,7 +8,7 @@ if TYPE_CHECKING:
     from ._types import BaseImage
 
 
-def format_stage_name(stage: Stage | BaseImage) -> str:
+def format_stage_name(stage: Stage | BaseImage | str) -> str:
     from ._stage import Stage
     if isinstance(stage, Stage):
         return stage.name
@@ -27,15 +25,19 @@ def format_shell_cmd(cmd: list[str] | str, *, shell: bool) -> str:
     if shell:
         if isinstance(cmd, str):
             return cmd
+        import shlex
         return shlex.join(cmd)
 
     # exec form
+    import json
     if isinstance(cmd, str):
+        import shlex
         cmd = shlex.split(cmd)
     return json.dumps(cmd)
 
 
 def json_if_spaces(vals: list[str]) -> str:
     if any(' ' in val for val in vals):
+        import json
         return json.dumps(vals)
     return ' '.join(vals)
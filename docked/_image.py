@@ -1,15 +1,21 @@
 from __future__ import annotations
 
-import subprocess
+import heapq
 import sys
 from pathlib import Path
-from tempfile import NamedTemporaryFile
-from typing import TYPE_CHECKING, Container, Iterator, TextIO, overload
+from typing import (
+    IO, TYPE_CHECKING, Callable, Container, Hashable, Iterable, Iterator,
+    Mapping, TextIO, overload,
+)
 
-from ._linter import lint
+from ._formatters import format_stage_name
 
 
 if TYPE_CHECKING:
+    from ._async import AsyncBuild
+    from ._context import CachePrediction, ContextReport
+    from ._fleet import BuildResult
+    from ._profile import BuildProfile
     from ._stage import Stage
 
 
@@ -26,8 +32,12 @@ class Image:
             If not specified explicitly, will be detected based on the features
             you use, sticking to the lowest minor version possible.
         escape: the escape character to use in Dockerfile. Default: ``\\``.
+
+    The generated Dockerfile is cached, so rendering the same image
+    multiple times (``str``, ``save``, ``build``) is cheap. The cache is dropped
+    when the image or any of its stages changes.
     """
-    __slots__ = ('stages', 'syntax_channel', 'syntax_version', 'escape')
+    __slots__ = ('stages', 'syntax_channel', 'syntax_version', 'escape', '_cache')
 
     def __init__(
         self,
@@ -42,6 +52,7 @@ class Image:
         self.syntax_channel = syntax_channel
         self.syntax_version = syntax_version
         self.escape = escape
+        self._cache: tuple[Hashable, tuple[str, ...], str] | None = None
 
     @property
     def min_version(self) -> str:
@@ -49,8 +60,7 @@ class Image:
 
         Determined based on the instructions and their arguments used.
         """
-        versions = (stage.min_version for stage in self.stages)
-        return max(versions, default='1.0')
+        return max((stage.min_version for stage in self.stages), default='1.0')
 
     @property
     def syntax(self) -> str:
@@ -61,43 +71,269 @@ class Image:
         version = self.syntax_version or self.min_version
         return f'{self.syntax_channel}:{version}'
 
-    def as_str(self) -> str:
+    @property
+    def graph(self) -> Mapping[Stage, tuple[Stage, ...]]:
+        """Stages of the image mapped to the stages of the image they depend on.
+        """
+        own = set(self.stages)
+        return {
+            stage: tuple(dep for dep in stage.dependencies if dep in own)
+            for stage in self.stages
+        }
+
+    def get_stage(self, name: str) -> Stage:
+        """Get a Stage of the image by its name.
+        """
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        raise LookupError(f'stage {name} not found')
+
+    def toposort(self) -> tuple[Stage, ...]:
+        """All stages of the image, each going after all stages it depends on.
+
+        Stages that don't depend on each other stay in the original order.
+        Raises ValueError if stages depend on each other in a cycle.
+        """
+        graph = self.graph
+        index = {stage: i for i, stage in enumerate(self.stages)}
+        waiting = {stage: len(set(deps)) for stage, deps in graph.items()}
+        dependants: dict[Stage, list[Stage]] = {stage: [] for stage in graph}
+        for stage, deps in graph.items():
+            for dep in set(deps):
+                dependants[dep].append(stage)
+        ready = [index[stage] for stage, count in waiting.items() if not count]
+        heapq.heapify(ready)
+        result: list[Stage] = []
+        while ready:
+            stage = self.stages[heapq.heappop(ready)]
+            result.append(stage)
+            for dependant in dependants[stage]:
+                waiting[dependant] -= 1
+                if not waiting[dependant]:
+                    heapq.heappush(ready, index[dependant])
+        if len(result) != len(self.stages):
+            raise ValueError('stages depend on each other in a cycle')
+        return tuple(result)
+
+    def required_stages(self, target: Stage | str) -> tuple[Stage, ...]:
+        """All stages that must be built to build the target stage.
+
+        The target stage itself included, the stages are sorted topologically.
+        """
+        if isinstance(target, str):
+            target = self.get_stage(target)
+        graph = self.graph
+        reachable = {target}
+        stack = [target]
+        while stack:
+            for dep in graph.get(stack.pop(), ()):
+                if dep not in reachable:
+                    reachable.add(dep)
+                    stack.append(dep)
+        return tuple(stage for stage in self.toposort() if stage in reachable)
+
+    def prune(self, target: Stage | str | None) -> Image:
+        """Make an Image containing only the stages required to build the target stage.
+
+        Unused stages won't be parsed by BuildKit or executed by the legacy builder.
+        If the target is None, the image is returned as is.
+        """
+        if target is None:
+            return self
+        return Image(
+            *self.required_stages(target),
+            syntax_channel=self.syntax_channel,
+            syntax_version=self.syntax_version,
+            escape=self.escape,
+        )
+
+    def as_str(self, target: Stage | str | None = None) -> str:
         """Generate Dockerfile.
+
+        If the target stage is specified, only the stages required for it are included.
         """
-        return '\n'.join(self.iter_lines())
+        if target is not None:
+            return self.prune(target).as_str()
+        return self._render()[1]
 
-    def iter_lines(self) -> Iterator[str]:
+    def iter_lines(self, target: Stage | str | None = None) -> Iterator[str]:
         """Iterate over lines of Dockerfile.
 
         Useful for writing a big Dockerfile in a file or a stream.
+        If the target stage is specified, only the stages required for it are included.
         """
-        yield f'# syntax={self.syntax}'
-        yield f'# escape={self.escape}'
+        if target is not None:
+            yield from self.prune(target).iter_lines()
+            return
+        yield from self._render()[0]
+
+    @property
+    def _cache_key(self) -> Hashable:
+        return (
+            self.syntax_channel,
+            self.syntax_version,
+            self.escape,
+            tuple((stage, stage._cache_key) for stage in self.stages),
+        )
+
+    def _render(self) -> tuple[tuple[str, ...], str]:
+        key = self._cache_key
+        cache = self._cache
+        if cache is not None and cache[0] == key:
+            return cache[1], cache[2]
+        lines = [
+            f'# syntax={self.syntax}',
+            f'# escape={self.escape}',
+        ]
         for stage in self.stages:
-            yield ''
-            yield from stage.iter_lines()
+            lines.append('')
+            lines.extend(stage.iter_lines())
+        result = (tuple(lines), '\n'.join(lines))
+        self._cache = (key, *result)
+        return result
+
+    def intern(self) -> int:
+        """Replace equal steps in all stages with a single shared instance.
+
+        The shared steps are rendered and analyzed only once, and take
+        less memory. See ``docked.intern``. Returns how many steps were replaced.
+        """
+        from ._intern import intern_images
+        return intern_images([self])
+
+    def merge_runs(self) -> int:
+        """Merge adjacent RUN steps in all stages where it is safe.
+
+        See ``Stage.merge_runs``. Returns the number of removed layers.
+        """
+        return sum(stage.merge_runs() for stage in self.stages)
+
+    def pin_digests(
+        self,
+        cache: Path | None = None,
+        *,
+        ttl: float = 24 * 60 * 60,
+        jobs: int = 8,
+    ) -> int:
+        """Replace tags of base images with digests resolved from the registry.
+
+        It covers bases of stages, ``COPY --from``, and ``--mount=from=``.
+        Pinned digests keep the build reproducible and the builder cache valid
+        even if the tag is moved, and the builder doesn't need to resolve
+        the tag on every build. The tag is kept for readability:
+        ``python:3.11`` becomes ``python:3.11@sha256:...``.
+
+        Args:
+            cache: the file where to keep the resolved digests between runs.
+            ttl: for how many seconds a digest from the cache is used.
+            jobs: how many registry requests to send at the same time.
+
+        Returns how many references were pinned.
+        """
+        from ._digests import pin_images
+        return pin_images([self], cache, ttl=ttl, jobs=jobs)
+
+    def iter_dockerignore(self, target: Stage | str | None = None) -> Iterator[str]:
+        """Iterate over lines of .dockerignore that excludes files not used by the image.
+
+        The files used are the sources of COPY and EXTRACT and bind mounts of RUN,
+        except the ones referring to another stage. If the whole build context
+        is used, nothing is generated.
+        """
+        from ._context import iter_dockerignore
+        return iter_dockerignore(self.prune(target))
+
+    def analyze_context(
+        self,
+        path: Path | str = '.',
+        target: Stage | str | None = None,
+        *,
+        jobs: int | None = None,
+        top: int = 5,
+    ) -> ContextReport:
+        """Report how many files and bytes of the build context each step uses.
+
+        The sources of COPY, EXTRACT, and bind mounts of RUN are resolved
+        against the given build context directory, which is walked in parallel
+        using ``jobs`` threads. For each step, ``top`` largest files are reported.
+        """
+        from ._context import analyze
+        return analyze(self.prune(target), path, jobs=jobs, top=top)
+
+    def predict_cache(
+        self,
+        path: Path | str = '.',
+        target: Stage | str | None = None,
+        *,
+        state: Path | None = None,
+        build_args: Mapping[str, str] | None = None,
+    ) -> CachePrediction:
+        """Predict which steps will miss the build cache, without contacting Docker.
+
+        The cache key of each step covers the previous step, the instruction,
+        the content of the files it copies from the build context in ``path``,
+        and the values of ARGs it uses. The keys are compared with the ones
+        saved in the ``state`` file after the last successful build:
+
+            prediction = image.predict_cache(state=state)
+            print(prediction)
+            if image.build(exit_on_failure=False) == 0:
+                prediction.save(state)
+        """
+        from ._context import predict_cache
+        return predict_cache(self.prune(target), path, state=state, build_args=build_args)
 
     @overload
-    def save(self, path: Path) -> None:
+    def save(
+        self,
+        path: Path,
+        target: Stage | str | None = None,
+        dockerignore: bool = False,
+    ) -> None:
         pass
 
     @overload
-    def save(self, path: None = None) -> Path:
+    def save(
+        self,
+        path: None = None,
+        target: Stage | str | None = None,
+        dockerignore: bool = False,
+    ) -> Path:
         pass
 
-    def save(self, path: Path | None = None) -> Path | None:
+    def save(
+        self,
+        path: Path | None = None,
+        target: Stage | str | None = None,
+        dockerignore: bool = False,
+    ) -> Path | None:
         """Save Dockerfile in the given file path.
 
         If no path provided, save into a temporary file and return the file path.
+        If the target stage is specified, only the stages required for it are included.
+        If ``dockerignore`` is True, also save the Dockerfile-specific .dockerignore
+        next to the Dockerfile (``Dockerfile.dockerignore`` for ``Dockerfile``),
+        so that BuildKit sends into the builder only the files the image uses.
+        If the image uses the whole build context, the .dockerignore
+        left from a previous save is removed.
         """
         result = None
         if path is None:
+            from tempfile import NamedTemporaryFile
             tmp_path = NamedTemporaryFile(delete=False)
             path = Path(tmp_path.name)
             result = path
         with path.open('w', encoding='utf8') as stream:
-            for line in self.iter_lines():
+            for line in self.iter_lines(target):
                 print(line, file=stream)
+        if dockerignore:
+            lines = list(self.iter_dockerignore(target))
+            ignore_path = path.with_name(f'{path.name}.dockerignore')
+            if lines:
+                ignore_path.write_text('\n'.join(lines) + '\n', encoding='utf8')
+            else:
+                ignore_path.unlink(missing_ok=True)
         return result
 
     def build(
@@ -107,6 +343,11 @@ class Image:
         exit_on_failure: bool = True,
         stdout: TextIO = sys.stdout,
         stderr: TextIO = sys.stderr,
+        target: Stage | str | None = None,
+        dockerignore: bool = False,
+        skip_unchanged: Path | None = None,
+        stream: bool = False,
+        context: Path | None = None,
     ) -> int:
         """Build the image using syscalls to the Docker CLI.
 
@@ -117,18 +358,217 @@ class Image:
                 as a result instead of calling ``sys.exit`` on failure.
             stdout: stream to pipe Docker CLI stdout into.
             stderr: stream to pipe Docker CLI stderr into.
+            target: the stage to build. Only the stages it requires
+                are included into the Dockerfile.
+            dockerignore: set to True to send into the builder only the files
+                from the build context that the image uses.
+                See ``Image.iter_dockerignore``.
+            skip_unchanged: the directory where to remember the successful builds.
+                If specified, the build is skipped when the Dockerfile and
+                the build context files it uses didn't change since the last
+                successful build of the same tags with the same options
+                (like ``--platform`` or ``--push``). Only the files the image uses
+                are checked. Their hashes are kept in the same directory,
+                so that unchanged files are not read again.
+            stream: set to True to pipe the Dockerfile into Docker CLI stdin
+                instead of writing it into a temporary file.
+            context: the build context directory to stream into Docker CLI stdin.
+                The context tar is generated in-process and includes only the files
+                that the image uses, together with the Dockerfile. Don't pass
+                the context in ``args`` when using this option.
         """
         if args is None:
             args = sys.argv[1:]
-        with NamedTemporaryFile(mode='w+') as tmp_path:
-            for line in self.iter_lines():
-                print(line, file=tmp_path)
-            tmp_path.flush()
-            cmd = [binary, 'buildx', 'build', '-f', tmp_path.name, *args]
-            result = subprocess.run(cmd, stdout=stdout, stderr=stderr)
-        if exit_on_failure and result.returncode != 0:
-            sys.exit(result.returncode)
-        return result.returncode
+        if dockerignore and (stream or context is not None):
+            raise ValueError('dockerignore cannot be used when streaming the build')
+        cli_args = list(args)
+        if target is not None:
+            cli_args[:0] = ['--target', format_stage_name(target)]
+        history = None
+        if skip_unchanged is not None:
+            from ._context import (
+                BuildHistory, HashIndex, fingerprint, parse_build_args,
+            )
+            options = parse_build_args(cli_args)
+            root = context or options.context
+            # the build context is not a local directory, can't check it
+            if root is not None:
+                history = BuildHistory(skip_unchanged)
+                index = HashIndex(history.index_path)
+                fp = fingerprint(
+                    self.prune(target),
+                    root,
+                    build_args=options.build_args,
+                    index=index,
+                    options=options.options,
+                )
+                index.save()
+                if history.unchanged(options.tags, fp):
+                    print('docked: nothing changed since the last build, skipping', file=stderr)
+                    return 0
+        if context is not None:
+            from ._context import DOCKERFILE, write_context
+            root = context
+            image = self.prune(target)
+            cmd = [binary, 'buildx', 'build', '-f', DOCKERFILE, *cli_args, '-']
+            returncode = _pipe(cmd, stdout, stderr, lambda s: write_context(s, root, image))
+        elif stream:
+            content = (self.as_str(target) + '\n').encode()
+            cmd = [binary, 'buildx', 'build', '-f', '-', *cli_args]
+            returncode = _pipe(cmd, stdout, stderr, lambda s: s.write(content))
+        else:
+            import subprocess
+            from tempfile import TemporaryDirectory
+            with TemporaryDirectory(prefix='docked-') as tmp_dir:
+                path = Path(tmp_dir, 'Dockerfile')
+                self.save(path, target, dockerignore=dockerignore)
+                cmd = [binary, 'buildx', 'build', '-f', str(path), *cli_args]
+                returncode = subprocess.run(cmd, stdout=stdout, stderr=stderr).returncode
+        if history is not None and returncode == 0:
+            history.record(options.tags, fp)
+        if exit_on_failure and returncode != 0:
+            sys.exit(returncode)
+        return returncode
+
+    def build_platforms(
+        self,
+        platforms: Iterable[str],
+        *,
+        tags: Iterable[str] = (),
+        context: str | Path = '.',
+        builders: Mapping[str, str] | None = None,
+        binary: str = 'docker',
+        jobs: int | None = None,
+        **kwargs,
+    ) -> list[BuildResult]:
+        """Build the image for each platform separately, in parallel.
+
+        Each platform is built by its own ``docker buildx build`` call,
+        optionally on its own builder, and gets its own BuildResult.
+        So, a slow emulated platform doesn't hold back the others,
+        and the timing of each platform is reported. See ``Fleet.add_platforms``.
+
+        Stages for cross-compilation should use ``$BUILDPLATFORM`` as the platform
+        and ``ARG TARGETOS``, ``ARG TARGETARCH`` to know what to compile for.
+        BuildKit sets these arguments for each build.
+
+        Args:
+            platforms: platforms to build the image for, like ``linux/arm64``.
+            tags: tags to assign to the built images, the platform is added to each.
+            context: path to the build context.
+            builders: the buildx builder to use for each platform.
+            binary: docker binary to use. Must be either a path or in $PATH.
+            jobs: how many platforms to build at the same time. Default: all.
+
+        Other keyword arguments are passed into Target.
+        The results are in the same order as platforms.
+        """
+        from ._fleet import Fleet
+        platforms = list(platforms)
+        fleet = Fleet(jobs=jobs or len(platforms) or 1, binary=binary)
+        fleet.add_platforms(
+            self,
+            platforms,
+            tags=tags,
+            context=context,
+            builders=builders,
+            **kwargs,
+        )
+        return fleet.build()
+
+    def profile(
+        self,
+        args: list[str] | None = None,
+        binary: str = 'docker',
+        stdout: TextIO = sys.stdout,
+        target: Stage | str | None = None,
+    ) -> BuildProfile:
+        """Build the image and report how long each step took.
+
+        The build is run with ``--progress=rawjson``, and the progress
+        is parsed and mapped back to the Stages and Steps of the image.
+        Unlike ``Image.build``, it never calls ``sys.exit``,
+        the exit code is in the result.
+
+        Args:
+            args: additional CLI arguments to pass into Docker binary.
+            binary: docker binary to use. Must be either a path or in $PATH.
+            stdout: stream to pipe Docker CLI stdout into.
+            target: the stage to build. Only the stages it requires
+                are included into the Dockerfile.
+        """
+        import subprocess
+        from dataclasses import replace
+        from tempfile import TemporaryDirectory
+
+        from ._profile import parse_progress
+        if args is None:
+            args = sys.argv[1:]
+        image = self.prune(target)
+        with TemporaryDirectory(prefix='docked-') as tmp_dir:
+            path = Path(tmp_dir, 'Dockerfile')
+            image.save(path)
+            cmd = [binary, 'buildx', 'build', '-f', str(path), '--progress=rawjson']
+            if target is not None:
+                cmd.extend(('--target', format_stage_name(target)))
+            cmd.extend(args)
+            proc = subprocess.Popen(
+                cmd,
+                stdout=stdout,
+                stderr=subprocess.PIPE,
+                encoding='utf8',
+                errors='replace',
+            )
+            assert proc.stderr is not None
+            with proc:
+                result = parse_progress(proc.stderr, image)
+        return replace(result, returncode=proc.returncode)
+
+    def abuild(
+        self,
+        args: list[str],
+        binary: str = 'docker',
+        target: Stage | str | None = None,
+        timeout: float | None = None,
+        name: str | None = None,
+    ) -> AsyncBuild:
+        """Build the image in the background, from asyncio.
+
+        Unlike ``Image.build``, it doesn't block the event loop, doesn't write
+        anything into stdout, and doesn't call ``sys.exit``. The Dockerfile
+        is passed into Docker CLI stdin.
+
+        Async-iterate over the result to get the build log line-by-line,
+        await its ``wait`` method to get BuildResult:
+
+            async with image.abuild(['--tag', 'app', '.'], timeout=600) as build:
+                async for line in build:
+                    print(line)
+                result = await build.wait()
+
+        Args:
+            args: additional CLI arguments to pass into Docker binary,
+                including the build context.
+            binary: docker binary to use. Must be either a path or in $PATH.
+            target: the stage to build. Only the stages it requires
+                are included into the Dockerfile.
+            timeout: how many seconds the build may take before it's killed,
+                together with all processes it started.
+            name: the name to use in the result. Default: the target stage name.
+        """
+        from ._async import AsyncBuild
+        cmd = [binary, 'buildx', 'build', '-f', '-']
+        if target is not None:
+            cmd.extend(('--target', format_stage_name(target)))
+        cmd.extend(args)
+        if name is None:
+            name = format_stage_name(target or self.stages[-1])
+        return AsyncBuild(
+            cmd,
+            (self.as_str(target) + '\n').encode(),
+            name=name,
+            timeout=timeout,
+        )
 
     def lint(
         self,
@@ -145,6 +585,7 @@ class Image:
             exit_on_failure: set to False to return exit code on failure
                 instead of callin ``sys.exit``.
         """
+        from ._linter import lint
         count = 0
         for v in lint(self):
             if v.code in disable_codes:
@@ -157,3 +598,23 @@ class Image:
 
     def __str__(self) -> str:
         return self.as_str()
+
+
+def _pipe(
+    cmd: list[str],
+    stdout: TextIO,
+    stderr: TextIO,
+    write: Callable[[IO[bytes]], object],
+) -> int:
+    """Run the command, writing its stdin with the given function.
+    """
+    import subprocess
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=stdout, stderr=stderr)
+    assert proc.stdin is not None
+    try:
+        with proc.stdin:
+            write(proc.stdin)
+    except BrokenPipeError:
+        # the process exited without reading everything, its exit code tells why
+        pass
+    return proc.wait()
@@ -0,0 +1,90 @@
+"""Share a single instance between equal steps and mounts.
+
+Generated images repeat the same steps over and over: the same package
+installation in hundreds of images, the same cache mount in every RUN.
+Steps are immutable and cache what is computed from them (the rendered
+instruction, the parsed shell commands of RUN). So, if all equal steps
+are the same object, rendering, linting, and other analyses do the work
+once for each unique step instead of once for each occurrence, and the
+images take less memory.
+
+The table holds the instances weakly, so it doesn't keep alive steps
+that no stage uses anymore. Steps and mounts that refer to a Stage are never
+shared: stages of different images can have the same name but not the same content.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterable, TypeVar, Union
+from weakref import WeakValueDictionary
+
+from ._stage import Stage
+from ._steps import RUN, Step
+from ._types import Mount
+
+
+if TYPE_CHECKING:
+    from ._image import Image
+
+
+V = TypeVar('V', bound=Union[Step, Mount])
+
+# Keyed by the type and the rendered value, the same as equality of steps and mounts.
+_table: WeakValueDictionary[tuple[type, str], Step | Mount] = WeakValueDictionary()
+
+
+def intern(value: V) -> V:
+    """The shared instance of the step or mount equal to the given one.
+
+    The first value seen becomes the shared instance. The mounts of RUN
+    are shared as well.
+    """
+    if value._refers_stage:
+        return value
+    key = (type(value), str(value))
+    shared = _table.get(key)
+    if shared is not None:
+        return shared  # type: ignore[return-value]
+    if isinstance(value, RUN) and value.mount is not None:
+        value = _intern_mounts(value)  # type: ignore[assignment]
+    return _table.setdefault(key, value)  # type: ignore[return-value]
+
+
+def intern_stages(stages: Iterable[Stage]) -> int:
+    """Replace the steps of the stages with the shared instances.
+
+    Returns how many steps were replaced.
+    """
+    count = 0
+    for stage in stages:
+        for attr in ('build', 'run'):
+            old = getattr(stage, attr)
+            new = [intern(step) for step in old]
+            replaced = sum(a is not b for a, b in zip(old, new))
+            if replaced:
+                setattr(stage, attr, new)
+                count += replaced
+    return count
+
+
+def intern_images(images: Iterable[Image]) -> int:
+    """Replace the steps of all stages of the images with the shared instances.
+
+    Stages shared by images are processed once. Returns how many steps were replaced.
+    """
+    stages: dict[Stage, None] = {}
+    for image in images:
+        stages.update(dict.fromkeys(image.stages))
+    return intern_stages(stages)
+
+
+def _intern_mounts(step: RUN) -> RUN:
+    mounts = tuple(intern(mount) for mount in step.mounts)
+    if all(new is old for new, old in zip(mounts, step.mounts)):
+        return step
+    return RUN(
+        step.first, *step.rest,
+        mount=mounts if isinstance(step.mount, tuple) else mounts[0],
+        network=step.network,
+        security=step.security,
+        shell=step.shell,
+    )
@@ -1,5 +1,6 @@
-from ._lint import lint
+from ._checks import RULES, Context, StageInfo, rule
+from ._lint import lint, lint_many
 from ._violation import Violation
 
 
-__all__ = ['lint', 'Violation']
+__all__ = ['Context', 'lint', 'lint_many', 'rule', 'RULES', 'StageInfo', 'Violation']
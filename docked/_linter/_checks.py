@@ -7,16 +7,16 @@ Ideas for checks come from these linters:
 
 from __future__ import annotations
 
-import shlex
 from dataclasses import dataclass
-from functools import singledispatch
-from typing import Iterator
+from typing import Any, Callable, Iterable, Iterator, Mapping, TypeVar
 
 from .. import _steps as steps
+from .._shell import SimpleCommand
 from . import _violations as vs
 from ._violation import Violation
 
 
+S = TypeVar('S', bound=steps.Step)
 BAD_COMMANDS = frozenset({
     'free',
     'kill',
@@ -32,74 +32,128 @@ BAD_COMMANDS = frozenset({
 })
 
 
+Rule = Callable[[Any, 'Context'], Iterator[Violation]]
+
+# Checks for each step type. Checks registered for a base class
+# are also applied to its subclasses.
+RULES: dict[type, list[Rule]] = {}
+_resolved: dict[type, tuple[Rule, ...]] = {}
+
+
+@dataclass(frozen=True)
+class StageInfo:
+    """Positions of each step type in a stage, collected in a single pass.
+    """
+    names: tuple[str, ...]
+    first: Mapping[str, int]
+    last: Mapping[str, int]
+    counts: Mapping[str, int]
+
+    @classmethod
+    def from_steps(cls, all_steps: Iterable[steps.Step]) -> StageInfo:
+        names = []
+        first: dict[str, int] = {}
+        last: dict[str, int] = {}
+        counts: dict[str, int] = {}
+        for i, step in enumerate(all_steps):
+            name = type(step).__name__
+            names.append(name)
+            first.setdefault(name, i)
+            last[name] = i
+            counts[name] = counts.get(name, 0) + 1
+        return cls(names=tuple(names), first=first, last=last, counts=counts)
+
+
 @dataclass
 class Context:
-    steps: tuple[str, ...]
+    stage: StageInfo
     index: int
 
     @property
     def step(self) -> str:
-        return self.steps[self.index]
+        return self.stage.names[self.index]
 
     @property
     def is_first(self) -> bool:
-        return self.steps.index(self.step) == self.index
+        return self.stage.first[self.step] == self.index
 
     @property
     def is_last(self) -> bool:
-        last_index = len(self.steps) - self.steps[::-1].index(self.step) - 1
-        return last_index == self.index
+        return self.stage.last[self.step] == self.index
 
+    @property
+    def count(self) -> int:
+        """How many steps of the same type the stage has.
+        """
+        return self.stage.counts[self.step]
 
-@singledispatch
-def check_step(step: steps.Step, ctx: Context) -> Iterator[Violation]:
-    yield from ()
+
+def rule(step_type: type[S]) -> Callable[[Callable[[S, Context], Iterator[Violation]]], Rule]:
+    """Register a check for the given type of steps.
+    """
+    def wrapper(check: Callable[[S, Context], Iterator[Violation]]) -> Rule:
+        RULES.setdefault(step_type, []).append(check)
+        _resolved.clear()
+        return check
+    return wrapper
 
 
-@check_step.register
-def _(step: steps.WORKDIR, ctx: Context) -> Iterator[Violation]:
+def check_step(step: steps.Step, ctx: Context) -> Iterator[Violation]:
+    """Run all checks registered for the step type.
+    """
+    step_type = type(step)
+    rules = _resolved.get(step_type)
+    if rules is None:
+        rules = tuple(r for cls in step_type.__mro__ for r in RULES.get(cls, ()))
+        _resolved[step_type] = rules
+    for check in rules:
+        yield from check(step, ctx)
+
+
+@rule(steps.WORKDIR)
+def check_workdir(step: steps.WORKDIR, ctx: Context) -> Iterator[Violation]:
     if str(step.path).startswith('/'):
         return
     # TODO: support windows paths
     yield vs.WORKDIR_01
 
 
-@check_step.register
-def _(step: steps.RUN, ctx: Context) -> Iterator[Violation]:
-    for cmd in (step.first,) + step.rest:
-        if not isinstance(cmd, list):
-            cmd = shlex.split(cmd)
-        bin = cmd[0]
-        if bin == 'sudo':
+@rule(steps.RUN)
+def check_run(step: steps.RUN, ctx: Context) -> Iterator[Violation]:
+    commands = step.parsed.commands
+    for i, cmd in enumerate(commands):
+        if cmd.sudo:
             yield vs.RUN_02
-            if len(cmd) > 1:
-                cmd = cmd[1:]
-                bin = cmd[0]
-        if bin in BAD_COMMANDS:
-            yield vs.RUN_01.format(bin=bin)
-
-        if bin in ('apt', 'apt-get'):
-            if cmd[1] in ('upgrade', 'dist-upgrade'):
-                yield vs.RUN_03.format(subcmd=cmd[1])
-            if cmd[1] == 'update' and not step.rest:
+        if cmd.program in BAD_COMMANDS:
+            yield vs.RUN_01.format(bin=cmd.program)
+
+        if cmd.program in ('apt', 'apt-get'):
+            subcmd = cmd.subcommand
+            if subcmd in ('upgrade', 'dist-upgrade'):
+                yield vs.RUN_03.format(subcmd=subcmd)
+            if subcmd == 'update' and not any(_is_apt_install(c) for c in commands[i + 1:]):
                 yield vs.RUN_04
 
 
-@check_step.register
-def _(step: steps.USER, ctx: Context) -> Iterator[Violation]:
+def _is_apt_install(cmd: SimpleCommand) -> bool:
+    return cmd.program in ('apt', 'apt-get') and cmd.subcommand == 'install'
+
+
+@rule(steps.USER)
+def check_user(step: steps.USER, ctx: Context) -> Iterator[Violation]:
     if ctx.is_last and step.user in (0, 'root'):
         yield vs.USER_01
 
 
-@check_step.register
-def _(step: steps.CMD, ctx: Context) -> Iterator[Violation]:
+@rule(steps.CMD)
+def check_cmd(step: steps.CMD, ctx: Context) -> Iterator[Violation]:
     if not ctx.is_last:
         yield vs.CMD_01
     if step.shell:
         yield vs.CMD_02
 
 
-@check_step.register
-def _(step: steps.EXPOSE, ctx: Context) -> Iterator[Violation]:
+@rule(steps.EXPOSE)
+def check_expose(step: steps.EXPOSE, ctx: Context) -> Iterator[Violation]:
     if not 0 < step.port < 65535:
         yield vs.EXPOSE_01
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Iterator
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator
 
-from ._checks import Context, check_step
+from ._checks import Context, StageInfo, check_step
 
 
 if TYPE_CHECKING:
@@ -12,10 +15,43 @@ if TYPE_CHECKING:
 
 def lint(image: Image) -> Iterator[Violation]:
     for stage in image.stages:
-        ctx = Context(
-            steps=tuple(type(step).__name__ for step in stage.all_steps),
-            index=0,
-        )
-        for i, step in enumerate(stage.all_steps):
+        all_steps = list(stage.all_steps)
+        ctx = Context(stage=StageInfo.from_steps(all_steps), index=0)
+        for i, step in enumerate(all_steps):
             ctx.index = i
             yield from check_step(step, ctx)
+
+
+def lint_many(
+    images: Iterable[Image | Path],
+    jobs: int | None = None,
+) -> list[list[Violation]]:
+    """Lint many images in parallel, in a pool of processes.
+
+    Returns the violations for each image, in the same order as images.
+
+    An image can be passed either as an Image object or as a path to Python module
+    defining ``image`` or ``get_image``. Image objects are pickled to be sent
+    into the worker processes, which for big images takes longer than linting.
+    Modules are imported right in the workers, so pass them if you can.
+    Only the checks registered on import of docked are used in the workers.
+
+    Args:
+        images: the images or image modules to lint.
+        jobs: how many processes to run. Default: number of CPUs.
+    """
+    images = list(images)
+    if not images:
+        return []
+    jobs = jobs or os.cpu_count() or 1
+    # send images in batches to reduce the IPC overhead
+    chunksize = max(1, len(images) // (jobs * 4))
+    with ProcessPoolExecutor(jobs) as executor:
+        return list(executor.map(_lint_all, images, chunksize=chunksize))
+
+
+def _lint_all(image: Image | Path) -> list[Violation]:
+    if isinstance(image, Path):
+        from .._bulk import load_image
+        image = load_image(image)
+    return list(lint(image))
@@ -0,0 +1,15 @@
+from ._merge import merge_runs
+from ._prefixes import SharedPrefix, SharedPrefixes, find_shared_prefixes
+from ._reorder import Move, Reordering, git_churn, reorder
+
+
+__all__ = [
+    'find_shared_prefixes',
+    'git_churn',
+    'merge_runs',
+    'Move',
+    'reorder',
+    'Reordering',
+    'SharedPrefix',
+    'SharedPrefixes',
+]
@@ -0,0 +1,89 @@
+"""Merge adjacent RUN steps into one to reduce the number of layers.
+"""
+
+from __future__ import annotations
+
+import re
+import shlex
+from typing import TYPE_CHECKING
+
+from .. import _steps as steps
+
+
+if TYPE_CHECKING:
+    from .._stage import Stage
+
+
+# Operators that change the meaning of the command when it gets chained with `&&`.
+UNSAFE_OPERATORS = frozenset({';', ';;', '||', '&'})
+
+# Builtins that change the state of the shell for the commands that follow,
+# or end the shell, so the commands that follow don't run at all.
+STATEFUL_BUILTINS = frozenset({
+    '.', 'alias', 'cd', 'declare', 'enable', 'eval', 'exec', 'exit', 'export',
+    'getopts', 'hash', 'let', 'local', 'mapfile', 'popd', 'pushd', 'read',
+    'readarray', 'readonly', 'set', 'shift', 'shopt', 'source', 'trap',
+    'typeset', 'ulimit', 'umask', 'unalias', 'unset',
+})
+
+
+def merge_runs(stage: Stage) -> int:
+    result: list[steps.BuildStep] = []
+    removed = 0
+    # is the last step in the result a RUN we can append commands to
+    extendable = False
+    for step in stage.build:
+        commands = _chainable_commands(step)
+        if commands is None:
+            result.append(step)
+            extendable = False
+            continue
+        assert isinstance(step, steps.RUN)
+        prev = result[-1] if extendable else None
+        if isinstance(prev, steps.RUN) and _same_options(prev, step):
+            prev_commands = _chainable_commands(prev)
+            assert prev_commands is not None
+            result[-1] = steps.RUN(
+                *prev_commands, *commands,
+                mount=step.mount,
+                network=step.network,
+                security=step.security,
+            )
+            removed += 1
+        else:
+            result.append(step)
+        extendable = not _is_stateful(step)
+    stage.build = result
+    return removed
+
+
+def _chainable_commands(step: steps.Step) -> list[str] | None:
+    """Shell commands of the step if it can be safely chained with others.
+    """
+    if not isinstance(step, steps.RUN) or not step.shell:
+        return None
+    first = step.first
+    if not isinstance(first, str):
+        first = shlex.join(first)
+    commands = [first, *step.rest]
+    for cmd in commands:
+        if '\n' in cmd or re.search(r'(^|\s)#', cmd):
+            return None
+    parsed = step.parsed
+    if not parsed.valid or parsed.operators & UNSAFE_OPERATORS:
+        return None
+    return commands
+
+
+def _is_stateful(step: steps.RUN) -> bool:
+    for cmd in step.parsed.commands:
+        if cmd.program in STATEFUL_BUILTINS:
+            return True
+        # a bare assignment (`A=1`) sets a shell variable
+        if not cmd.program and cmd.env:
+            return True
+    return False
+
+
+def _same_options(left: steps.RUN, right: steps.RUN) -> bool:
+    return (left.mounts, left.network, left.security) == (right.mounts, right.network, right.security)
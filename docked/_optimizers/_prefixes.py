@@ -0,0 +1,264 @@
+"""Find sequences of steps that many images start with.
+
+Images in a big project often start from the same base image and the same
+setup steps (like installing system packages), and each image builds
+these layers on its own. The shared steps can be moved into a stage
+that the images are based on, so it's built only once (see ``Fleet.bake``)
+or published as a base image.
+
+The steps are compared by the generated instruction (see ``Step.__eq__``),
+and the stages are arranged into a trie keyed by steps, so finding
+the prefixes takes linear time in the total number of steps.
+A prefix ends before the first step that may produce different results
+for different images: the one that reads the build context, depends on
+another stage, or uses a build argument. Only stages based on an external
+image are considered.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from hashlib import sha256
+from typing import TYPE_CHECKING, Iterable, Mapping
+
+from .. import _steps as steps
+from .._formatters import format_stage_name
+from .._profile import OP_STEPS
+from .._types import BaseImage, BindMount
+
+
+if TYPE_CHECKING:
+    from .._image import Image
+    from .._stage import Stage
+
+
+@dataclass(frozen=True)
+class SharedPrefix:
+    """Steps that many stages start with, extracted into a shared stage.
+
+    The ``stage`` is based either on the base image of the users or on
+    another, shorter, shared prefix. The ``users`` are the stages that
+    continue right after the prefix. The ``depth`` is how many steps
+    from the base image the prefix covers, including the parent prefixes.
+    The ``builds`` is how many times the steps are built without sharing.
+    """
+    stage: Stage
+    users: tuple[Stage, ...]
+    depth: int
+    builds: int
+    layers: int
+    seconds: float
+
+    def __str__(self) -> str:
+        base = format_stage_name(self.stage.base)
+        title = f'{self.stage.name} ({len(self.stage.build)} steps after {base})'
+        return f'{self.layers:>6} {self.seconds:>9.1f}s {self.builds:>6}  {title}'
+
+
+@dataclass(frozen=True)
+class SharedPrefixes:
+    """The result of ``find_shared_prefixes``.
+
+    The images are not changed until ``apply`` is called.
+    The prefixes go in the order they depend on each other, parents first.
+    """
+    images: tuple[Image, ...]
+    prefixes: tuple[SharedPrefix, ...]
+
+    @property
+    def layers(self) -> int:
+        """How many layers less to build in total.
+        """
+        return sum(prefix.layers for prefix in self.prefixes)
+
+    @property
+    def seconds(self) -> float:
+        """How much build time is saved in total, based on the given durations.
+        """
+        return sum(prefix.seconds for prefix in self.prefixes)
+
+    def as_image(self, prefix: SharedPrefix) -> Image:
+        """An Image that builds the shared stage, to publish it as a base image.
+        """
+        from .._image import Image
+
+        chain = [prefix.stage]
+        shared = {p.stage for p in self.prefixes}
+        while chain[-1].base in shared:
+            chain.append(chain[-1].base)  # type: ignore[arg-type]
+        return Image(*reversed(chain))
+
+    def apply(self, tags: Mapping[str, str] | None = None) -> None:
+        """Rewrite the users of the prefixes to be based on the shared stages.
+
+        The shared stages are added at the beginning of each image that needs them.
+        Pass ``tags`` to use a published base image (see ``as_image``)
+        instead of some of the stages. The keys are names of the shared stages,
+        the values are image references, like ``registry/base:1.0``.
+        """
+        tags = tags or {}
+        bases: dict[Stage, Stage | BaseImage] = {}
+        for prefix in self.prefixes:
+            stage = prefix.stage
+            if stage.base in bases:
+                stage.base = bases[stage.base]  # type: ignore[index]
+            tag = tags.get(stage.name)
+            new_base = bases[stage] = stage if tag is None else BaseImage(tag)
+            for user in prefix.users:
+                if user.base is new_base:
+                    continue
+                user.base = new_base
+                user.build = user.build[prefix.depth:]
+
+        shared = [prefix.stage for prefix in self.prefixes]
+        for image in self.images:
+            required: set[Stage] = set()
+            for stage in image.stages:
+                base = stage.base
+                while base in bases and base not in required:
+                    required.add(base)  # type: ignore[arg-type]
+                    base = base.base  # type: ignore[union-attr]
+            missing = [s for s in shared if s in required and s not in image.stages]
+            if missing:
+                image.stages = (*missing, *image.stages)
+
+    def __str__(self) -> str:
+        lines = [f'{"LAYERS":>6} {"TIME":>10} {"BUILDS":>6}  STAGE']
+        lines.extend(str(prefix) for prefix in self.prefixes)
+        lines.append(f'{self.layers:>6} {self.seconds:>9.1f}s {"":>6}  total')
+        return '\n'.join(lines)
+
+
+class _Node:
+    __slots__ = ('step', 'parent', 'children', 'users', 'depth', 'layers', 'seconds')
+
+    def __init__(self, step: steps.BuildStep | None, parent: _Node | None, seconds: float = 0) -> None:
+        self.step = step
+        self.parent = parent
+        self.children: dict[steps.BuildStep, _Node] = {}
+        self.users: list[Stage] = []
+        self.depth = 0
+        self.layers = 0
+        self.seconds = seconds
+        if parent is not None:
+            self.depth = parent.depth + 1
+            self.layers = parent.layers + isinstance(step, OP_STEPS)
+            self.seconds += parent.seconds
+
+
+def find_shared_prefixes(
+    images: Iterable[Image],
+    *,
+    min_users: int = 2,
+    durations: Mapping[steps.Step, float] | None = None,
+) -> SharedPrefixes:
+    """Find the longest sequences of steps that many stages start with.
+
+    If a group of stages shares a longer prefix than the rest, it gets
+    its own shared stage based on the shorter one. The same goes for the steps
+    before the point where the prefixes of different groups fork. The images are not changed,
+    call ``apply`` on the result to rewrite them.
+
+    Args:
+        images: the images to analyze. Stages shared by images are counted once.
+        min_users: how many stages must start with the steps to share them.
+        durations: how long each step takes to build, in seconds.
+            Used to estimate the saved build time.
+            See ``BuildProfile.durations``.
+    """
+    from .._stage import Stage
+
+    assert min_users > 1
+    images = tuple(dict.fromkeys(images))
+    durations = durations or {}
+    roots: dict[tuple[str, str | None], _Node] = {}
+    origins: dict[_Node, tuple[BaseImage, str | None]] = {}
+    leaves: dict[Stage, _Node] = {}
+    for image in images:
+        for stage in image.stages:
+            if stage in leaves or not isinstance(stage.base, BaseImage):
+                continue
+            key = (str(stage.base), stage.platform)
+            node = roots.get(key)
+            if node is None:
+                node = roots[key] = _Node(None, None)
+                origins[node] = (stage.base, stage.platform)
+            for step in stage.build:
+                if not _is_shareable(step):
+                    break
+                child = node.children.get(step)
+                if child is None:
+                    child = node.children[step] = _Node(step, node, durations.get(step, 0))
+                child.users.append(stage)
+                node = child
+            leaves[stage] = node
+
+    # each stage continues right after the longest prefix it shares
+    ends: dict[_Node, list[Stage]] = {}
+    for stage, node in leaves.items():
+        while node.parent is not None and len(node.users) < min_users:
+            node = node.parent
+        if node.layers:
+            ends.setdefault(node, []).append(stage)
+    # where the prefixes fork, the steps before the fork are shared by all of them
+    forks: dict[_Node, set[_Node]] = {}
+    for node in ends:
+        while node.parent is not None:
+            seen = node.parent in forks
+            forks.setdefault(node.parent, set()).add(node)
+            if seen:
+                break
+            node = node.parent
+    for node, children in forks.items():
+        if len(children) > 1 and node.layers:
+            ends.setdefault(node, [])
+
+    prefixes: list[SharedPrefix] = []
+    shared: dict[_Node, Stage] = {}
+    for node in sorted(ends, key=lambda n: n.depth):
+        segment: list[steps.BuildStep] = []
+        parent = node
+        while parent.parent is not None and (parent is node or parent not in shared):
+            segment.append(parent.step)  # type: ignore[arg-type]
+            parent = parent.parent
+        segment.reverse()
+        if parent in shared:
+            base: Stage | BaseImage = shared[parent]
+            platform = shared[parent].platform
+        else:
+            base, platform = origins[parent]
+        hasher = sha256(f'{format_stage_name(base)}\n{platform}\n'.encode())
+        for step in segment:
+            hasher.update(str(step).encode())
+        stage = shared[node] = Stage(
+            base=base,
+            name=f'shared-{hasher.hexdigest()[:12]}',
+            platform=platform,
+            build=segment,
+        )
+        builds = len(node.users)
+        prefixes.append(SharedPrefix(
+            stage=stage,
+            users=tuple(ends[node]),
+            depth=node.depth,
+            builds=builds,
+            layers=(builds - 1) * (node.layers - parent.layers),
+            seconds=(builds - 1) * (node.seconds - parent.seconds),
+        ))
+    return SharedPrefixes(images=images, prefixes=tuple(prefixes))
+
+
+def _is_shareable(step: steps.BuildStep) -> bool:
+    """Check if the step produces the same result in all images.
+    """
+    if isinstance(step, (steps.ARG, steps.EXTRACT)):
+        return False
+    if isinstance(step, steps.COPY):
+        return isinstance(step.from_stage, BaseImage)
+    if isinstance(step, steps.RUN):
+        for mount in step.mounts:
+            from_stage = getattr(mount, 'from_stage', None)
+            if from_stage is None and isinstance(mount, BindMount):
+                return False
+            if from_stage is not None and not isinstance(from_stage, BaseImage):
+                return False
+    return True
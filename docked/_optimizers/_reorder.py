@@ -0,0 +1,349 @@
+"""Reorder steps of a stage to keep the build cache valid for longer.
+
+Docker reuses the cached layers up to the first step that changed.
+So, the steps that change often (volatile) should go as late as possible.
+The optimizer moves volatile steps down, as long as it doesn't change
+what other steps can see.
+
+The read/write analysis is static and so has to make assumptions:
+
++ RUN may read any file, so no file-producing step is moved across it.
+  A command can depend on files it never mentions: ``apt-get update``
+  reads ``/etc/apt/sources.list``, ``pip install`` reads ``pip.conf``.
+  With ``explicit_paths``, RUN is assumed to read only its working
+  directory and the absolute paths that appear in the command.
++ RUN writes only its working directory and absolute paths
+  that appear in the command.
++ RUN may use any ENV or ARG variable: the command sees all of them
+  as environment variables, and build tools read many (``PATH``,
+  ``PIP_INDEX_URL``, ``CFLAGS``) without the command mentioning them.
+  So, no variable is moved across RUN.
+"""
+
+from __future__ import annotations
+
+import heapq
+import re
+import subprocess
+from bisect import bisect_left
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+from typing import TYPE_CHECKING, Iterable, Iterator, Mapping, Optional, Tuple
+
+from .. import _steps as steps
+from .._context import matches, normalize
+
+
+if TYPE_CHECKING:
+    from .._stage import Stage
+
+
+# Probability of change for a step copying the whole build context
+# and for a step copying some files when there is no churn information.
+WHOLE_CONTEXT = 1.0
+UNKNOWN = .5
+
+VAR_REF = re.compile(r'\$\{?([A-Za-z_][A-Za-z0-9_]*)')
+
+# Resources that steps read and write. The second element narrows
+# the resource (a variable name or an absolute path). None means "any".
+Resource = Tuple[str, Optional[str]]
+ANY_PATH: Resource = ('fs', None)
+ANY_VAR: Resource = ('var', None)
+BARRIER: Resource = ('*', None)
+ADD_STEPS = (steps.COPY, steps.EXTRACT, steps.DOWNLOAD, steps.CLONE)
+
+
+@dataclass(frozen=True)
+class Move:
+    """A step moved to another position.
+    """
+    step: steps.Step
+    old_index: int
+    new_index: int
+
+    def __str__(self) -> str:
+        first_line = str(self.step).splitlines()[0]
+        return f'{self.old_index:>3} -> {self.new_index:<3} {first_line}'
+
+
+@dataclass(frozen=True)
+class Reordering:
+    """The result of reordering steps of a Stage.
+
+    The stage itself is not changed. To apply the result, assign ``build``
+    to the stage: ``stage.build = reordering.build``.
+    """
+    build: list[steps.BuildStep]
+    moves: tuple[Move, ...]
+    cached_before: float
+    cached_after: float
+
+    @property
+    def layers_gained(self) -> float:
+        """Estimated number of layers that will be taken from the cache on each build.
+        """
+        return self.cached_after - self.cached_before
+
+    def __str__(self) -> str:
+        lines = [str(move) for move in self.moves]
+        lines.append(f'estimated cached layers gained: {self.layers_gained:.2f}')
+        return '\n'.join(lines)
+
+
+@dataclass(frozen=True)
+class _Access:
+    volatility: float
+    reads: frozenset[Resource]
+    writes: frozenset[Resource]
+
+
+def reorder(
+    stage: Stage,
+    churn: Mapping[str, float] | None = None,
+    *,
+    explicit_paths: bool = False,
+) -> Reordering:
+    build = list(stage.build)
+    accesses = list(_analyze(build, churn, explicit_paths))
+
+    # find what steps must go before each step
+    blockers: list[set[int]] = [set() for _ in build]
+    for j, right in enumerate(accesses):
+        for i in range(j):
+            if _conflict(accesses[i], right):
+                blockers[j].add(i)
+    blocks: list[list[int]] = [[] for _ in build]
+    for j, before in enumerate(blockers):
+        for i in before:
+            blocks[i].append(j)
+
+    # topological sort, picking the most stable step from the available ones
+    ready = [(accesses[i].volatility, i) for i, before in enumerate(blockers) if not before]
+    heapq.heapify(ready)
+    order: list[int] = []
+    while ready:
+        _, i = heapq.heappop(ready)
+        order.append(i)
+        for j in blocks[i]:
+            blockers[j].discard(i)
+            if not blockers[j]:
+                heapq.heappush(ready, (accesses[j].volatility, j))
+
+    stable = set(_increasing_subsequence(order))
+    moves = tuple(
+        Move(step=build[old], old_index=old, new_index=new)
+        for new, old in enumerate(order)
+        if old not in stable
+    )
+    return Reordering(
+        build=[build[i] for i in order],
+        moves=moves,
+        cached_before=_expected_cached([a.volatility for a in accesses]),
+        cached_after=_expected_cached([accesses[i].volatility for i in order]),
+    )
+
+
+def git_churn(path: str = '.', max_commits: int = 1000) -> dict[str, float]:
+    """How often each file in the git repository changes.
+
+    Returns file paths relative to the given directory mapped to the fraction
+    of the last ``max_commits`` commits that modified the file. Can be used
+    as ``churn`` when reordering steps of a Stage.
+    """
+    cmd = [
+        'git', '-C', path, 'log', f'--max-count={max_commits}',
+        '--name-only', '--relative', '--format=%x00',
+    ]
+    output = subprocess.run(cmd, capture_output=True, encoding='utf8', check=True).stdout
+    commits = output.split('\0')[1:]
+    counts: dict[str, int] = {}
+    for commit in commits:
+        for name in set(commit.splitlines()) - {''}:
+            counts[name] = counts.get(name, 0) + 1
+    if not commits:
+        return {}
+    return {name: count / len(commits) for name, count in counts.items()}
+
+
+def _analyze(
+    build: list[steps.BuildStep],
+    churn: Mapping[str, float] | None,
+    explicit_paths: bool,
+) -> Iterator[_Access]:
+    workdir: PurePosixPath | None = PurePosixPath('/')
+    for step in build:
+        if isinstance(step, steps.WORKDIR):
+            path = _resolve(workdir, step.path)
+            yield _Access(
+                volatility=0,
+                reads=_var_reads(str(step.path)) | {('workdir', None)},
+                writes=frozenset({('workdir', None), _fs(path)}),
+            )
+            workdir = path
+        elif isinstance(step, steps.RUN):
+            yield _analyze_run(step, workdir, explicit_paths)
+        elif isinstance(step, steps.ENV):
+            yield _Access(
+                volatility=UNKNOWN if '$' in step.value else 0,
+                reads=_var_reads(step.value),
+                writes=frozenset({('var', step.key)}),
+            )
+        elif isinstance(step, steps.ARG):
+            yield _Access(
+                volatility=UNKNOWN,
+                reads=_var_reads(step.default or ''),
+                writes=frozenset({('var', step.name)}),
+            )
+        elif isinstance(step, steps.USER):
+            yield _Access(
+                volatility=0,
+                reads=_var_reads(f'{step.user}:{step.group}'),
+                writes=frozenset({('user', None)}),
+            )
+        elif isinstance(step, steps.SHELL):
+            yield _Access(0, frozenset(), frozenset({('shell', None)}))
+        elif isinstance(step, ADD_STEPS):
+            yield _analyze_add(step, workdir, churn)
+        else:
+            yield _Access(0, frozenset({BARRIER}), frozenset({BARRIER}))
+
+
+def _analyze_run(step: steps.RUN, workdir: PurePosixPath | None, explicit_paths: bool) -> _Access:
+    parts = [step.first] if isinstance(step.first, str) else list(step.first)
+    parts.extend(step.rest)
+    text = ' '.join(parts)
+    paths = {_fs(workdir)}
+    for match in re.finditer(r'''(?:^|[\s='"])(/[^\s'";&|<>]*)''', text):
+        paths.add(_fs(PurePosixPath(match.group(1))))
+    reads: set[Resource] = {('workdir', None), ('user', None), ('shell', None), ANY_VAR}
+    reads.update(paths if explicit_paths else {ANY_PATH})
+    return _Access(
+        volatility=0,
+        reads=frozenset(reads),
+        writes=frozenset(paths),
+    )
+
+
+def _analyze_add(
+    step: steps.COPY | steps.EXTRACT | steps.DOWNLOAD | steps.CLONE,
+    workdir: PurePosixPath | None,
+    churn: Mapping[str, float] | None,
+) -> _Access:
+    text = ' '.join(step._sources + [str(step.dst)])
+    dst = _resolve(workdir, step.dst)
+    reads = set(_var_reads(text))
+    if not PurePosixPath(step.dst).is_absolute():
+        reads.add(('workdir', None))
+    volatility = 0.
+    from_context = isinstance(step, (steps.COPY, steps.EXTRACT))
+    if from_context and getattr(step, 'from_stage', None) is None:
+        volatility = _copy_volatility(step._sources, churn)
+    return _Access(
+        volatility=volatility,
+        reads=frozenset(reads),
+        writes=frozenset({_fs(dst)}),
+    )
+
+
+def _copy_volatility(sources: list[str], churn: Mapping[str, float] | None) -> float:
+    patterns = [normalize(src) for src in sources]
+    if churn is None:
+        if '' in patterns:
+            return WHOLE_CONTEXT
+        return UNKNOWN
+    stable = 1.
+    for name, freq in churn.items():
+        if any(matches(name, pattern) for pattern in patterns):
+            stable *= 1 - freq
+    return 1 - stable
+
+
+def _var_reads(text: str) -> frozenset[Resource]:
+    return frozenset(('var', name) for name in VAR_REF.findall(text))
+
+
+def _fs(path: PurePosixPath | None) -> Resource:
+    if path is None:
+        return ANY_PATH
+    return ('fs', str(path))
+
+
+def _resolve(workdir: PurePosixPath | None, path: object) -> PurePosixPath | None:
+    text = str(path)
+    if '$' in text:
+        return None
+    result = PurePosixPath(text)
+    if result.is_absolute():
+        return result
+    if workdir is None:
+        return None
+    return workdir / result
+
+
+def _overlap(left: Resource, right: Resource) -> bool:
+    if left == BARRIER or right == BARRIER:
+        return True
+    lkind, lname = left
+    rkind, rname = right
+    if lkind != rkind:
+        return False
+    if lname is None or rname is None:
+        return True
+    if lkind == 'fs':
+        return _is_subpath(lname, rname) or _is_subpath(rname, lname)
+    return lname == rname
+
+
+def _is_subpath(path: str, parent: str) -> bool:
+    if parent == '/':
+        return True
+    return path == parent or path.startswith(parent + '/')
+
+
+def _conflict(left: _Access, right: _Access) -> bool:
+    pairs = (
+        (left.writes, right.reads),
+        (left.reads, right.writes),
+        (left.writes, right.writes),
+    )
+    for lefts, rights in pairs:
+        for lres in lefts:
+            for rres in rights:
+                if _overlap(lres, rres):
+                    return True
+    return False
+
+
+def _expected_cached(volatility: Iterable[float]) -> float:
+    """The expected number of steps before the first cache miss.
+    """
+    result = 0.
+    chance = 1.
+    for p in volatility:
+        chance *= 1 - p
+        result += chance
+    return result
+
+
+def _increasing_subsequence(items: list[int]) -> list[int]:
+    """The longest increasing subsequence. These are the steps that didn't move.
+    """
+    tails: list[int] = []
+    tail_indices: list[int] = []
+    parents: list[int] = [-1] * len(items)
+    for i, item in enumerate(items):
+        pos = bisect_left(tails, item)
+        if pos == len(tails):
+            tails.append(item)
+            tail_indices.append(i)
+        else:
+            tails[pos] = item
+            tail_indices[pos] = i
+        parents[i] = tail_indices[pos - 1] if pos else -1
+    result: list[int] = []
+    i = tail_indices[-1] if tail_indices else -1
+    while i != -1:
+        result.append(items[i])
+        i = parents[i]
+    return result[::-1]
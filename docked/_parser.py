@@ -0,0 +1,673 @@
+"""Parse Dockerfile into docked objects.
+
+The parser reads the Dockerfile line by line and never looks back,
+so it works in linear time and keeps in memory only the current instruction.
+The instructions that docked doesn't have are mapped to the closest equivalent:
+LABEL and MAINTAINER go into ``Stage.labels``, ADD becomes DOWNLOAD, CLONE, or EXTRACT,
+and ARG declared before the first FROM is substituted into FROM lines.
+ENV and ARG with multiple pairs become one step per pair. An ENV pair
+that refers to a key set before it in the same instruction can't be split
+without changing its value, so it's an error.
+Heredocs are not supported.
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import (
+    TYPE_CHECKING, Callable, Iterable, Iterator, Literal, TypedDict, TypeVar,
+)
+
+from . import _steps as steps
+from ._image import DEFAULT_CHANNEL, Image
+from ._stage import Stage
+from ._types import (
+    BaseImage, BindMount, CacheMount, Checksum, SecretMount, SSHMount,
+    TmpFSMount,
+)
+
+
+if TYPE_CHECKING:
+    from pathlib import PosixPath
+
+    from ._types import Mount
+
+
+DIRECTIVE = re.compile(r'#\s*([A-Za-z][A-Za-z0-9_-]*)\s*=\s*(.*?)\s*')
+FLAG = re.compile(r'--([A-Za-z][A-Za-z0-9-]*)(?:=(\S*))?(?:\s+|$)')
+# Commands chained with `&&` and split into multiple lines.
+CHAIN = re.compile(r'[ \t]*&&[ \t]*\n[ \t]*|[ \t]*\n[ \t]*&&[ \t]*')
+QUOTED = re.compile(r'"(?:[^"\\]|\\.)*"|\'[^\']*\'')
+VARIABLE = re.compile(r'\$(?:\{([A-Za-z_][A-Za-z0-9_]*)\}|([A-Za-z_][A-Za-z0-9_]*))')
+# Any variable reference, including `${name:-default}` and the like.
+VAR_REF = re.compile(r'\$\{?([A-Za-z_][A-Za-z0-9_]*)')
+URL_PREFIXES = ('http://', 'https://')
+GIT_PREFIXES = ('git@', 'git://', 'ssh://')
+
+Handler = Callable[['_Parser', str], 'list[steps.Step]']
+HANDLERS: dict[str, Handler] = {}
+
+# The allowed values of the flags, in the types the steps expect.
+T = TypeVar('T', bound=str)
+NETWORKS: tuple[Literal['default', 'none', 'host'], ...] = ('default', 'none', 'host')
+SECURITIES: tuple[Literal['insecure', 'sandbox'], ...] = ('insecure', 'sandbox')
+SHARINGS: tuple[Literal['shared', 'private', 'locked'], ...] = ('shared', 'private', 'locked')
+ALGORITHMS: tuple[Literal['sha256', 'sha384', 'sha512', 'blake3'], ...] = ('sha256', 'sha384', 'sha512', 'blake3')
+
+
+class _RunOptions(TypedDict):
+    mount: tuple[Mount, ...] | None
+    network: Literal['default', 'none', 'host']
+    security: Literal['insecure', 'sandbox']
+
+
+class _HealthcheckOptions(TypedDict):
+    interval: str
+    timeout: str
+    start_period: str
+    retries: int
+
+
+class _MountOwner(TypedDict, total=False):
+    id: str
+    mode: int
+    uid: int
+    gid: int
+
+
+def parse_dockerfile(lines: Iterable[str]) -> Image:
+    """Make an Image from the Dockerfile lines.
+
+    The lines can be a text file object, so the file doesn't have to be read
+    into memory at once. Raises ValueError with the line number
+    if an instruction can't be represented by docked objects.
+
+        with open('Dockerfile') as stream:
+            image = d.parse_dockerfile(stream)
+    """
+    parser = _Parser()
+    for lineno, text in parser.iter_instructions(lines):
+        try:
+            parser.feed(text)
+        except ValueError as exc:
+            raise ValueError(f'line {lineno}: {exc}') from exc
+    return parser.make_image()
+
+
+def handler(*names: str) -> Callable[[Handler], Handler]:
+    def wrapper(func: Handler) -> Handler:
+        for name in names:
+            HANDLERS[name] = func
+        return func
+    return wrapper
+
+
+class _Parser:
+    __slots__ = ('escape', 'syntax', 'stages', 'names', 'global_args', 'stage', 'mounts')
+
+    def __init__(self) -> None:
+        self.escape = '\\'
+        self.syntax: str | None = None
+        self.stages: list[Stage] = []
+        self.names: dict[str, Stage] = {}
+        self.global_args: dict[str, str | None] = {}
+        self.stage: Stage | None = None
+        # mounts are immutable, so the same mounts are parsed once and shared
+        self.mounts: dict[str, Mount] = {}
+
+    def iter_instructions(self, lines: Iterable[str]) -> Iterator[tuple[int, str]]:
+        """Join continuation lines and skip comments.
+
+        Yields the line number where the instruction starts and the instruction.
+        Joined lines are separated by a newline (without the escape character),
+        so that the handlers can tell how the instruction was split.
+        """
+        directives = True
+        parts: list[str] = []
+        start = 0
+        for lineno, line in enumerate(_split_lines(lines), start=1):
+            if directives:
+                match = DIRECTIVE.fullmatch(line)
+                if match and self._directive(match.group(1).lower(), match.group(2)):
+                    continue
+                directives = False
+            stripped = line.strip()
+            if not stripped or stripped[0] == '#':
+                # comments and empty lines are skipped even inside of an instruction
+                continue
+            if not parts:
+                start = lineno
+            stripped = line.rstrip()
+            if stripped.endswith(self.escape):
+                parts.append(stripped[:-1])
+                continue
+            parts.append(line)
+            yield start, '\n'.join(parts)
+            parts = []
+        if parts:
+            yield start, '\n'.join(parts)
+
+    def feed(self, text: str) -> None:
+        """Parse a single instruction and add it into the current stage.
+        """
+        keyword, *args = text.split(None, 1)
+        keyword = keyword.upper()
+        rest = args[0] if args else ''
+        if keyword == 'FROM':
+            self._from(rest)
+            return
+        if self.stage is None:
+            if keyword != 'ARG':
+                raise ValueError(f'{keyword} before FROM')
+            for arg in _parse_args(rest, self.escape):
+                self.global_args[arg.name] = arg.default
+            return
+        for step in self.parse_step(keyword, rest):
+            if isinstance(step, steps.RunStep):
+                self.stage.run.append(step)
+            else:
+                assert isinstance(step, steps.BuildStep)
+                self.stage.build.append(step)
+
+    def parse_step(self, keyword: str, rest: str) -> list[steps.Step]:
+        func = HANDLERS.get(keyword)
+        if func is None:
+            raise ValueError(f'unknown instruction {keyword}')
+        return func(self, rest)
+
+    def make_image(self) -> Image:
+        if not self.stages:
+            raise ValueError('no FROM instruction')
+        channel = DEFAULT_CHANNEL
+        version = None
+        if self.syntax:
+            channel, _, version = self.syntax.rpartition(':')
+            if not channel or '/' in version:
+                channel, version = self.syntax, ''
+        image = Image(
+            *self.stages,
+            syntax_channel=channel,
+            syntax_version=version or None,
+            escape=self.escape,
+        )
+        # let docked pick the version if it's the one docked would pick anyway
+        if channel == DEFAULT_CHANNEL and version == image.min_version:
+            image.syntax_version = None
+        return image
+
+    def reference(self, value: str) -> Stage | BaseImage:
+        """Find the stage by its name or index, or else treat it as an image.
+        """
+        stage = self.names.get(value)
+        if stage is not None:
+            return stage
+        if value.isdigit() and int(value) < len(self.stages):
+            stage = self.stages[int(value)]
+            if stage.name:
+                return stage
+        return _parse_image(value)
+
+    def mount(self, value: str) -> Mount:
+        mount = self.mounts.get(value)
+        if mount is None:
+            mount = self.mounts[value] = _parse_mount(self, value)
+        return mount
+
+    def _directive(self, name: str, value: str) -> bool:
+        if name == 'syntax':
+            self.syntax = value
+            return True
+        if name == 'escape':
+            if value not in ('\\', '`'):
+                raise ValueError(f'invalid escape character: {value!r}')
+            self.escape = value
+            return True
+        return False
+
+    def _from(self, text: str) -> None:
+        flags, text = _parse_flags(text, 'platform')
+        platform = dict(flags).get('platform')
+        text = VARIABLE.sub(self._substitute, text)
+        words = text.split()
+        name = ''
+        if len(words) == 3 and words[1].upper() == 'AS':
+            name = words[2]
+        elif len(words) != 1:
+            raise ValueError(f'invalid FROM: {text!r}')
+        base = self.names.get(words[0]) or _parse_image(words[0])
+        stage = Stage(base=base, name=name, platform=platform)
+        self.stages.append(stage)
+        if name:
+            self.names[name] = stage
+        self.stage = stage
+
+    def _substitute(self, match: re.Match) -> str:
+        value = self.global_args.get(match.group(1) or match.group(2))
+        if value is None:
+            return match.group(0)
+        return value
+
+
+@handler('RUN')
+def _run(parser: _Parser, text: str) -> list[steps.Step]:
+    pairs, text = _parse_flags(text, 'mount', 'network', 'security')
+    flags = dict(pairs)
+    mounts = tuple(parser.mount(value) for name, value in pairs if name == 'mount')
+    options = _RunOptions(
+        mount=mounts or None,
+        network=_choice(flags.get('network', 'default'), NETWORKS, 'network'),
+        security=_choice(flags.get('security', 'sandbox'), SECURITIES, 'security'),
+    )
+    cmd = _parse_exec(text)
+    if cmd is not None:
+        return [steps.RUN(cmd, shell=False, **options)]
+    # RUN renders multiple commands as lines joined with `&& \`,
+    # which works only with the default escape character
+    if parser.escape == '\\' and '\n' in text:
+        commands = CHAIN.split(text)
+        if len(commands) > 1 and all(_is_complete(cmd) for cmd in commands):
+            return [steps.RUN(*commands, **options)]
+    return [steps.RUN(text.replace('\n', ''), **options)]
+
+
+@handler('CMD')
+def _cmd(parser: _Parser, text: str) -> list[steps.Step]:
+    cmd = _parse_exec(text)
+    if cmd is None:
+        return [steps.CMD(_join(text), shell=True)]
+    return [steps.CMD(cmd)]
+
+
+@handler('ENTRYPOINT')
+def _entrypoint(parser: _Parser, text: str) -> list[steps.Step]:
+    cmd = _parse_exec(text)
+    if cmd is None:
+        return [steps.ENTRYPOINT(_join(text), shell=True)]
+    return [steps.ENTRYPOINT(cmd)]
+
+
+@handler('SHELL')
+def _shell(parser: _Parser, text: str) -> list[steps.Step]:
+    cmd = _parse_exec(text)
+    if cmd is None:
+        raise ValueError('SHELL must be a JSON array')
+    return [steps.SHELL(cmd)]
+
+
+@handler('HEALTHCHECK')
+def _healthcheck(parser: _Parser, text: str) -> list[steps.Step]:
+    pairs, text = _parse_flags(text, 'interval', 'timeout', 'start-period', 'retries')
+    flags = dict(pairs)
+    options = _HealthcheckOptions(
+        interval=flags.get('interval', '30s'),
+        timeout=flags.get('timeout', '30s'),
+        start_period=flags.get('start-period', '0s'),
+        retries=int(flags.get('retries', 3)),
+    )
+    keyword, _, text = _join(text).partition(' ')
+    keyword = keyword.upper()
+    if keyword == 'NONE':
+        return [steps.HEALTHCHECK(None, **options)]
+    if keyword != 'CMD':
+        raise ValueError('HEALTHCHECK must be followed by CMD or NONE')
+    cmd = _parse_exec(text)
+    if cmd is None:
+        return [steps.HEALTHCHECK(text.strip(), shell=True, **options)]
+    return [steps.HEALTHCHECK(cmd, **options)]
+
+
+@handler('COPY')
+def _copy(parser: _Parser, text: str) -> list[steps.Step]:
+    pairs, text = _parse_flags(text, 'from', 'chown', 'link')
+    flags = dict(pairs)
+    *sources, dst = _parse_paths(text, parser.escape)
+    from_stage = flags.get('from')
+    return [steps.COPY(
+        _sources(sources),
+        dst,
+        chown=flags.get('chown'),
+        link=_parse_bool(flags.get('link')),
+        from_stage=None if from_stage is None else parser.reference(from_stage),
+    )]
+
+
+@handler('ADD')
+def _add(parser: _Parser, text: str) -> list[steps.Step]:
+    pairs, text = _parse_flags(text, 'chown', 'link', 'checksum', 'keep-git-dir')
+    flags = dict(pairs)
+    *sources, dst = _parse_paths(text, parser.escape)
+    src = _sources(sources)
+    chown = flags.get('chown')
+    link = _parse_bool(flags.get('link'))
+    checksum_flag = flags.get('checksum')
+    keep_git_dir = flags.get('keep-git-dir')
+    if keep_git_dir is not None or _is_git(sources[0]):
+        return [steps.CLONE(src, dst, chown=chown, link=link, keep_git_dir=_parse_bool(keep_git_dir))]
+    if checksum_flag is not None or sources[0].startswith(URL_PREFIXES):
+        checksum = None
+        if checksum_flag is not None:
+            algorithm, _, hex = checksum_flag.rpartition(':')
+            checksum = Checksum(hex, algorithm=_choice(algorithm or 'sha256', ALGORITHMS, 'checksum algorithm'))
+        return [steps.DOWNLOAD(src, dst, chown=chown, link=link, checksum=checksum)]
+    return [steps.EXTRACT(src, dst, chown=chown, link=link)]
+
+
+@handler('ARG')
+def _arg(parser: _Parser, text: str) -> list[steps.Step]:
+    result: list[steps.Step] = []
+    for arg in _parse_args(text, parser.escape):
+        if arg.default is None and parser.global_args.get(arg.name) is not None:
+            # the global ARG is redeclared in the stage to inherit its value
+            arg = steps.ARG(arg.name, parser.global_args[arg.name])
+        result.append(arg)
+    return result
+
+
+@handler('ENV')
+def _env(parser: _Parser, text: str) -> list[steps.Step]:
+    text = _join(text)
+    key, _, value = text.partition(' ')
+    if '=' not in key:
+        # the legacy form, `ENV key value`
+        return [steps.ENV(key, value.strip())]
+    pairs = _parse_pairs(text, parser.escape)
+    # All values are expanded before any key of the instruction is set,
+    # so a value referring to a key set before it in the same instruction
+    # would get another value when the pairs are split into separate steps.
+    keys: set[str] = set()
+    for key, value in pairs:
+        for match in VAR_REF.finditer(value):
+            escaped = value[match.start() - 1:match.start()] == parser.escape
+            if match.group(1) in keys and not escaped:
+                raise ValueError(f'ENV value refers to {match.group(1)} set by the same instruction')
+        keys.add(key)
+    return [steps.ENV(key, value) for key, value in pairs]
+
+
+@handler('LABEL')
+def _label(parser: _Parser, text: str) -> list[steps.Step]:
+    assert parser.stage is not None
+    parser.stage.labels.update(_parse_pairs(_join(text), parser.escape))
+    return []
+
+
+@handler('MAINTAINER')
+def _maintainer(parser: _Parser, text: str) -> list[steps.Step]:
+    assert parser.stage is not None
+    parser.stage.labels['maintainer'] = _join(text)
+    return []
+
+
+@handler('EXPOSE')
+def _expose(parser: _Parser, text: str) -> list[steps.Step]:
+    result: list[steps.Step] = []
+    for word in text.split():
+        port, _, protocol = word.partition('/')
+        result.append(steps.EXPOSE(int(port), protocol.lower() or 'tcp'))  # type: ignore[arg-type]
+    return result
+
+
+@handler('VOLUME')
+def _volume(parser: _Parser, text: str) -> list[steps.Step]:
+    return [steps.VOLUME(*_parse_paths(text, parser.escape))]
+
+
+@handler('USER')
+def _user(parser: _Parser, text: str) -> list[steps.Step]:
+    user, _, group = _join(text).partition(':')
+    return [steps.USER(user, group or None)]
+
+
+@handler('WORKDIR')
+def _workdir(parser: _Parser, text: str) -> list[steps.Step]:
+    return [steps.WORKDIR(_join(text))]
+
+
+@handler('STOPSIGNAL')
+def _stopsignal(parser: _Parser, text: str) -> list[steps.Step]:
+    return [steps.STOPSIGNAL(_join(text))]
+
+
+@handler('ONBUILD')
+def _onbuild(parser: _Parser, text: str) -> list[steps.Step]:
+    keyword, _, rest = _join(text).partition(' ')
+    keyword = keyword.upper()
+    if keyword in ('FROM', 'ONBUILD', 'LABEL', 'MAINTAINER'):
+        raise ValueError(f'{keyword} is not supported in ONBUILD')
+    triggers = parser.parse_step(keyword, rest.strip())
+    if len(triggers) != 1:
+        raise ValueError('ONBUILD must have exactly one instruction')
+    return [steps.ONBUILD(triggers[0])]  # type: ignore[arg-type]
+
+
+def _parse_flags(text: str, *allowed: str) -> tuple[list[tuple[str, str]], str]:
+    """Extract the flags from the start of the instruction arguments.
+
+    A flag can be repeated (like ``--mount``), so the flags are returned as pairs.
+    A flag without a value (like ``--link``) has value "true".
+    """
+    flags = []
+    text = text.strip()
+    pos = 0
+    while text.startswith('--', pos):
+        match = FLAG.match(text, pos)
+        if match is None:
+            break
+        name, value = match.groups()
+        if name not in allowed:
+            raise ValueError(f'unsupported flag --{name}')
+        flags.append((name, 'true' if value is None else value))
+        pos = match.end()
+    return flags, text[pos:]
+
+
+def _parse_mount(parser: _Parser, value: str) -> Mount:
+    options: dict[str, str] = {}
+    for option in value.split(','):
+        key, sep, val = option.partition('=')
+        options[key.lower()] = val if sep else 'true'
+    kind = options.pop('type', 'bind')
+    target = _pop(options, 'target', 'dst', 'destination')
+    source = _pop(options, 'source', 'src')
+    from_stage = options.pop('from', None)
+    readonly = _parse_bool(_pop(options, 'ro', 'readonly'))
+    readwrite = _parse_bool(_pop(options, 'rw', 'readwrite'))
+    owner = _MountOwner()
+    if 'id' in options:
+        owner['id'] = options.pop('id')
+    if 'uid' in options:
+        owner['uid'] = int(options.pop('uid'))
+    if 'gid' in options:
+        owner['gid'] = int(options.pop('gid'))
+    if 'mode' in options:
+        owner['mode'] = int(options.pop('mode'), 8)
+    required = _parse_bool(options.pop('required', None))
+    sharing = _choice(options.pop('sharing', 'shared'), SHARINGS, 'sharing')
+    size = options.pop('size', None)
+    if options:
+        raise ValueError(f'unsupported mount option {next(iter(options))}')
+
+    reference = None if from_stage is None else parser.reference(from_stage)
+    if kind in ('bind', 'cache', 'tmpfs') and not target:
+        raise ValueError(f'target is required for {kind} mount')
+    if kind == 'bind':
+        assert target
+        return BindMount(target, source=source, from_stage=reference, allow_write=readwrite)
+    if kind == 'cache':
+        assert target
+        return CacheMount(
+            target,
+            allow_write=not readonly,
+            sharing=sharing,
+            from_stage=reference,
+            source=source,
+            **owner,
+        )
+    if kind == 'tmpfs':
+        assert target
+        return TmpFSMount(target, size=size)
+    if kind == 'secret':
+        return SecretMount(target, required=required, **owner)
+    if kind == 'ssh':
+        return SSHMount(target, required=required, **owner)
+    raise ValueError(f'unsupported mount type {kind}')
+
+
+def _pop(options: dict[str, str], *keys: str) -> str | None:
+    """Pop the value of the option that has aliases.
+    """
+    result = None
+    for key in keys:
+        value = options.pop(key, None)
+        if result is None:
+            result = value
+    return result
+
+
+def _parse_image(value: str) -> BaseImage:
+    if '@' in value:
+        name, _, digest = value.partition('@')
+        return BaseImage(name, digest=digest)
+    name, sep, tag = value.rpartition(':')
+    if not sep or '/' in tag:
+        # no tag, and the colon (if any) is a registry port
+        return BaseImage(value)
+    return BaseImage(name, tag)
+
+
+def _parse_exec(text: str) -> list[str] | None:
+    """Parse the exec (JSON) form of the command, or return None for the shell form.
+    """
+    text = text.strip()
+    if not text.startswith('['):
+        return None
+    try:
+        cmd = json.loads(text.replace('\n', ''))
+    except ValueError:
+        return None
+    if not isinstance(cmd, list) or not all(isinstance(part, str) for part in cmd):
+        return None
+    return cmd
+
+
+def _parse_paths(text: str, escape: str) -> list[str]:
+    paths = _parse_exec(text)
+    if paths is None:
+        paths = _split_words(_join(text), escape)
+    if not paths:
+        raise ValueError('no paths specified')
+    return paths
+
+
+def _parse_args(text: str, escape: str) -> list[steps.ARG]:
+    result = []
+    for word in _split_words(_join(text), escape):
+        name, sep, default = word.partition('=')
+        result.append(steps.ARG(name, default if sep else None))
+    return result
+
+
+def _parse_pairs(text: str, escape: str) -> list[tuple[str, str]]:
+    result = []
+    for word in _split_words(text, escape):
+        key, sep, value = word.partition('=')
+        if not sep:
+            raise ValueError(f'expected key=value, got {word!r}')
+        result.append((key, value))
+    return result
+
+
+def _split_words(text: str, escape: str) -> list[str]:
+    """Split the text by whitespace and remove quotes.
+
+    The escape character is removed only before quotes, whitespace, and itself.
+    Before anything else it is kept, because it means something
+    for the value (like ``\\$`` to avoid variable substitution).
+    """
+    if escape not in text and '"' not in text and "'" not in text:
+        return text.split()
+    words: list[str] = []
+    word: list[str] = []
+    in_word = False
+    quote = ''
+    chars = iter(text)
+    for char in chars:
+        if char == escape and quote != "'":
+            in_word = True
+            char = next(chars, '')
+            if not (char.isspace() or char in ('"', "'", escape)):
+                word.append(escape)
+            word.append(char)
+        elif quote:
+            if char == quote:
+                quote = ''
+            else:
+                word.append(char)
+        elif char in ('"', "'"):
+            in_word = True
+            quote = char
+        elif char.isspace():
+            if in_word:
+                words.append(''.join(word))
+                word = []
+                in_word = False
+        else:
+            in_word = True
+            word.append(char)
+    if quote:
+        raise ValueError('unterminated quote')
+    if in_word:
+        words.append(''.join(word))
+    return words
+
+
+def _split_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Split the multiline strings, like the ones from ``Image.iter_lines``.
+    """
+    for line in lines:
+        if '\n' in line.rstrip('\r\n'):
+            yield from line.splitlines()
+        else:
+            yield line.rstrip('\r\n')
+
+
+def _is_complete(cmd: str) -> bool:
+    """Check that the shell command is on a single line and all quotes are closed.
+    """
+    if '\n' in cmd:
+        return False
+    unquoted = QUOTED.sub('', cmd)
+    return '"' not in unquoted and "'" not in unquoted
+
+
+def _sources(sources: list[str]) -> str | list[str | PosixPath]:
+    if len(sources) == 1:
+        return sources[0]
+    return list(sources)
+
+
+def _choice(value: str, choices: tuple[T, ...], name: str) -> T:
+    """The value if it's one of the choices, with the type of the choices.
+    """
+    for choice in choices:
+        if choice == value:
+            return choice
+    raise ValueError(f'unsupported {name} {value!r}')
+
+
+def _is_git(source: str) -> bool:
+    if source.startswith(GIT_PREFIXES):
+        return True
+    return source.startswith(URL_PREFIXES) and source.split('#', 1)[0].endswith('.git')
+
+
+def _parse_bool(value: str | None) -> bool:
+    if value is None:
+        return False
+    return value.lower() in ('', 'true', '1')
+
+
+def _join(text: str) -> str:
+    """Join the lines of the instruction back, the way Docker does.
+    """
+    return text.replace('\n', '').strip()
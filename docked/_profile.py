@@ -0,0 +1,236 @@
+"""Parse the BuildKit progress and map it back to the steps of an Image.
+
+``docker buildx build --progress=rawjson`` writes into stderr a JSON object
+per line describing what changed in the build graph. Each node of the graph
+(vertex) is named after the instruction that produced it, like
+``[build 2/5] RUN make``: the stage name, the index of the instruction
+among the ones producing nodes in the stage, and the instruction itself.
+In multi-platform builds, the name starts with the platform, like
+``[linux/arm64 build 2/5]``, or ``[linux/amd64->arm64 build 2/5]``
+for a cross-compilation stage running on amd64 to build for arm64.
+"""
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterable
+
+from ._steps import CLONE, COPY, DOWNLOAD, EXTRACT, RUN, WORKDIR
+
+
+if TYPE_CHECKING:
+    from ._image import Image
+    from ._stage import Stage
+    from ._steps import Step
+
+
+# Steps that produce a node in the build graph.
+OP_STEPS = (RUN, COPY, EXTRACT, DOWNLOAD, CLONE, WORKDIR)
+VERTEX_NAME = re.compile(r'''
+    \[
+    (?:(?P<platform>[^\s\]]+/[^\s\]]+)\s)?  # linux/amd64 or linux/amd64->arm64
+    (?:(?P<stage>[^\s\]]+)\s+)?             # build
+    (?P<index>\d+)/(?P<total>\d+)           # 2/5
+    \]\s(?P<command>.*)                     # RUN make
+''', re.VERBOSE | re.DOTALL)
+TIMESTAMP = re.compile(r'(?P<base>[^.Z+]+)(?:\.(?P<fraction>\d+))?(?P<tz>Z|[+-]\d\d:\d\d)?')
+
+
+@dataclass(frozen=True)
+class StepTiming:
+    """How long a single node of the build graph took.
+
+    ``stage`` and ``step`` are None for the nodes not produced by the Dockerfile
+    steps, like loading the build context. The ``step`` is also None
+    for pulling the base image of the stage. The ``platform`` is the target
+    platform of the node in multi-platform builds, and ``start`` is
+    when the node started, in seconds since the first node started.
+    """
+    name: str
+    stage: Stage | None
+    step: Step | None
+    duration: float
+    cached: bool
+    error: str | None = None
+    platform: str | None = None
+    start: float = 0.
+
+    def __str__(self) -> str:
+        status = 'CACHED' if self.cached else 'ERROR' if self.error else ''
+        return f'{self.duration:8.3f}s {status:6} {self.name.splitlines()[0]}'
+
+
+@dataclass(frozen=True)
+class BuildProfile:
+    """Timings of all nodes of the build graph, in the order they started.
+    """
+    timings: tuple[StepTiming, ...]
+    returncode: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+    @property
+    def steps(self) -> tuple[StepTiming, ...]:
+        """Timings of the nodes produced by the Dockerfile steps.
+        """
+        return tuple(t for t in self.timings if t.stage is not None)
+
+    @property
+    def misses(self) -> tuple[StepTiming, ...]:
+        """Timings of the steps that weren't taken from the cache.
+        """
+        return tuple(t for t in self.steps if not t.cached)
+
+    @property
+    def durations(self) -> dict[Step, float]:
+        """How long each step took to build, for the steps not taken from the cache.
+
+        Steps are compared by the generated instruction, so the result
+        can be used for the same steps in other images.
+        See ``docked.find_shared_prefixes``.
+        """
+        return {t.step: t.duration for t in self.misses if t.step is not None}
+
+    @property
+    def platforms(self) -> dict[str, float]:
+        """How long the build took for each platform of a multi-platform build.
+
+        It's the time between the first node of the platform started
+        and the last one completed, in seconds. Nodes shared by all platforms,
+        like loading the build context, are not counted.
+        """
+        spans: dict[str, tuple[float, float]] = {}
+        for timing in self.timings:
+            if timing.platform is None:
+                continue
+            end = timing.start + timing.duration
+            first, last = spans.get(timing.platform, (timing.start, end))
+            spans[timing.platform] = (min(first, timing.start), max(last, end))
+        return {platform: last - first for platform, (first, last) in spans.items()}
+
+    def slowest(self, count: int = 5) -> list[StepTiming]:
+        """The steps that took the most time, slowest first.
+        """
+        return sorted(self.steps, key=lambda t: t.duration, reverse=True)[:count]
+
+    def get(self, step: Step) -> StepTiming | None:
+        """The timing of the given step, if it was built.
+        """
+        for timing in self.timings:
+            if timing.step is step:
+                return timing
+        return None
+
+    def __str__(self) -> str:
+        return '\n'.join(str(timing) for timing in self.timings)
+
+
+def parse_progress(lines: Iterable[str], image: Image) -> BuildProfile:
+    """Parse the output of ``docker buildx build --progress=rawjson``.
+
+    The ``image`` must be the one that was built, with the same stages
+    as in the built Dockerfile. Lines that are not JSON are skipped.
+    """
+    vertices: dict[str, dict] = {}
+    for line in lines:
+        line = line.strip()
+        if not line.startswith('{'):
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        # the same vertex is reported again each time something about it changes
+        for vertex in event.get('vertexes') or ():
+            merged = vertices.setdefault(vertex['digest'], {})
+            merged.update({k: v for k, v in vertex.items() if v not in (None, '')})
+
+    stages = {stage.name: stage for stage in image.stages}
+    started_vertices = []
+    for vertex in vertices.values():
+        started = vertex.get('started')
+        if started is not None:
+            started_vertices.append((_parse_time(started), vertex))
+    started_vertices.sort(key=lambda pair: pair[0])
+    timings = []
+    for started, vertex in started_vertices:
+        completed = vertex.get('completed')
+        name = vertex.get('name', '')
+        stage: Stage | None = None
+        step: Step | None = None
+        platform = None
+        match = VERTEX_NAME.fullmatch(name)
+        if match is not None:
+            stage, step = _find_step(match, image, stages)
+            platform = _target_platform(match.group('platform'))
+        timings.append(StepTiming(
+            name=name,
+            stage=stage,
+            step=step,
+            duration=0. if completed is None else (_parse_time(completed) - started).total_seconds(),
+            cached=bool(vertex.get('cached')),
+            error=vertex.get('error'),
+            platform=platform,
+            start=(started - started_vertices[0][0]).total_seconds(),
+        ))
+    return BuildProfile(timings=tuple(timings))
+
+
+def _target_platform(platform: str | None) -> str | None:
+    """The platform to build for, ``linux/arm64`` for ``linux/amd64->arm64``.
+    """
+    if platform is None or '->' not in platform:
+        return platform
+    build, _, target = platform.partition('->')
+    os = build.split('/')[0]
+    if target.startswith(f'{os}/'):
+        return target
+    return f'{os}/{target}'
+
+
+def _find_step(
+    match: re.Match,
+    image: Image,
+    stages: dict[str, Stage],
+) -> tuple[Stage | None, Step | None]:
+    stage_name = match.group('stage')
+    if stage_name is None:
+        if len(image.stages) != 1:
+            return None, None
+        stage = image.stages[0]
+    elif stage_name in stages:
+        stage = stages[stage_name]
+    elif stage_name.startswith('stage-') and stage_name[6:].isdigit():
+        # unnamed stages are named by their index
+        index = int(stage_name[6:])
+        if index >= len(image.stages):
+            return None, None
+        stage = image.stages[index]
+    else:
+        return None, None
+    ops = [step for step in stage.build if isinstance(step, OP_STEPS)]
+    # FROM is also counted if it pulls an image
+    offset = int(match.group('total')) - len(ops)
+    index = int(match.group('index')) - 1 - offset
+    if index < 0:
+        return stage, None
+    if index >= len(ops):
+        return None, None
+    return stage, ops[index]
+
+
+def _parse_time(value: str) -> datetime:
+    """Parse RFC 3339 timestamp, with nanoseconds, the way Go formats it.
+    """
+    match = TIMESTAMP.fullmatch(value)
+    if match is None:
+        raise ValueError(f'invalid timestamp: {value!r}')
+    fraction = (match.group('fraction') or '0')[:6].ljust(6, '0')
+    tz = match.group('tz') or '+00:00'
+    if tz == 'Z':
+        tz = '+00:00'
+    return datetime.fromisoformat(f'{match.group("base")}.{fraction}{tz}')
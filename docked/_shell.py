@@ -0,0 +1,167 @@
+"""Parsed representation of shell commands of RUN.
+
+The parsing is static and approximate: it splits the command into simple commands
+by control operators but doesn't look into subshells, functions, loops, or conditions.
+"""
+from __future__ import annotations
+
+import re
+import shlex
+from dataclasses import dataclass
+
+
+# Operators that separate simple commands.
+OPERATORS = frozenset({'&&', '||', ';', ';;', '&', '|', '|&', '(', ')'})
+REDIRECTS = frozenset({'>', '>>', '<', '<<', '<<<', '>&', '<&', '&>', '&>>', '>|'})
+# Reserved words that can go before a command.
+PREFIXES = frozenset({'!', '{', '}', 'then', 'do', 'else', 'time'})
+ASSIGNMENT = re.compile(r'[A-Za-z_][A-Za-z0-9_]*=')
+PYTHON = re.compile(r'python[0-9.]*')
+# Options of sudo that take a value.
+SUDO_OPTIONS = frozenset({'-u', '-g', '-C', '-D', '-h', '-p', '-r', '-t', '-U'})
+# Without quotes, escapes, and comments, the words and operators are
+# what shlex produces, and the regex finds them many times faster.
+SHLEX_CHARS = re.compile(r'[\'"\\#]')
+TOKEN = re.compile(r'[();<>|&]+|[^ \t\r\n();<>|&]+')
+
+
+@dataclass(frozen=True)
+class SimpleCommand:
+    """A single program call with its arguments.
+
+    ``argv`` is the command as written, without redirections.
+    ``program`` and ``args`` are normalized: without leading variable assignments
+    and ``sudo``, with the directory stripped from the program path,
+    and ``python -m pip`` is treated as ``pip``.
+    """
+    argv: tuple[str, ...]
+    program: str
+    args: tuple[str, ...]
+    env: tuple[str, ...] = ()
+    sudo: bool = False
+
+    @property
+    def subcommand(self) -> str | None:
+        """The first argument that is not an option, like ``install`` in ``apt-get -y install``.
+        """
+        for arg in self.args:
+            if not arg.startswith('-'):
+                return arg
+        return None
+
+
+@dataclass(frozen=True)
+class ParsedRun:
+    """Parsed shell commands of a RUN step.
+
+    The commands passed into RUN as separate arguments are chained with ``&&``,
+    the same way as they are rendered. ``valid`` is False if the command
+    can't be tokenized (for example, because of unbalanced quotes),
+    and then there are no commands.
+    """
+    commands: tuple[SimpleCommand, ...]
+    chains: tuple[tuple[SimpleCommand, ...], ...]
+    operators: frozenset[str]
+    valid: bool = True
+
+    def find(self, program: str) -> tuple[SimpleCommand, ...]:
+        """All calls of the given program.
+        """
+        return tuple(cmd for cmd in self.commands if cmd.program == program)
+
+
+def parse_run(first: str | list[str], rest: tuple[str, ...] = (), *, shell: bool = True) -> ParsedRun:
+    """Parse the commands of RUN.
+    """
+    if not isinstance(first, str):
+        if shell:
+            first = shlex.join(first)
+        else:
+            # exec form, no shell involved
+            cmd = _simple_command(tuple(first))
+            exec_commands = (cmd,) if cmd is not None else ()
+            return ParsedRun(commands=exec_commands, chains=(exec_commands,), operators=frozenset())
+    try:
+        tokens = tokenize(' && '.join((first,) + rest))
+    except ValueError:
+        return ParsedRun(commands=(), chains=(), operators=frozenset(), valid=False)
+
+    commands: list[SimpleCommand] = []
+    chains: list[tuple[SimpleCommand, ...]] = []
+    operators: set[str] = set()
+    chain: list[SimpleCommand] = []
+    words: list[str] = []
+    tokens_iter = iter(tokens)
+    for token in tokens_iter:
+        if token in REDIRECTS:
+            # skip the redirect target
+            next(tokens_iter, None)
+            continue
+        if token not in OPERATORS:
+            words.append(token)
+            continue
+        operators.add(token)
+        cmd = _simple_command(tuple(words))
+        words = []
+        if cmd is not None:
+            commands.append(cmd)
+            chain.append(cmd)
+        if token != '&&' and chain:
+            chains.append(tuple(chain))
+            chain = []
+    cmd = _simple_command(tuple(words))
+    if cmd is not None:
+        commands.append(cmd)
+        chain.append(cmd)
+    if chain:
+        chains.append(tuple(chain))
+    return ParsedRun(
+        commands=tuple(commands),
+        chains=tuple(chains),
+        operators=frozenset(operators),
+    )
+
+
+def tokenize(cmd: str) -> list[str]:
+    """Split the shell command into words and operators. Comments are skipped.
+    """
+    if SHLEX_CHARS.search(cmd) is None:
+        return TOKEN.findall(cmd)
+    lexer = shlex.shlex(cmd, posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    return list(lexer)
+
+
+def _simple_command(argv: tuple[str, ...]) -> SimpleCommand | None:
+    while argv and argv[0] in PREFIXES:
+        argv = argv[1:]
+    if not argv:
+        return None
+    words = list(argv)
+    env = []
+    while words and ASSIGNMENT.match(words[0]):
+        env.append(words.pop(0))
+    sudo = False
+    if words and words[0] == 'sudo':
+        sudo = True
+        words.pop(0)
+        while words and words[0].startswith('-'):
+            option = words.pop(0)
+            if option in SUDO_OPTIONS and words:
+                words.pop(0)
+        while words and ASSIGNMENT.match(words[0]):
+            env.append(words.pop(0))
+    if not words:
+        return SimpleCommand(argv=argv, program='', args=(), env=tuple(env), sudo=sudo)
+    program = words[0].rsplit('/', 1)[-1]
+    args = words[1:]
+    if PYTHON.fullmatch(program) and len(args) >= 2 and args[0] == '-m':
+        program = args[1]
+        args = args[2:]
+    return SimpleCommand(
+        argv=argv,
+        program=program,
+        args=tuple(args),
+        env=tuple(env),
+        sudo=sudo,
+    )
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
-from itertools import chain
-from typing import TYPE_CHECKING, Iterator
+from typing import TYPE_CHECKING, Hashable, Iterator
 
-from ._steps import BuildStep, RunStep, Step
+from ._formatters import format_stage_name
+from ._steps import ONBUILD, BuildStep, RunStep, Step
 
 
 if TYPE_CHECKING:
+    from typing import Mapping
+
+    from ._optimizers import Reordering
     from ._types import BaseImage
 
 
@@ -28,8 +31,12 @@ class Stage:
         run: Steps that affect how container based on the image will be ran.
         labels: meta information associated with the resulting image.
             Corresponds to LABEL instruction in Dockerfile.
+
+    The rendered Dockerfile lines are cached. The cache is dropped as soon as
+    any attribute of the stage is reassigned or any step is added, removed,
+    or replaced in ``build`` or ``run``.
     """
-    __slots__ = ('name', 'base', 'platform', 'build', 'run', 'labels')
+    __slots__ = ('name', 'base', 'platform', 'build', 'run', 'labels', '_cache', '_referred')
 
     def __init__(
         self,
@@ -47,6 +54,8 @@ class Stage:
         self.build = build or []
         self.run = run or []
         self.labels = labels or {}
+        self._cache: tuple[Hashable, tuple[str, ...], str] | None = None
+        self._referred: tuple[tuple[BuildStep, ...], tuple[Stage, ...], tuple[Stage, ...]] | None = None
 
     def as_str(self) -> str:
         """Represent the stage as valid Dockerfile syntax.
@@ -58,13 +67,7 @@ class Stage:
 
         Useful for generating big stages without putting too much into memory.
         """
-        yield self._from
-        yield from self._labels
-        step: Step
-        for step in self.build:
-            yield step.as_str()
-        for step in self.run:
-            yield step.as_str()
+        yield from self._render()[0]
 
     @property
     def all_steps(self) -> Iterator[Step]:
@@ -73,19 +76,131 @@ class Stage:
         yield from self.build
         yield from self.run
 
+    @property
+    def dependencies(self) -> tuple[Stage, ...]:
+        """Other stages this stage refers to.
+
+        It includes the base stage and stages used in ``COPY --from``
+        and in ``RUN --mount=from=...``.
+        """
+        result: dict[Stage, None] = {}
+        if isinstance(self.base, Stage):
+            result[self.base] = None
+        result.update(dict.fromkeys(self._referred_stages(tuple(self.build))[1]))
+        return tuple(result)
+
+    def reorder(
+        self,
+        churn: Mapping[str, float] | None = None,
+        *,
+        explicit_paths: bool = False,
+    ) -> Reordering:
+        """Find an order of ``build`` steps that keeps the build cache valid for longer.
+
+        Steps that change often (like copying the source code) are moved
+        as late as possible without changing what the other steps can see.
+        The stage itself is not changed, assign ``build`` from the result to apply it.
+
+        By default, a RUN may read any file, so a COPY is never moved past it,
+        even if the command doesn't use the copied files. Pass ``explicit_paths``
+        to move COPY past RUN commands that don't mention the destination.
+        ENV and ARG steps are never moved past RUN since the command
+        sees all of them as environment variables.
+
+        Args:
+            churn: how often each file in the build context changes,
+                as a fraction of builds (or commits). Used to estimate
+                how often each COPY invalidates the cache.
+                See ``docked.git_churn``.
+            explicit_paths: assume that RUN reads only its working directory
+                and the absolute paths mentioned in the command. By default,
+                RUN may read any file, and steps that write files
+                are never moved across it.
+        """
+        from ._optimizers import reorder
+        return reorder(self, churn, explicit_paths=explicit_paths)
+
+    def merge_runs(self) -> int:
+        """Merge adjacent RUN steps in ``build`` into one RUN where it is safe.
+
+        Each RUN produces a new layer, so merging them makes the build faster
+        and the image smaller. RUNs are merged only if they have the same
+        mount, network, and security options, and all their commands are
+        in the shell form and can be safely chained with ``&&``.
+        A command that changes the shell state (like ``cd``, ``export``, or ``A=1``)
+        or ends the shell (``exit`` or ``exec``) isn't merged with the commands after it.
+
+        Returns the number of removed layers.
+        """
+        from ._optimizers import merge_runs
+        return merge_runs(self)
+
     @property
     def min_version(self) -> str:
         """The minimal syntax version required for the Stage.
         """
-        versions = (step.min_version for step in chain(self.build, self.run))
-        return max(versions, default='1.0')
+        return self._render()[1]
+
+    @property
+    def _cache_key(self) -> Hashable:
+        """A cheap key that changes when the rendered stage might change.
+
+        Steps are immutable, so comparing the keys boils down
+        to comparing references to the same objects.
+        """
+        build = tuple(self.build)
+        return (
+            self.name,
+            format_stage_name(self.base),
+            self.platform,
+            # steps referring to other stages render their current names
+            tuple(stage.name for stage in self._referred_stages(build)[0]),
+            build,
+            tuple(self.run),
+            tuple(self.labels.items()),
+        )
+
+    def _referred_stages(self, build: tuple[BuildStep, ...]) -> tuple[tuple[Stage, ...], tuple[Stage, ...]]:
+        """Stages whose names the given build steps render, and the ones they use.
+
+        The stages in ONBUILD are used only by the images built from this one.
+        Looked up again only when the steps change, not on every render.
+        """
+        referred = self._referred
+        if referred is None or referred[0] != build:
+            rendered: dict[Stage, None] = {}
+            used: dict[Stage, None] = {}
+            for step in build:
+                step_stages = step._stages
+                if step_stages:
+                    rendered.update(dict.fromkeys(step_stages))
+                    if not isinstance(step, ONBUILD):
+                        used.update(dict.fromkeys(step_stages))
+            referred = self._referred = (build, tuple(rendered), tuple(used))
+        return referred[1], referred[2]
+
+    def _render(self) -> tuple[tuple[str, ...], str]:
+        key = self._cache_key
+        cache = self._cache
+        if cache is not None and cache[0] == key:
+            return cache[1], cache[2]
+        lines = [self._from]
+        lines.extend(self._labels)
+        versions = ['1.0']
+        step: Step
+        for step in self.all_steps:
+            lines.append(str(step))
+            versions.append(step.min_version)
+        result = (tuple(lines), max(versions))
+        self._cache = (key, *result)
+        return result
 
     @property
     def _from(self) -> str:
         result = 'FROM'
         if self.platform:
             result += f' --platform={self.platform}'
-        result += f' {self.base}'
+        result += f' {format_stage_name(self.base)}'
         if self.name:
             result += f' AS {self.name}'
         return result
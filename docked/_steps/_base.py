@@ -1,14 +1,29 @@
 from __future__ import annotations
 
+from typing import TYPE_CHECKING
 
-class Step:
+from .._types import _Immutable
+
+
+if TYPE_CHECKING:
+    from .._stage import Stage
+
+
+class Step(_Immutable):
     """A single Dockerfile instruction.
 
     Some instructions can have multiple Steps associated with them,
     to have a single responsibility.
+
+    Steps are immutable values: two steps of the same type that produce
+    the same instruction are equal and have the same hash. The rendered
+    instruction is cached on the first use, unless the step refers to a Stage:
+    the stage can be renamed later. For the same reason, such steps are
+    equal only if they refer to the same Stage objects, and are hashed by them.
     """
 
-    __slots__ = ()
+    __slots__ = ('_rendered', '__weakref__')
+    _rendered: str
 
     def as_str(self) -> str:
         raise NotImplementedError
@@ -17,8 +32,51 @@ class Step:
     def min_version(self) -> str:
         return '1.0'
 
+    @property
+    def fingerprint(self) -> str:
+        """Stable hash of the step content.
+
+        It stays the same across Python processes and interpreter restarts.
+        """
+        from hashlib import sha256
+        content = f'{type(self).__name__}\n{self}'
+        return sha256(content.encode()).hexdigest()
+
+    def __eq__(self, other: object) -> bool:
+        if type(self) is not type(other):
+            return NotImplemented
+        assert isinstance(other, Step)
+        if self._stages != other._stages:
+            return False
+        return str(self) == str(other)
+
+    def __hash__(self) -> int:
+        stages = self._stages
+        if stages:
+            return hash((type(self), stages))
+        return hash((type(self), str(self)))
+
     def __str__(self) -> str:
-        return self.as_str()
+        try:
+            return self._rendered
+        except AttributeError:
+            pass
+        rendered = self.as_str()
+        if not self._stages:
+            object.__setattr__(self, '_rendered', rendered)
+        return rendered
+
+    @property
+    def _stages(self) -> tuple[Stage, ...]:
+        """Stages whose names the rendered step includes.
+        """
+        return ()
+
+    @property
+    def _refers_stage(self) -> bool:
+        """True if the rendered step includes the name of a Stage.
+        """
+        return bool(self._stages)
 
     def __repr__(self) -> str:
         return f'{type(self).__name__}(...)'
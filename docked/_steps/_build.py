@@ -1,16 +1,17 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
 from pathlib import PosixPath
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Sequence
 
 from .._formatters import format_shell_cmd, format_stage_name, json_if_spaces
+from .._types import _is_stage, _repr
 from ._base import BuildStep
 
 
 if TYPE_CHECKING:
     from typing import Literal
 
+    from .._shell import ParsedRun
     from .._stage import Stage
     from .._types import BaseImage, Checksum, Mount
 
@@ -41,15 +42,18 @@ class ARG(BuildStep):
 class RUN(BuildStep):
     """Execute any commands in a new layer on top of the current image and commit the results.
 
+    The ``mount`` can be a single Mount or a sequence of them.
+
     https://docs.docker.com/engine/reference/builder/#run
     """
-    __slots__ = ('first', 'rest', 'mount', 'network', 'security', 'shell')
+    __slots__ = ('first', 'rest', 'mount', 'network', 'security', 'shell', '_parsed')
+    _parsed: ParsedRun
 
     def __init__(
         self,
         first: str | list[str],
         *rest: str,
-        mount: Mount | None = None,
+        mount: Mount | Sequence[Mount] | None = None,
         network: Literal['default', 'none', 'host'] = 'default',
         security: Literal['insecure', 'sandbox'] = 'sandbox',
         shell: bool = True,
@@ -59,6 +63,8 @@ class RUN(BuildStep):
             raise ValueError('cannot use `shell=False` with multiple commands')
         self.first = first
         self.rest = rest
+        if isinstance(mount, Sequence):
+            mount = tuple(mount) or None
         self.mount = mount
         self.network = network
         self.security = security
@@ -66,8 +72,8 @@ class RUN(BuildStep):
 
     def as_str(self) -> str:
         result = 'RUN'
-        if self.mount is not None:
-            result += f' --mount={self.mount}'
+        for mount in self.mounts:
+            result += f' --mount={mount}'
         if self.network != 'default':
             result += f' --network={self.network}'
         if self.security != 'sandbox':
@@ -78,6 +84,44 @@ class RUN(BuildStep):
             result += ' ' + format_shell_cmd(self.first, shell=self.shell)
         return result
 
+    @property
+    def parsed(self) -> ParsedRun:
+        """The shell commands of the step, parsed.
+
+        Parsed on the first use and cached, so all checks and optimizers
+        share the result instead of tokenizing the commands again.
+        """
+        try:
+            return self._parsed
+        except AttributeError:
+            pass
+        from .._shell import parse_run
+        parsed = parse_run(self.first, self.rest, shell=self.shell)
+        object.__setattr__(self, '_parsed', parsed)
+        return parsed
+
+    @property
+    def _stages(self) -> tuple[Stage, ...]:
+        mount = self.mount
+        if mount is None:
+            return ()
+        if not isinstance(mount, tuple):
+            return mount._stages
+        stages: tuple[Stage, ...] = ()
+        for item in mount:
+            stages += item._stages
+        return stages
+
+    @property
+    def mounts(self) -> tuple[Mount, ...]:
+        """All mounts of the step, as a tuple.
+        """
+        if self.mount is None:
+            return ()
+        if isinstance(self.mount, tuple):
+            return self.mount
+        return (self.mount,)
+
     @property
     def min_version(self) -> str:
         if self.security != 'sandbox':
@@ -113,12 +157,23 @@ class ENV(BuildStep):
         return result
 
 
-@dataclass(repr=False)
 class _BaseAdd(BuildStep):
-    src: str | PosixPath | list[str | PosixPath]
-    dst: str | PosixPath
-    chown: str | int | None = None
-    link: bool = False
+    __slots__ = ('src', 'dst', 'chown', 'link')
+
+    def __init__(
+        self,
+        src: str | PosixPath | list[str | PosixPath],
+        dst: str | PosixPath,
+        chown: str | int | None = None,
+        link: bool = False,
+    ) -> None:
+        self.src = src
+        self.dst = dst
+        self.chown = chown
+        self.link = link
+
+    def __repr__(self) -> str:
+        return _repr(self)
 
     def as_str(self) -> str:
         result = ''
@@ -142,13 +197,23 @@ class _BaseAdd(BuildStep):
         return '1.0'
 
 
-@dataclass
 class DOWNLOAD(_BaseAdd):
     """Download a remote file.
 
     https://docs.docker.com/engine/reference/builder/#add
     """
-    checksum: Checksum | None = None
+    __slots__ = ('checksum',)
+
+    def __init__(
+        self,
+        src: str | PosixPath | list[str | PosixPath],
+        dst: str | PosixPath,
+        chown: str | int | None = None,
+        link: bool = False,
+        checksum: Checksum | None = None,
+    ) -> None:
+        super().__init__(src, dst, chown, link)
+        self.checksum = checksum
 
     def as_str(self) -> str:
         result = 'ADD'
@@ -163,7 +228,6 @@ class DOWNLOAD(_BaseAdd):
         return super().min_version
 
 
-@dataclass
 class CLONE(_BaseAdd):
     """Clone a git repository.
 
@@ -177,7 +241,18 @@ class CLONE(_BaseAdd):
 
     https://docs.docker.com/engine/reference/builder/#adding-a-git-repository-add-git-ref-dir
     """
-    keep_git_dir: bool = False
+    __slots__ = ('keep_git_dir',)
+
+    def __init__(
+        self,
+        src: str | PosixPath | list[str | PosixPath],
+        dst: str | PosixPath,
+        chown: str | int | None = None,
+        link: bool = False,
+        keep_git_dir: bool = False,
+    ) -> None:
+        super().__init__(src, dst, chown, link)
+        self.keep_git_dir = keep_git_dir
 
     def as_str(self) -> str:
         result = 'ADD'
@@ -197,12 +272,12 @@ class EXTRACT(_BaseAdd):
 
     https://docs.docker.com/engine/reference/builder/#add
     """
+    __slots__ = ()
 
     def as_str(self) -> str:
         return f'ADD{super().as_str()}'
 
 
-@dataclass
 class COPY(_BaseAdd):
     """
     Copies new files or directories from src and adds them to the filesystem
@@ -210,7 +285,24 @@ class COPY(_BaseAdd):
 
     https://docs.docker.com/engine/reference/builder/#copy
     """
-    from_stage: Stage | BaseImage | None = None
+    __slots__ = ('from_stage',)
+
+    def __init__(
+        self,
+        src: str | PosixPath | list[str | PosixPath],
+        dst: str | PosixPath,
+        chown: str | int | None = None,
+        link: bool = False,
+        from_stage: Stage | BaseImage | None = None,
+    ) -> None:
+        super().__init__(src, dst, chown, link)
+        self.from_stage = from_stage
+
+    @property
+    def _stages(self) -> tuple[Stage, ...]:
+        if _is_stage(self.from_stage):
+            return (self.from_stage,)  # type: ignore[return-value]
+        return ()
 
     def as_str(self) -> str:
         result = 'COPY'
@@ -271,6 +363,10 @@ class ONBUILD(BuildStep):
     def as_str(self) -> str:
         return f'ONBUILD {self.trigger.as_str()}'
 
+    @property
+    def _stages(self) -> tuple[Stage, ...]:
+        return self.trigger._stages
+
 
 class SHELL(BuildStep):
     """Override the default shell used for the shell form of commands.
@@ -1,8 +1,7 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
 from pathlib import PosixPath
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Iterator, TypeVar
 
 from ._formatters import format_stage_name
 
@@ -13,7 +12,56 @@ if TYPE_CHECKING:
     from ._stage import Stage
 
 
-class BaseImage:
+T = TypeVar('T', bound='_Immutable')
+
+
+class _Immutable:
+    """Allow setting every attribute only once, in the constructor.
+    """
+    __slots__ = ()
+
+    def __setattr__(self, name: str, value: object) -> None:
+        if hasattr(self, name):
+            raise AttributeError(f'{type(self).__name__} is immutable')
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __setstate__(self, state: Any) -> None:
+        # pickle restores attributes using setattr, which can't overwrite them
+        if not isinstance(state, tuple):
+            state = (state, None)
+        for attrs in state:
+            for name, value in (attrs or {}).items():
+                object.__setattr__(self, name, value)
+
+
+def replace(obj: T, **changes: Any) -> T:
+    """Copy of the immutable object with some attributes changed, like ``dataclasses.replace``.
+
+    Works for types whose constructor accepts every public attribute as a keyword argument.
+    """
+    kwargs = {name: getattr(obj, name) for name in _fields(obj)}
+    kwargs.update(changes)
+    return type(obj)(**kwargs)
+
+
+def _fields(obj: _Immutable) -> Iterator[str]:
+    """Names of the public attributes of the immutable object, base classes first.
+    """
+    for cls in reversed(type(obj).__mro__):
+        for name in getattr(cls, '__slots__', ()):
+            if not name.startswith('_'):
+                yield name
+
+
+def _repr(obj: _Immutable) -> str:
+    args = ', '.join(f'{name}={getattr(obj, name)!r}' for name in _fields(obj))
+    return f'{type(obj).__name__}({args})'
+
+
+class BaseImage(_Immutable):
     """Type representing a base image, like the ones you can find on Docker Hub.
 
     It's used in Stage to specify ``FROM``, in COPY to specify ``--from``
@@ -38,6 +86,14 @@ class BaseImage:
         self.tag = tag
         self.digest = digest
 
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, BaseImage):
+            return NotImplemented
+        return str(self) == str(other)
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
     def __str__(self) -> str:
         if self.tag:
             return f'{self.name}:{self.tag}'
@@ -46,7 +102,7 @@ class BaseImage:
         return self.name
 
 
-class Checksum:
+class Checksum(_Immutable):
     """Hash of remote content for DOWNLOAD.
 
     Args:
@@ -68,24 +124,60 @@ class Checksum:
         return f'{self.algorithm}:{self.hex}'
 
 
-class Mount:
+class Mount(_Immutable):
     """Create a mount that process running as part of the build can access.
 
     This can be used to bind files from other part of the build without copying,
     accessing build secrets or ssh-agent sockets,
     or creating cache locations to speed up your build.
+
+    Mounts are immutable values: two mounts of the same type that produce
+    the same ``--mount`` flag are equal and have the same hash.
+    Mounts from a Stage are equal only if they use the same Stage object,
+    and are hashed by it, so that renaming the stage doesn't change the hash.
     """
-    __slots__ = ()
+    __slots__ = ('__weakref__',)
 
     @property
     def _parts(self) -> list[tuple[str, str]]:
         raise NotImplementedError
 
+    def __eq__(self, other: object) -> bool:
+        if type(self) is not type(other):
+            return NotImplemented
+        assert isinstance(other, Mount)
+        if self._stages != other._stages:
+            return False
+        return str(self) == str(other)
+
+    def __hash__(self) -> int:
+        stages = self._stages
+        if stages:
+            return hash((type(self), stages))
+        return hash((type(self), str(self)))
+
+    def __repr__(self) -> str:
+        return _repr(self)
+
     def __str__(self) -> str:
         return ','.join(f'{k}={v}' for k, v in self._parts)
 
+    @property
+    def _stages(self) -> tuple[Stage, ...]:
+        """Stages whose names the rendered mount includes.
+        """
+        from_stage = getattr(self, 'from_stage', None)
+        if _is_stage(from_stage):
+            return (from_stage,)  # type: ignore[return-value]
+        return ()
+
+    @property
+    def _refers_stage(self) -> bool:
+        """True if the rendered mount includes the name of a Stage.
+        """
+        return bool(self._stages)
+
 
-@dataclass
 class BindMount(Mount):
     """Allows binding directories (read-only) in the context or in an image.
 
@@ -97,10 +189,19 @@ class BindMount(Mount):
 
     https://docs.docker.com/engine/reference/builder/#run---mounttypebind
     """
-    target: str | PosixPath
-    source: str | PosixPath | None = None
-    from_stage: Stage | BaseImage | None = None
-    allow_write: bool = False
+    __slots__ = ('target', 'source', 'from_stage', 'allow_write')
+
+    def __init__(
+        self,
+        target: str | PosixPath,
+        source: str | PosixPath | None = None,
+        from_stage: Stage | BaseImage | None = None,
+        allow_write: bool = False,
+    ) -> None:
+        self.target = target
+        self.source = source
+        self.from_stage = from_stage
+        self.allow_write = allow_write
 
     @property
     def _parts(self) -> list[tuple[str, str]]:
@@ -117,21 +218,34 @@ class BindMount(Mount):
         return parts
 
 
-@dataclass
 class CacheMount(Mount):
     """Allows to cache directories for compilers and package managers.
 
     https://docs.docker.com/engine/reference/builder/#run---mounttypecache
     """
-    target: str | PosixPath
-    id: str | None = None
-    allow_write: bool = True
-    sharing: Literal['shared', 'private', 'locked'] = 'shared'
-    from_stage: Stage | BaseImage | None = None
-    source: str | PosixPath | None = None
-    mode: int = 0o755
-    uid: int = 0
-    gid: int = 0
+    __slots__ = ('target', 'id', 'allow_write', 'sharing', 'from_stage', 'source', 'mode', 'uid', 'gid')
+
+    def __init__(
+        self,
+        target: str | PosixPath,
+        id: str | None = None,
+        allow_write: bool = True,
+        sharing: Literal['shared', 'private', 'locked'] = 'shared',
+        from_stage: Stage | BaseImage | None = None,
+        source: str | PosixPath | None = None,
+        mode: int = 0o755,
+        uid: int = 0,
+        gid: int = 0,
+    ) -> None:
+        self.target = target
+        self.id = id
+        self.allow_write = allow_write
+        self.sharing = sharing
+        self.from_stage = from_stage
+        self.source = source
+        self.mode = mode
+        self.uid = uid
+        self.gid = gid
 
     @property
     def _parts(self) -> list[tuple[str, str]]:
@@ -158,14 +272,16 @@ class CacheMount(Mount):
         return parts
 
 
-@dataclass
 class TmpFSMount(Mount):
     """Allows mounting tmpfs in the build container.
 
     https://docs.docker.com/engine/reference/builder/#run---mounttypetmpfs
     """
-    target: str | PosixPath
-    size: str | None = None
+    __slots__ = ('target', 'size')
+
+    def __init__(self, target: str | PosixPath, size: str | None = None) -> None:
+        self.target = target
+        self.size = size
 
     @property
     def _parts(self) -> list[tuple[str, str]]:
@@ -178,18 +294,28 @@ class TmpFSMount(Mount):
         return parts
 
 
-@dataclass
 class SecretMount(Mount):
     """Allows to access secure files such as private keys without baking them into the image.
 
     https://docs.docker.com/engine/reference/builder/#run---mounttypesecret
     """
-    target: str | PosixPath | None = None
-    id: str | None = None
-    required: bool = False
-    mode: int = 0o400
-    uid: int = 0
-    gid: int = 0
+    __slots__ = ('target', 'id', 'required', 'mode', 'uid', 'gid')
+
+    def __init__(
+        self,
+        target: str | PosixPath | None = None,
+        id: str | None = None,
+        required: bool = False,
+        mode: int = 0o400,
+        uid: int = 0,
+        gid: int = 0,
+    ) -> None:
+        self.target = target
+        self.id = id
+        self.required = required
+        self.mode = mode
+        self.uid = uid
+        self.gid = gid
 
     @property
     def _parts(self) -> list[tuple[str, str]]:
@@ -209,18 +335,28 @@ class SecretMount(Mount):
         return parts
 
 
-@dataclass
 class SSHMount(Mount):
     """Allows to access SSH keys via SSH agents, with support for passphrases.
 
     https://docs.docker.com/engine/reference/builder/#run---mounttypessh
     """
-    target: str | PosixPath | None = None
-    id: str = 'default'
-    required: bool = False
-    mode: int = 0o600
-    uid: int = 0
-    gid: int = 0
+    __slots__ = ('target', 'id', 'required', 'mode', 'uid', 'gid')
+
+    def __init__(
+        self,
+        target: str | PosixPath | None = None,
+        id: str = 'default',
+        required: bool = False,
+        mode: int = 0o600,
+        uid: int = 0,
+        gid: int = 0,
+    ) -> None:
+        self.target = target
+        self.id = id
+        self.required = required
+        self.mode = mode
+        self.uid = uid
+        self.gid = gid
 
     @property
     def _parts(self) -> list[tuple[str, str]]:
@@ -238,3 +374,8 @@ class SSHMount(Mount):
         if self.gid:
             parts.append(('gid', str(self.gid)))
         return parts
+
+
+def _is_stage(value: object) -> bool:
+    # Stage can't be imported here, it depends on the steps
+    return value is not None and not isinstance(value, BaseImage)
@@ -3,9 +3,17 @@ Collection of useful function that generate CLI commands for using inside of RUN
 
 The commands here are the ones that are the most often used in Docker images
 and require certain flags for producing safe and small images.
+
+The functions with ``cached_`` prefix return the whole RUN step instead,
+with cache mounts for the package manager. The downloaded packages
+are kept in the builder cache, outside of the image, and so they survive
+when the layer has to be rebuilt.
 """
 from __future__ import annotations
 
+from ._steps import RUN
+from ._types import CacheMount
+
 
 def pip_install(*pkgs: str) -> str:
     """Install Python packages from pypi.org.
@@ -18,9 +26,104 @@ def pip_install(*pkgs: str) -> str:
 def apt_install(*pkgs: str) -> str:
     """Install system packages from Debian repositories.
     """
+    return f'apt-get update && apt-get install -y --no-install-recommends {_join(pkgs)}'
+
+
+def cached_pip_install(*pkgs: str) -> RUN:
+    """Install Python packages from pypi.org, caching the downloads.
+    """
+    suffix = ' '.join(pkgs)
+    return RUN(
+        f'python3 -m pip --disable-pip-version-check install {suffix}',
+        mount=CacheMount('/root/.cache/pip'),
+    )
+
+
+def cached_uv_install(*pkgs: str) -> RUN:
+    """Install Python packages into the system Python using uv, caching the downloads.
+
+    The packages are copied from the cache because the cache mount
+    and the image are on different file systems and can't be hardlinked.
+    """
+    suffix = ' '.join(pkgs)
+    return RUN(
+        f'uv pip install --system --link-mode=copy {suffix}',
+        mount=CacheMount('/root/.cache/uv'),
+    )
+
+
+def cached_apt_install(*pkgs: str) -> RUN:
+    """Install system packages from Debian repositories, caching the downloads.
+
+    Official Debian and Ubuntu images remove downloaded packages after each
+    install, so the command disables it first. Both the packages and the lists
+    are cached, and apt doesn't support concurrent access to them,
+    so the mounts are locked.
+    """
+    return RUN(
+        'rm -f /etc/apt/apt.conf.d/docker-clean',
+        'apt-get update',
+        f'apt-get install -y --no-install-recommends {_join(pkgs)}',
+        mount=[
+            CacheMount('/var/cache/apt', sharing='locked'),
+            CacheMount('/var/lib/apt', sharing='locked'),
+        ],
+    )
+
+
+def cached_apk_add(*pkgs: str) -> RUN:
+    """Install system packages from Alpine repositories, caching the downloads.
+    """
+    suffix = ' '.join(pkgs)
+    return RUN(
+        f'apk add --update-cache {suffix}',
+        mount=CacheMount('/etc/apk/cache', sharing='locked'),
+    )
+
+
+def cached_npm_install(*pkgs: str) -> RUN:
+    """Install JS packages using npm, caching the downloads.
+
+    If no packages specified, install the ones from the lock file.
+    """
+    cmd = 'npm install ' + ' '.join(pkgs) if pkgs else 'npm ci'
+    return RUN(cmd, mount=CacheMount('/root/.npm'))
+
+
+def cached_yarn_install() -> RUN:
+    """Install JS packages from the lock file using yarn, caching the downloads.
+    """
+    return RUN(
+        'yarn install --frozen-lockfile',
+        mount=CacheMount('/usr/local/share/.cache/yarn', sharing='locked'),
+    )
+
+
+def cached_cargo_build(*args: str) -> RUN:
+    """Build a Rust project, caching the downloaded crates.
+
+    The paths are for ``CARGO_HOME`` of the official Rust images.
+    """
+    cmd = ' '.join(('cargo', 'build', '--locked') + args)
+    return RUN(cmd, mount=[
+        CacheMount('/usr/local/cargo/registry'),
+        CacheMount('/usr/local/cargo/git'),
+    ])
+
+
+def cached_go_mod_download() -> RUN:
+    """Download Go modules, caching the modules and the build cache.
+
+    The paths are for ``GOPATH`` of the official Go images.
+    """
+    return RUN('go mod download', mount=[
+        CacheMount('/go/pkg/mod'),
+        CacheMount('/root/.cache/go-build'),
+    ])
+
+
+def _join(pkgs: tuple[str, ...]) -> str:
     if len(pkgs) <= 2:
-        suffix = ' '.join(pkgs)
-    else:
-        sep = ' \\\n    '
-        suffix = sep + sep.join(sorted(pkgs))
-    return f'apt-get update && apt-get install -y --no-install-recommends {suffix}'
+        return ' '.join(pkgs)
+    sep = ' \\\n    '
+    return sep + sep.join(sorted(pkgs))
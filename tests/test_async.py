@@ -0,0 +1,120 @@
+import asyncio
+import sys
+from io import StringIO
+from pathlib import Path
+from time import perf_counter
+
+import pytest
+
+import docked as d
+
+
+STUB = f'''#!{sys.executable}
+import subprocess, sys, time
+dockerfile = sys.stdin.read()
+print(dockerfile.splitlines()[-1], flush=True)
+print('args:', ' '.join(sys.argv[1:]), file=sys.stderr, flush=True)
+if '--slow' in sys.argv:
+    # a child process that must be killed together with the CLI
+    subprocess.run([sys.executable, '-c', 'import time; time.sleep(30)'])
+sys.exit(3 if '--fail' in sys.argv else 0)
+'''
+
+
+@pytest.fixture
+def binary(tmp_path: Path) -> str:
+    path = tmp_path / 'docker'
+    path.write_text(STUB)
+    path.chmod(0o755)
+    return str(path)
+
+
+def make_image(msg: str) -> d.Image:
+    return d.Image(d.Stage(base=d.BaseImage('busybox'), run=[d.CMD(['echo', msg])]))
+
+
+def test_abuild(binary: str) -> None:
+    async def run() -> tuple:
+        async with make_image('hi').abuild(['.'], binary=binary) as build:
+            lines = [line async for line in build]
+            return lines, await build.wait()
+
+    lines, result = asyncio.run(run())
+    assert lines == ['CMD ["echo", "hi"]', 'args: buildx build -f - .']
+    assert result.ok
+    assert result.name == 'main'
+
+
+def test_abuild_wait_without_reading(binary: str) -> None:
+    build = make_image('hi').abuild(['--fail', '.'], binary=binary, name='app')
+    result = asyncio.run(build.wait())
+    assert result.returncode == 3
+    assert str(result).startswith('FAIL(3)')
+
+
+def test_abuild_timeout(binary: str) -> None:
+    build = make_image('hi').abuild(['--slow', '.'], binary=binary, timeout=.5)
+    start = perf_counter()
+    result = asyncio.run(build.wait())
+    assert perf_counter() - start < 5
+    assert result.timed_out
+    assert not result.ok
+    assert str(result).startswith('TIMEOUT')
+
+
+def test_abuild_timeout_stdin(tmp_path: Path) -> None:
+    # the process never reads the Dockerfile, so writing it blocks
+    path = tmp_path / 'docker'
+    path.write_text(f'#!{sys.executable}\nimport time\ntime.sleep(30)\n')
+    path.chmod(0o755)
+    build = d.AsyncBuild([str(path)], b'x' * 4 * 1024 * 1024, name='app', timeout=.5)
+    start = perf_counter()
+    result = asyncio.run(build.wait())
+    assert perf_counter() - start < 5
+    assert result.timed_out
+
+
+def test_abuild_cancel(binary: str) -> None:
+    async def run() -> d.AsyncBuild:
+        build = make_image('hi').abuild(['--slow', '.'], binary=binary)
+        task = asyncio.ensure_future(build.wait())
+        await asyncio.sleep(.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return build
+
+    start = perf_counter()
+    build = asyncio.run(run())
+    assert perf_counter() - start < 5
+    assert build._proc is not None
+    assert build._proc.returncode == -9
+
+
+def test_abuild_missing_binary() -> None:
+    build = make_image('hi').abuild(['.'], binary='/nonexistent/docker')
+    result = asyncio.run(build.wait())
+    assert result.returncode == 127
+
+
+def test_fleet_abuild(binary: str, tmp_path: Path) -> None:
+    logs = [StringIO(), StringIO()]
+    fleet = d.Fleet(jobs=2, binary=binary)
+    fleet.add(make_image('a'), tags=['a:1'], log=logs[0])
+    fleet.add(make_image('b'), tags=['b:1'], args=['--fail'], log=logs[1])
+    fleet.add(make_image('c'), tags=['c:1'], args=['--slow'], log=tmp_path / 'c.log')
+    results = asyncio.run(fleet.abuild(timeout=1))
+    assert [r.name for r in results] == ['a:1', 'b:1', 'c:1']
+    assert [r.returncode for r in results][:2] == [0, 3]
+    assert results[2].timed_out
+    assert 'args: buildx build -f - --tag a:1 .' in logs[0].getvalue()
+    assert 'CMD ["echo", "c"]' in (tmp_path / 'c.log').read_text()
+
+
+def test_fleet_abuild_broken_target(binary: str) -> None:
+    fleet = d.Fleet(binary=binary)
+    fleet.add(make_image('a'), tags=['a:1'], target='missing')
+    fleet.add(make_image('b'), tags=['b:1'])
+    results = asyncio.run(fleet.abuild())
+    assert [r.ok for r in results] == [False, True]
+    assert 'missing' in results[0].error
@@ -0,0 +1,59 @@
+import json
+from io import StringIO
+from pathlib import Path
+from time import perf_counter
+
+import pytest
+
+from docked import _bulk, entrypoint
+
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_render(tmp_path: Path) -> None:
+    modules = tmp_path / 'modules'
+    modules.mkdir()
+    (modules / 'broken.py').write_text('1/0')
+    (modules / 'slow.py').write_text('import time\ntime.sleep(30)')
+    (modules / 'hello.py').write_text((ROOT / 'examples' / 'hello_world.py').read_text())
+    (modules / 'hugo.py').write_text((ROOT / 'examples' / 'hugo.py').read_text())
+
+    output = tmp_path / 'output'
+    stdout = StringIO()
+    argv = ['render', str(modules / '*.py'), '-o', str(output), '-j', '2', '--timeout', '1']
+    code = entrypoint(argv, stdout=stdout)
+    assert code == 2
+    assert 'rendered 2/4 modules' in stdout.getvalue()
+
+    expected = (ROOT / 'tests' / 'expected' / 'hugo.txt').read_text()
+    assert (output / 'hugo.Dockerfile').read_text() == expected
+    manifest = json.loads((output / 'manifest.json').read_text())
+    errors = {Path(r['module']).name: r['error'] for r in manifest}
+    assert 'ZeroDivisionError' in errors['broken.py']
+    assert 'TimeoutError' in errors['slow.py']
+    assert errors['hello.py'] is None
+    assert errors['hugo.py'] is None
+
+
+def test_render_stuck_worker(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(_bulk, 'GRACE_PERIOD', .5)
+    modules = tmp_path / 'modules'
+    modules.mkdir()
+    # the timeout inside of the worker can't interrupt it, like C code that doesn't return
+    (modules / 'a_stuck.py').write_text(
+        'import signal, time\n'
+        'signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})\n'
+        'time.sleep(30)\n',
+    )
+    (modules / 'b_crash.py').write_text('import os\nos._exit(3)')
+    (modules / 'hello.py').write_text((ROOT / 'examples' / 'hello_world.py').read_text())
+
+    start = perf_counter()
+    results = _bulk.render_modules(sorted(modules.glob('*.py')), tmp_path / 'output', jobs=1, timeout=.5)
+    assert perf_counter() - start < 10
+    assert [r.module.name for r in results] == ['a_stuck.py', 'b_crash.py', 'hello.py']
+    stuck, crash, hello = results
+    assert stuck.error == 'TimeoutError: the worker did not respond'
+    assert crash.error == 'RuntimeError: the worker exited with code 3'
+    assert hello.ok
@@ -0,0 +1,64 @@
+import pytest
+
+import docked as d
+
+
+@pytest.mark.parametrize('given, expected', [
+    (
+        d.cmd.cached_pip_install('cowsay', 'httpie'),
+        'RUN --mount=type=cache,target=/root/.cache/pip '
+        'python3 -m pip --disable-pip-version-check install cowsay httpie',
+    ),
+    (
+        d.cmd.cached_uv_install('cowsay'),
+        'RUN --mount=type=cache,target=/root/.cache/uv '
+        'uv pip install --system --link-mode=copy cowsay',
+    ),
+    (
+        d.cmd.cached_apt_install('curl', 'git', 'ca-certificates'),
+        'RUN --mount=type=cache,target=/var/cache/apt,sharing=locked '
+        '--mount=type=cache,target=/var/lib/apt,sharing=locked '
+        'rm -f /etc/apt/apt.conf.d/docker-clean && \\\n'
+        '    apt-get update && \\\n'
+        '    apt-get install -y --no-install-recommends  \\\n'
+        '    ca-certificates \\\n    curl \\\n    git',
+    ),
+    (
+        d.cmd.cached_apk_add('curl'),
+        'RUN --mount=type=cache,target=/etc/apk/cache,sharing=locked '
+        'apk add --update-cache curl',
+    ),
+    (
+        d.cmd.cached_npm_install(),
+        'RUN --mount=type=cache,target=/root/.npm npm ci',
+    ),
+    (
+        d.cmd.cached_npm_install('left-pad'),
+        'RUN --mount=type=cache,target=/root/.npm npm install left-pad',
+    ),
+    (
+        d.cmd.cached_yarn_install(),
+        'RUN --mount=type=cache,target=/usr/local/share/.cache/yarn,sharing=locked '
+        'yarn install --frozen-lockfile',
+    ),
+    (
+        d.cmd.cached_cargo_build('--release'),
+        'RUN --mount=type=cache,target=/usr/local/cargo/registry '
+        '--mount=type=cache,target=/usr/local/cargo/git '
+        'cargo build --locked --release',
+    ),
+    (
+        d.cmd.cached_go_mod_download(),
+        'RUN --mount=type=cache,target=/go/pkg/mod '
+        '--mount=type=cache,target=/root/.cache/go-build '
+        'go mod download',
+    ),
+])
+def test_cached(given: d.RUN, expected: str) -> None:
+    assert str(given) == expected
+    assert given.min_version == '1.2'
+
+
+def test_cached_lint() -> None:
+    stage = d.Stage(base=d.BaseImage('debian'), build=[d.cmd.cached_apt_install('curl')])
+    assert d.Image(stage).lint(exit_on_failure=False) == 0
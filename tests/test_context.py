@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+import json
+import sys
+import tarfile
+from io import BytesIO, StringIO
+from pathlib import Path
+
+import pytest
+
+import docked as d
+from docked import entrypoint
+from docked._context import (
+    HashIndex, _analyze, _index, context_paths, format_size, hash_file,
+    parse_build_args, parse_size, walk, write_context,
+)
+
+
+IMAGE = '''
+import docked as d
+
+stage = d.Stage(
+    base=d.BaseImage('python'),
+    build=[
+        d.COPY('requirements.txt', '/app/'),
+        d.COPY('./src/', '/app/src/'),
+        d.COPY('docs/*.md', '/app/docs/'),
+        d.RUN('make', mount=d.BindMount('/mnt', source='Makefile')),
+    ],
+)
+image = d.Image(stage)
+'''
+
+
+@pytest.fixture
+def context(tmp_path: Path) -> Path:
+    files = {
+        'requirements.txt': 10,
+        'Makefile': 5,
+        'src/main.py': 100,
+        'src/pkg/big.py': 1000,
+        'src-old/main.py': 7,
+        'docs/index.md': 20,
+        'docs/img/logo.png': 3000,
+    }
+    for name, size in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'x' * size)
+    return tmp_path
+
+
+def test_walk(context: Path) -> None:
+    sizes = walk(context, jobs=3)
+    assert sizes['src/pkg/big.py'] == 1000
+    assert len(sizes) == 7
+
+
+def test_walk_paths(context: Path) -> None:
+    sizes = walk(context, paths=['src', 'Makefile'])
+    assert sizes == {'Makefile': 5, 'src/main.py': 100, 'src/pkg/big.py': 1000}
+
+
+def test_predict_cache_scans_used_paths(context: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    scanned = []
+    scan = _analyze._scan
+
+    def record(root: Path, prefix: str, sizes: dict) -> list:
+        scanned.append(prefix)
+        return scan(root, prefix, sizes)
+
+    monkeypatch.setattr(_analyze, '_scan', record)
+    image = d.Image(d.Stage(base=d.BaseImage('python'), build=[
+        d.COPY('src', '/app/src'),
+        d.COPY('docs/*.md', '/app/docs/'),
+    ]))
+    image.predict_cache(context)
+    assert sorted(scanned) == ['src', 'src/pkg']
+
+
+def test_analyze_context(context: Path) -> None:
+    image = d.Image(d.Stage(base=d.BaseImage('python'), build=[
+        d.COPY('requirements.txt', '/app/'),
+        d.COPY('./src/', '/app/src/'),
+        d.COPY('docs/*.md', '/app/docs/'),
+        d.COPY('missing', '/app/'),
+        d.COPY('.', '/app/'),
+    ]))
+    report = image.analyze_context(context, top=2)
+    assert report.files == 7
+    assert [(u.files, u.size) for u in report.steps] == [
+        (1, 10),
+        (2, 1100),
+        (1, 20),
+        (0, 0),
+        (7, report.size),
+    ]
+    assert report.steps[1].largest == (('src/pkg/big.py', 1000), ('src/main.py', 100))
+    assert [u.title for u in report.over_budget(1000)] == ['COPY ./src/ /app/src/', 'COPY . /app/']
+    assert json.loads(report.as_json())['steps'][1]['size'] == 1100
+    assert 'src/pkg/big.py' in str(report)
+
+
+@pytest.mark.parametrize('given, expected', [
+    ('512', 512),
+    ('2K', 2048),
+    ('1.5MiB', 1536 * 1024),
+    ('1 GB', 1024 ** 3),
+])
+def test_parse_size(given: str, expected: int) -> None:
+    assert parse_size(given) == expected
+
+
+@pytest.mark.parametrize('given, expected', [
+    (0, '0 B'),
+    (1023, '1023 B'),
+    (1536, '1.5 KiB'),
+    (5 * 1024 ** 5, '5120.0 TiB'),
+])
+def test_format_size(given: int, expected: str) -> None:
+    assert format_size(given) == expected
+
+
+def test_cli(context: Path) -> None:
+    module = context / 'app.py'
+    module.write_text(IMAGE)
+    stdout = StringIO()
+    code = entrypoint(['context', str(module), '-p', str(context), '--budget', '1K'], stdout=stdout)
+    assert code == 1
+    assert 'over budget (1.1 KiB > 1.0 KiB): COPY ./src/ /app/src/' in stdout.getvalue()
+
+    stdout = StringIO()
+    code = entrypoint(['context', str(module), '-p', str(context), '--json'], stdout=stdout)
+    assert code == 0
+    report = json.loads(stdout.getvalue())
+    assert [step['size'] for step in report['steps']] == [10, 1100, 20, 5]
+
+
+def test_predict_cache(context: Path, tmp_path_factory: pytest.TempPathFactory) -> None:
+    state = tmp_path_factory.mktemp('state') / 'state.json'
+    deps = d.Stage(base=d.BaseImage('python'), name='deps', build=[
+        d.ARG('VERSION', '1'),
+        d.COPY('requirements.txt', '/app/'),
+        d.RUN('pip install -r /app/requirements.txt'),
+    ])
+    final = d.Stage(base=d.BaseImage('python'), name='final', build=[
+        d.COPY('/app/', '/app/', from_stage=deps),
+        d.COPY('src', '/app/src'),
+    ])
+    image = d.Image(deps, final)
+
+    prediction = image.predict_cache(context, state=state)
+    assert [s.first_miss for s in prediction.stages] == [0, 0]
+    assert not prediction.cached
+    prediction.save(state)
+    assert image.predict_cache(context, state=state).cached
+
+    # a change in the source code invalidates only the last step
+    (context / 'src' / 'main.py').write_text('print(1)')
+    prediction = image.predict_cache(context, state=state)
+    assert [s.first_miss for s in prediction.stages] == [None, 1]
+    assert str(prediction) == 'deps: cached\nfinal: rebuilds from step 1: COPY src /app/src'
+    prediction.save(state)
+
+    # a new ARG value invalidates RUN and the stages depending on it
+    prediction = image.predict_cache(context, state=state, build_args={'VERSION': '2'})
+    assert [s.first_miss for s in prediction.stages] == [2, 0]
+    assert prediction.stages[0].step == deps.build[2]
+
+
+@pytest.mark.parametrize('tag, platform', [
+    ('3.12', None),
+    ('3.11', 'linux/arm64'),
+])
+def test_predict_cache_empty_stage(
+    context: Path,
+    tmp_path_factory: pytest.TempPathFactory,
+    tag: str,
+    platform: str | None,
+) -> None:
+    state = tmp_path_factory.mktemp('state') / 'state.json'
+
+    def make_image(tag: str, platform: str | None = None) -> d.Image:
+        # the stage without steps passes its base on to the stages using it
+        python = d.Stage(base=d.BaseImage('python', tag=tag), name='python', platform=platform)
+        app = d.Stage(base=python, name='app', build=[d.COPY('src', '/app/src')])
+        return d.Image(python, app)
+
+    make_image('3.11').predict_cache(context).save(state)
+    assert make_image('3.11').predict_cache(context, state=state).cached
+    prediction = make_image(tag, platform).predict_cache(context, state=state)
+    assert [s.first_miss for s in prediction.stages] == [None, 0]
+
+
+def test_hash_index(context: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(_index, 'RACY_PERIOD', -1)
+    monkeypatch.setattr(_index, 'MMAP_THRESHOLD', 1000)
+    big = context / 'docs' / 'img' / 'logo.png'
+    expected = hash_file(big)
+    monkeypatch.setattr(_index, 'MMAP_THRESHOLD', 10 ** 9)
+    assert hash_file(big) == expected
+
+    index = HashIndex(context / '.index.json')
+    assert index.hash(big) == expected
+    index.save()
+    calls = []
+    monkeypatch.setattr(_index, 'hash_file', calls.append)
+    assert HashIndex(context / '.index.json').hash(big) == expected
+    assert calls == []
+    big.write_bytes(b'y' * 3001)
+    HashIndex(context / '.index.json').hash(big)
+    assert calls == [big]
+
+
+@pytest.mark.parametrize('given, expected', [
+    (['.'], ((), {}, '.', ())),
+    (['-t', 'a:1', '--tag=b:2', '-tc:3', '--push', '.'], (('a:1', 'b:2', 'c:3'), {}, '.', ('--push',))),
+    (
+        ['--build-arg', 'A=1', '--build-arg=B=2', '--platform', 'linux/arm64', '.'],
+        ((), {'A': '1', 'B': '2'}, '.', ('--platform=linux/arm64',)),
+    ),
+    (['-'], ((), {}, None, ())),
+    (['https://github.com/docker/buildx.git'], ((), {}, None, ())),
+    (['--no-cache', '--progress', 'plain', '-q'], ((), {}, None, ('--no-cache',))),
+    (['-o', 'type=tar', '--target=app'], ((), {}, None, ('--output=type=tar', '--target=app'))),
+])
+def test_parse_build_args(given: list, expected: tuple) -> None:
+    tags, build_args, context, options = parse_build_args(given)
+    assert (tags, build_args, context and str(context), options) == expected
+
+
+COUNTING_STUB = f'''#!{sys.executable}
+import sys
+with open(sys.argv[0] + '.calls', 'a') as stream:
+    print(' '.join(sys.argv[1:]), file=stream)
+sys.exit(3 if '--fail' in sys.argv else 0)
+'''
+
+
+def test_skip_unchanged(context: Path, tmp_path_factory: pytest.TempPathFactory) -> None:
+    tmp = tmp_path_factory.mktemp('skip')
+    binary = tmp / 'docker'
+    binary.write_text(COUNTING_STUB)
+    binary.chmod(0o755)
+    image = d.Image(d.Stage(base=d.BaseImage('python'), build=[d.COPY('src', '/app/src')]))
+
+    def build(*args: str, target: d.Stage | None = None) -> int:
+        with (tmp / 'build.log').open('a') as log:
+            return image.build(
+                args=['-t', 'app:1', *args, str(context)],
+                binary=str(binary),
+                exit_on_failure=False,
+                stdout=log,
+                stderr=log,
+                skip_unchanged=tmp / 'state',
+                target=target,
+            )
+
+    def calls() -> int:
+        return len((tmp / 'docker.calls').read_text().splitlines())
+
+    assert build('--fail') == 3
+    assert build() == 0
+    assert calls() == 2
+    assert build() == 0
+    assert calls() == 2
+
+    # files not used by the image don't matter
+    (context / 'docs' / 'index.md').write_text('hello')
+    assert build() == 0
+    assert calls() == 2
+
+    (context / 'src' / 'main.py').write_text('hello')
+    assert build() == 0
+    assert calls() == 3
+    # ARG not declared in the image doesn't matter
+    assert build('--build-arg', 'A=1') == 0
+    assert calls() == 3
+    assert build('-t', 'app:2') == 0
+    assert calls() == 4
+
+    # the options that change what is built or where it goes
+    for options in [('--platform', 'linux/arm64'), ('--push',), ('--output=type=local,dest=out',), ('--no-cache',)]:
+        assert build(*options) == 0
+        assert build(*options) == 0
+    assert calls() == 8
+    assert build() == 0
+    assert build('--progress=plain') == 0
+    assert calls() == 9
+    assert build(target=image.stages[0]) == 0
+    assert calls() == 10
+
+
+def test_context_paths(context: Path) -> None:
+    image = d.Image(d.Stage(base=d.BaseImage('python'), build=[
+        d.COPY('src/main.py', '/app/'),
+        d.COPY('./src', '/app/src'),
+        d.COPY('docs/*', '/app/docs/'),
+        d.COPY('missing', '/app/'),
+    ]))
+    assert context_paths(image, context) == ['docs/img', 'docs/index.md', 'src']
+    image.stages[0].build.append(d.COPY('.', '/app/'))
+    assert context_paths(image, context) is None
+
+
+def test_write_context_whole(context: Path) -> None:
+    (context / '.dockerignore').write_text('docs\n')
+    image = d.Image(d.Stage(base=d.BaseImage('python'), build=[d.COPY('.', '/app/')]))
+    stream = BytesIO()
+    write_context(stream, context, image)
+    stream.seek(0)
+    with tarfile.open(fileobj=stream) as tar:
+        assert tar.getnames()[:3] == ['.docked.Dockerfile', '.docked.Dockerfile.dockerignore', '.dockerignore']
+        ignore = tar.extractfile('.docked.Dockerfile.dockerignore')
+        assert ignore is not None
+        # the generated Dockerfile is not a part of the context the image copies
+        assert ignore.read().decode().split() == ['docs', '.docked.Dockerfile', '.docked.Dockerfile.dockerignore']
+
+
+STREAM_STUB = f'''#!{sys.executable}
+import sys, tarfile
+with open(sys.argv[0] + '.stdin', 'wb') as stream:
+    if sys.argv[-1] == '-':
+        with tarfile.open(fileobj=sys.stdin.buffer, mode='r|') as tar:
+            for member in tar:
+                stream.write(member.name.encode() + b'\\n')
+    else:
+        stream.write(sys.stdin.buffer.read())
+'''
+
+
+def test_build_stream(context: Path, tmp_path_factory: pytest.TempPathFactory) -> None:
+    tmp = tmp_path_factory.mktemp('stream')
+    binary = tmp / 'docker'
+    binary.write_text(STREAM_STUB)
+    binary.chmod(0o755)
+    image = d.Image(d.Stage(base=d.BaseImage('python'), build=[d.COPY('src', '/app/src')]))
+    log = (tmp / 'build.log').open('w')
+
+    code = image.build([str(context)], binary=str(binary), stdout=log, stream=True)
+    assert code == 0
+    assert (tmp / 'docker.stdin').read_text() == str(image) + '\n'
+
+    code = image.build([], binary=str(binary), stdout=log, context=context)
+    assert code == 0
+    assert (tmp / 'docker.stdin').read_text().split() == [
+        '.docked.Dockerfile', '.docked.Dockerfile.dockerignore', 'src', 'src/main.py', 'src/pkg', 'src/pkg/big.py',
+    ]
+    log.close()
+
+    with pytest.raises(ValueError):
+        image.build([], binary=str(binary), stream=True, dockerignore=True)
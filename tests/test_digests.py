@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+import docked as d
+from docked._digests import (
+    DOCKER_HUB, DigestCache, Resolver, apply_digests, split_reference,
+)
+
+
+TOKEN = 'secret-token'
+
+
+class Registry(BaseHTTPRequestHandler):
+    """A registry stand-in that requires a bearer token, like Docker Hub.
+    """
+    requests: list[str] = []
+    digests = {
+        'library/python/3.11': 'sha256:' + 'a' * 64,
+        'library/python/latest': 'sha256:' + 'b' * 64,
+        'org/tool/1.0': 'sha256:' + 'c' * 64,
+    }
+
+    def do_GET(self) -> None:
+        self.requests.append(f'GET {self.path}')
+        if self.path.startswith('/token?'):
+            assert 'scope=repository' in self.path
+            self._send(200, {'Content-Type': 'application/json'}, json.dumps({'token': TOKEN}).encode())
+            return
+        self.do_HEAD()
+
+    def do_HEAD(self) -> None:
+        if self.command == 'HEAD':
+            self.requests.append(f'HEAD {self.path}')
+        if self.headers.get('Authorization') != f'Bearer {TOKEN}':
+            host, port = self.server.server_address[:2]
+            challenge = f'Bearer realm="http://{host}:{port}/token",service="test",scope="repository:x:pull"'
+            self._send(401, {'WWW-Authenticate': challenge})
+            return
+        assert 'manifest.list' in self.headers['Accept']
+        match = re.fullmatch(r'/v2/(.+)/manifests/([^/]+)', self.path)
+        assert match is not None
+        digest = self.digests.get('/'.join(match.groups()))
+        if digest is None:
+            self._send(404, {})
+            return
+        self._send(200, {'Docker-Content-Digest': digest})
+
+    def _send(self, code: int, headers: dict[str, str], body: bytes = b'') -> None:
+        self.send_response(code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command == 'GET':
+            self.wfile.write(body)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def registry() -> Iterator[str]:
+    Registry.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Registry)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize('given, expected', [
+    ('python', (DOCKER_HUB, 'library/python', 'latest')),
+    ('python:3.11', (DOCKER_HUB, 'library/python', '3.11')),
+    ('org/tool:1.0', (DOCKER_HUB, 'org/tool', '1.0')),
+    ('ghcr.io/org/tool:1.0', ('ghcr.io', 'org/tool', '1.0')),
+    ('localhost:5000/tool', ('localhost:5000', 'tool', 'latest')),
+    ('localhost/tool:2', ('localhost', 'tool', '2')),
+])
+def test_split_reference(given: str, expected: tuple) -> None:
+    assert split_reference(given) == expected
+
+
+def test_resolve(registry: str, tmp_path: Path) -> None:
+    cache = DigestCache(tmp_path / 'digests.json')
+    resolver = Resolver(cache)
+    refs = [f'{registry}/library/python:3.11', f'{registry}/org/tool:1.0']
+    digests = resolver.resolve(refs + refs)
+    assert digests == {
+        refs[0]: Registry.digests['library/python/3.11'],
+        refs[1]: Registry.digests['org/tool/1.0'],
+    }
+    assert sum(r.startswith('GET /token?') for r in Registry.requests) == 2
+    assert sum(r.startswith('HEAD ') for r in Registry.requests) == 4
+
+    # the second run takes everything from the cache
+    Registry.requests.clear()
+    assert Resolver(DigestCache(tmp_path / 'digests.json')).resolve(refs) == digests
+    assert Registry.requests == []
+
+    # expired entries are resolved again
+    expired = DigestCache(tmp_path / 'digests.json', ttl=-1)
+    assert Resolver(expired).resolve(refs[:1]) == {refs[0]: digests[refs[0]]}
+    assert len(Registry.requests) == 3
+
+
+def test_resolve_missing(registry: str) -> None:
+    with pytest.raises(LookupError, match='cannot resolve .*/nope:1'):
+        Resolver().resolve([f'{registry}/nope:1'])
+
+
+def test_resolve_missing_keeps_cache(registry: str, tmp_path: Path) -> None:
+    refs = [f'{registry}/org/tool:1.0', f'{registry}/nope:1', f'{registry}/nope:2']
+    with pytest.raises(LookupError, match='(?s)nope:1.*nope:2'):
+        Resolver(DigestCache(tmp_path / 'digests.json')).resolve(refs)
+    # the resolved digest is saved despite the errors
+    Registry.requests.clear()
+    assert Resolver(DigestCache(tmp_path / 'digests.json')).resolve(refs[:1]) == {
+        refs[0]: Registry.digests['org/tool/1.0'],
+    }
+    assert Registry.requests == []
+
+
+def test_pin_digests(registry: str, tmp_path: Path) -> None:
+    build = d.Stage(base=d.BaseImage(f'{registry}/library/python', '3.11'), name='build', build=[
+        d.RUN('make', mount=d.BindMount('/mnt', from_stage=d.BaseImage(f'{registry}/org/tool', '1.0'))),
+    ])
+    final = d.Stage(base=d.BaseImage('scratch'), name='final', build=[
+        d.COPY('/app', '/app', from_stage=build),
+        d.COPY('/bin/tool', '/bin/tool', from_stage=d.BaseImage(f'{registry}/org/tool', '1.0')),
+    ])
+    other = d.Stage(base=d.BaseImage(f'{registry}/library/python'))
+    fleet = d.Fleet()
+    fleet.add(d.Image(build, final))
+    fleet.add(d.Image(other))
+
+    assert fleet.pin_digests(tmp_path / 'digests.json') == 4
+    # each tag is resolved only once
+    assert sum(r.startswith('HEAD ') for r in Registry.requests) == 6
+    python = Registry.digests['library/python/3.11']
+    tool = Registry.digests['org/tool/1.0']
+    assert str(build.base) == f'{registry}/library/python:3.11@{python}'
+    assert f'--mount=type=bind,target=/mnt,from={registry}/org/tool:1.0@{tool} make' in str(build)
+    assert f'COPY --from={registry}/org/tool:1.0@{tool} /bin/tool' in str(final)
+    assert str(final.base) == 'scratch'
+    assert str(other.base) == f'{registry}/library/python@{Registry.digests["library/python/latest"]}'
+
+    # nothing to pin anymore
+    Registry.requests.clear()
+    assert fleet.pin_digests() == 0
+    assert Registry.requests == []
+
+
+def test_apply_digests() -> None:
+    image = d.Image(d.Stage(base=d.BaseImage('python', '3.11'), build=[d.RUN('echo 1')]))
+    step = image.stages[0].build[0]
+    assert apply_digests(image, {'python:3.11': 'sha256:abc'}) == 1
+    assert image.stages[0].base == d.BaseImage('python:3.11', digest='sha256:abc')
+    assert image.stages[0].build[0] is step
+    assert apply_digests(image, {}) == 0
@@ -0,0 +1,202 @@
+import sys
+from io import StringIO
+from pathlib import Path
+from time import perf_counter
+
+import pytest
+
+import docked as d
+
+
+STUB = f'''#!{sys.executable}
+import sys, time
+args = sys.argv[1:]
+print(' '.join(args))
+print('building', file=sys.stderr)
+time.sleep(.2)
+sys.exit(3 if any('fail' in arg for arg in args) else 0)
+'''
+
+
+@pytest.fixture
+def binary(tmp_path: Path) -> str:
+    path = tmp_path / 'docker'
+    path.write_text(STUB)
+    path.chmod(0o755)
+    return str(path)
+
+
+def make_image(msg: str) -> d.Image:
+    return d.Image(d.Stage(base=d.BaseImage('busybox'), run=[d.CMD(['echo', msg])]))
+
+
+def test_build(binary: str, tmp_path: Path) -> None:
+    logs = [StringIO() for _ in range(3)]
+    fleet = d.Fleet(jobs=4, binary=binary)
+    fleet.add(make_image('a'), tags=['a:1', 'a:latest'], log=logs[0])
+    fleet.add(make_image('b'), tags=['fail:1'], context='/ctx', log=logs[1])
+    fleet.add(make_image('c'), name='c', args=['--pull'], log=logs[2])
+    fleet.add(make_image('d'), tags=['d:1'], log=tmp_path / 'd.log')
+
+    start = perf_counter()
+    results = fleet.build()
+    assert perf_counter() - start < .8
+
+    assert [r.name for r in results] == ['a:1', 'fail:1', 'c', 'd:1']
+    assert [r.returncode for r in results] == [0, 3, 0, 0]
+    assert [r.ok for r in results] == [True, False, True, True]
+    assert all(r.duration >= .2 for r in results)
+
+    assert '--tag a:1 --tag a:latest .\nbuilding\n' in logs[0].getvalue()
+    assert logs[1].getvalue().endswith(' --tag fail:1 /ctx\nbuilding\n')
+    assert ' --pull .\n' in logs[2].getvalue()
+    assert (tmp_path / 'd.log').read_text().endswith(' --tag d:1 .\nbuilding\n')
+    assert str(results[1]).startswith('FAIL(3)')
+
+
+def test_missing_binary(tmp_path: Path) -> None:
+    log = StringIO()
+    fleet = d.Fleet(binary=str(tmp_path / 'nope'))
+    fleet.add(make_image('a'), log=log)
+    result, = fleet.build()
+    assert result.returncode == 127
+    assert 'nope' in log.getvalue()
+
+
+def test_build_broken_target(binary: str) -> None:
+    log = StringIO()
+    fleet = d.Fleet(binary=binary)
+    fleet.add(make_image('a'), tags=['a:1'])
+    fleet.add(make_image('b'), tags=['b:1'], target='missing', log=log)
+    fleet.add(make_image('c'), tags=['c:1'])
+    results = fleet.build()
+    # the other targets are still built
+    assert [r.name for r in results] == ['a:1', 'b:1', 'c:1']
+    assert [r.ok for r in results] == [True, False, True]
+    assert [r.error is None for r in results] == [True, False, True]
+    assert results[1].returncode == 1
+    assert str(results[1]).startswith('ERROR')
+    assert 'missing' in results[1].error
+    assert results[1].error in log.getvalue()
+
+
+def test_as_bake() -> None:
+    deps = d.Stage(
+        base=d.BaseImage('python', tag='3.11'),
+        name='deps',
+        build=[d.RUN('pip install -r requirements.txt')],
+    )
+    tools = d.Stage(base=d.BaseImage('alpine'), name='tools', build=[d.RUN('apk add git')])
+    app1 = d.Stage(
+        base=deps,
+        name='app',
+        build=[d.COPY('app1', '/app'), d.COPY('/usr/bin/git', '/bin/', from_stage=tools)],
+    )
+    app2 = d.Stage(base=deps, name='app', build=[d.COPY('app2', '/app')])
+    # an equal stage defined separately is still shared
+    deps_copy = d.Stage(
+        base=d.BaseImage('python', tag='3.11'),
+        name='deps',
+        build=[d.RUN('pip install -r requirements.txt')],
+    )
+    app3 = d.Stage(base=deps_copy, name='app', build=[d.COPY('app3', '/app')])
+
+    fleet = d.Fleet()
+    fleet.add(d.Image(deps, tools, app1), tags=['app1:latest'])
+    fleet.add(d.Image(deps, app2), tags=['app2:latest'])
+    fleet.add(d.Image(deps_copy, app3), name='app3')
+    # the options that affect the shared stages differ, so it builds the stages on its own
+    fleet.add(d.Image(deps, app2), name='app4', context='./app4', platforms=['linux/arm64'], build_args={'A': '1'})
+    bake = fleet.as_bake()
+
+    assert bake['group'] == {'default': {'targets': ['app1-latest', 'app2-latest', 'app3', 'app4']}}
+    targets = bake['target']
+    shared, = [name for name in targets if name.startswith('deps-')]
+    assert targets[shared]['target'] == 'deps'
+    assert 'FROM python:3.11 AS deps\nRUN pip' in targets[shared]['dockerfile-inline']
+
+    app1_target = targets['app1-latest']
+    assert app1_target['contexts'] == {'deps': f'target:{shared}'}
+    assert app1_target['tags'] == ['app1:latest']
+    assert app1_target['target'] == 'app'
+    inline = app1_target['dockerfile-inline']
+    assert inline.startswith('# syntax=docker/dockerfile:1.4\n')
+    assert 'AS deps' not in inline
+    assert 'FROM alpine AS tools' in inline
+    assert 'FROM deps AS app' in inline
+
+    assert targets['app3']['contexts'] == {'deps': f'target:{shared}'}
+    app4_target = targets['app4']
+    assert 'contexts' not in app4_target
+    assert 'FROM python:3.11 AS deps' in app4_target['dockerfile-inline']
+    assert app4_target['args'] == {'A': '1'}
+    assert app4_target['platforms'] == ['linux/arm64']
+    assert app4_target['context'] == './app4'
+    assert len(targets) == 5
+
+
+@pytest.mark.parametrize('options, key, value', [
+    (dict(context='./app'), 'context', './app'),
+    (dict(platforms=['linux/arm64']), 'platforms', ['linux/arm64']),
+    (dict(build_args={'A': '1'}), 'args', {'A': '1'}),
+])
+def test_as_bake_shared_options(options: dict, key: str, value: object) -> None:
+    deps = d.Stage(base=d.BaseImage('python'), name='deps', build=[d.RUN('pip install -r requirements.txt')])
+    app = d.Stage(base=deps, name='app', build=[d.COPY('app', '/app')])
+    fleet = d.Fleet()
+    fleet.add(d.Image(deps, app), name='a', **options)
+    fleet.add(d.Image(deps, app), name='b', **options)
+    fleet.add(d.Image(deps, app), name='c')
+    targets = fleet.as_bake()['target']
+
+    shared, = [name for name in targets if name.startswith('deps-')]
+    assert targets[shared][key] == value
+    assert targets['a']['contexts'] == targets['b']['contexts'] == {'deps': f'target:{shared}'}
+    assert 'contexts' not in targets['c']
+    assert len(targets) == 4
+
+
+def test_bake(binary: str, tmp_path: Path) -> None:
+    fleet = d.Fleet(binary=binary)
+    fleet.add(make_image('a'), tags=['a:1'])
+    assert fleet.bake(['--print']) == 0
+    assert fleet.bake(['--fail']) == 3
+    fleet.save_bake(tmp_path / 'docker-bake.json')
+    assert '"a:1"' in (tmp_path / 'docker-bake.json').read_text()
+
+
+def test_add_platforms() -> None:
+    fleet = d.Fleet()
+    image = make_image('a')
+    amd, arm = fleet.add_platforms(
+        image,
+        ['linux/amd64', 'linux/arm64'],
+        tags=['app', 'registry:5000/app:1.0'],
+        builders={'linux/arm64': 'arm-node'},
+        build_args={'A': '1'},
+    )
+    assert fleet.targets == [amd, arm]
+    assert amd.name == 'app linux/amd64'
+    assert amd.tags == ['app:linux-amd64', 'registry:5000/app:1.0-linux-amd64']
+    assert arm.platforms == ['linux/arm64']
+    assert arm.build_args == {'A': '1'}
+    assert amd.command('docker', '-')[:5] == ['docker', 'buildx', 'build', '-f', '-']
+    assert arm.command('docker', '-')[5:7] == ['--builder', 'arm-node']
+
+
+def test_build_platforms(binary: str) -> None:
+    log = StringIO()
+    image = make_image('a')
+    start = perf_counter()
+    results = image.build_platforms(
+        ['linux/amd64', 'linux/arm64', 'linux/fail'],
+        tags=['app:1'],
+        binary=binary,
+        log=log,
+    )
+    # the platforms are built in parallel
+    assert perf_counter() - start < .5
+    assert [r.name for r in results] == ['app:1 linux/amd64', 'app:1 linux/arm64', 'app:1 linux/fail']
+    assert [r.returncode for r in results] == [0, 0, 3]
+    assert all(r.duration >= .2 for r in results)
+    assert '--tag app:1-linux-arm64 --platform linux/arm64 .' in log.getvalue()
@@ -0,0 +1,202 @@
+from pathlib import Path
+
+import pytest
+
+import docked as d
+
+
+def test_render_cache_invalidation() -> None:
+    stage = d.Stage(base=d.BaseImage('alpine'), build=[d.RUN('echo 1')])
+    image = d.Image(stage)
+    first = str(image)
+    assert image.as_str() is first
+    assert image.syntax == 'docker/dockerfile:1.0'
+
+    stage.build.append(d.RUN('echo 2', network='none'))
+    assert str(image).endswith('RUN echo 1\nRUN --network=none echo 2')
+    assert image.syntax == 'docker/dockerfile:1.1'
+
+    stage.build[1] = d.RUN('echo 3')
+    assert str(image) == first + '\nRUN echo 3'
+
+    stage.labels['version'] = '1'
+    stage.name = 'base'
+    assert 'FROM alpine AS base\nLABEL version=1' in str(image)
+
+    image.syntax_version = '1.4'
+    assert str(image).startswith('# syntax=docker/dockerfile:1.4\n')
+
+
+def test_render_cache_stage_rename() -> None:
+    build = d.Stage(base=d.BaseImage('alpine'), name='a')
+    copy = d.COPY(['x'], '/y', from_stage=build)
+    run = d.RUN('ls /src', mount=d.BindMount('/src', from_stage=build))
+    final = d.Stage(base=d.BaseImage('alpine'), name='final', build=[copy, run])
+    image = d.Image(build, final)
+    assert str(copy) == 'COPY --from=a x /y'
+    assert 'from=a ls' in str(image)
+
+    build.name = 'b'
+    assert str(copy) == 'COPY --from=b x /y'
+    assert str(run) == 'RUN --mount=type=bind,target=/src,from=b ls /src'
+    assert 'COPY --from=b x /y\nRUN --mount=type=bind,target=/src,from=b ls' in str(image)
+
+    # the referred stages are looked up again when the steps change
+    other = d.Stage(base=d.BaseImage('alpine'), name='c')
+    final.build.append(d.COPY('z', '/z', from_stage=other))
+    assert str(image).endswith('COPY --from=c z /z')
+    other.name = 'd'
+    assert str(image).endswith('COPY --from=d z /z')
+
+
+def test_stage_rename_keeps_hash() -> None:
+    build = d.Stage(base=d.BaseImage('alpine'), name='a')
+    copy = d.COPY('x', '/y', from_stage=build)
+    run = d.RUN('ls /src', mount=d.BindMount('/src', from_stage=build))
+    onbuild = d.ONBUILD(d.COPY('x', '/y', from_stage=build))
+    steps = {copy: 1, run: 2, onbuild: 3}
+    mounts = set(run.mounts)
+    assert str(onbuild) == 'ONBUILD COPY --from=a x /y'
+
+    build.name = 'b'
+    assert steps[copy] == 1
+    assert steps[run] == 2
+    assert steps[onbuild] == 3
+    assert run.mounts[0] in mounts
+    assert str(onbuild) == 'ONBUILD COPY --from=b x /y'
+    # steps from different stages are not equal, even if the names are the same
+    other = d.Stage(base=d.BaseImage('alpine'), name='b')
+    assert copy == d.COPY('x', '/y', from_stage=build)
+    assert copy != d.COPY('x', '/y', from_stage=other)
+    assert run.mounts[0] != d.BindMount('/src', from_stage=other)
+
+
+def test_stage_dependencies() -> None:
+    deps = d.Stage(base=d.BaseImage('alpine'), name='deps')
+    tools = d.Stage(base=d.BaseImage('alpine'), name='tools')
+    app = d.Stage(base=deps, name='app', build=[
+        d.RUN('make', mount=[d.CacheMount('/cache'), d.BindMount('/mnt', from_stage=tools)]),
+        # the trigger runs in the images built from this one
+        d.ONBUILD(d.COPY('/app', '/app', from_stage=tools)),
+    ])
+    assert app.dependencies == (deps, tools)
+    app.build.pop(0)
+    assert app.dependencies == (deps,)
+    app.build.append(d.COPY('/bin', '/bin', from_stage=tools))
+    assert app.dependencies == (deps, tools)
+
+
+def test_min_version_without_stages() -> None:
+    image = d.Image(d.Stage(base=d.BaseImage('alpine')))
+    image.stages = ()
+    assert image.min_version == '1.0'
+
+
+def test_stage_as_base() -> None:
+    build = d.Stage(base=d.BaseImage('alpine'), name='build')
+    final = d.Stage(base=build, name='final')
+    assert final.as_str() == 'FROM build AS final'
+
+
+def make_multistage() -> d.Image:
+    tools = d.Stage(base=d.BaseImage('alpine'), name='tools')
+    deps = d.Stage(base=d.BaseImage('python'), name='deps')
+    build = d.Stage(
+        base=deps,
+        name='build',
+        build=[d.RUN('make', mount=d.BindMount('/src', from_stage=tools))],
+    )
+    docs = d.Stage(base=d.BaseImage('alpine'), name='docs')
+    final = d.Stage(
+        base=d.BaseImage('python'),
+        name='final',
+        build=[d.COPY('/app', '/app', from_stage=build)],
+    )
+    return d.Image(docs, final, build, deps, tools)
+
+
+def test_graph() -> None:
+    image = make_multistage()
+    docs, final, build, deps, tools = image.stages
+    assert image.graph == {
+        docs: (),
+        final: (build,),
+        build: (deps, tools),
+        deps: (),
+        tools: (),
+    }
+    assert image.toposort() == (docs, deps, tools, build, final)
+    assert image.required_stages('final') == (deps, tools, build, final)
+    assert image.required_stages(build) == (deps, tools, build)
+    assert image.required_stages('docs') == (docs,)
+
+
+def test_prune() -> None:
+    image = make_multistage()
+    actual = image.as_str(target='build')
+    assert actual == '\n'.join([
+        '# syntax=docker/dockerfile:1.2',
+        '# escape=\\',
+        '',
+        'FROM python AS deps',
+        '',
+        'FROM alpine AS tools',
+        '',
+        'FROM deps AS build',
+        'RUN --mount=type=bind,target=/src,from=tools make',
+    ])
+    assert list(image.iter_lines('docs'))[-1] == 'FROM alpine AS docs'
+    assert image.prune(None) is image
+
+
+def test_cycle() -> None:
+    first = d.Stage(base=d.BaseImage('alpine'), name='first')
+    second = d.Stage(base=first, name='second')
+    first.base = second
+    with pytest.raises(ValueError):
+        d.Image(first, second).toposort()
+
+
+def test_dockerignore(tmp_path: Path) -> None:
+    build = d.Stage(
+        base=d.BaseImage('python'),
+        name='build',
+        build=[
+            d.COPY(['./requirements.txt', 'src/'], '/app/'),
+            d.EXTRACT('/vendor/lib.tar.gz', '/opt/'),
+            d.RUN('make', mount=d.BindMount('/mnt', source='Makefile')),
+            d.RUN('make', mount=d.BindMount('/mnt', from_stage=d.BaseImage('tools'))),
+            d.DOWNLOAD('https://a.b/c.gz', '/'),
+        ],
+    )
+    final = d.Stage(
+        base=d.BaseImage('python'),
+        name='final',
+        build=[
+            d.COPY('/app', '/app', from_stage=build),
+            d.COPY('config/*.toml', '/etc/app/'),
+        ],
+    )
+    docs = d.Stage(base=d.BaseImage('alpine'), name='docs', build=[d.COPY('.', '/docs')])
+    image = d.Image(build, final, docs)
+
+    assert list(image.iter_dockerignore('final')) == [
+        '# generated by docked, includes only files used by the Dockerfile',
+        '*',
+        '!Makefile',
+        '!config/*.toml',
+        '!requirements.txt',
+        '!src',
+        '!vendor/lib.tar.gz',
+    ]
+    # the whole context is used
+    assert list(image.iter_dockerignore()) == []
+
+    path = tmp_path / 'app.Dockerfile'
+    image.save(path, 'final', dockerignore=True)
+    ignore = (tmp_path / 'app.Dockerfile.dockerignore').read_text()
+    assert ignore.endswith('\n!vendor/lib.tar.gz\n')
+    # the whole context is used now, the old .dockerignore would hide files from it
+    image.save(path, dockerignore=True)
+    assert not (tmp_path / 'app.Dockerfile.dockerignore').exists()
+    image.save(path, dockerignore=True)
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import docked as d
+
+
+ROOT = Path(__file__).parent.parent
+# The maximum time `import docked` may take, in seconds. It's the best of a few runs,
+# with a generous margin for slow CI machines.
+IMPORT_BUDGET = .15
+IMPORT_TIME = '''
+import time
+start = time.perf_counter()
+import docked
+print(time.perf_counter() - start)
+'''
+NEW_MODULES = '''
+import json, sys
+before = set(sys.modules)
+import docked
+image = docked.Image(docked.Stage(base=docked.BaseImage('alpine'), build=[docked.RUN('echo 1')]))
+image.as_str()
+print(json.dumps(sorted(set(sys.modules) - before)))
+'''
+
+
+def run_python(code: str) -> str:
+    cmd = [sys.executable, '-c', code]
+    return subprocess.run(cmd, cwd=ROOT, check=True, capture_output=True, text=True).stdout
+
+
+def test_import_time() -> None:
+    best = min(float(run_python(IMPORT_TIME)) for _ in range(3))
+    assert best < IMPORT_BUDGET
+
+
+def test_lazy_modules() -> None:
+    loaded = set(json.loads(run_python(NEW_MODULES)))
+    assert 'docked._image' in loaded
+    for module in [
+        'asyncio',
+        'concurrent.futures',
+        'dataclasses',
+        'hashlib',
+        'json',
+        'shlex',
+        'subprocess',
+        'tempfile',
+        'docked._context',
+        'docked._fleet',
+        'docked._linter',
+        'docked._optimizers',
+        'docked._parser',
+        'docked._profile',
+        'docked._shell',
+    ]:
+        assert module not in loaded
+
+
+@pytest.mark.parametrize('name', d.__all__)
+def test_public_names(name: str) -> None:
+    assert getattr(d, name) is not None
+    assert name in dir(d)
+
+
+def test_unknown_name() -> None:
+    with pytest.raises(AttributeError, match="has no attribute 'Nope'"):
+        d.Nope  # type: ignore[attr-defined]
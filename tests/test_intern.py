@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import gc
+
+import docked as d
+from docked._intern import _table
+
+
+def test_intern_steps() -> None:
+    step = d.RUN('apt-get update')
+    assert d.intern(step) is step
+    assert d.intern(d.RUN('apt-get update')) is step
+    assert d.intern(d.RUN(['apt-get', 'update'])) is step
+    assert d.intern(d.ENV('apt-get', 'update')) is not step
+
+
+def test_intern_mounts() -> None:
+    mount = d.intern(d.CacheMount('/root/.cache/x'))
+    step = d.intern(d.RUN('pip install x', mount=d.CacheMount('/root/.cache/x')))
+    assert step.mount is mount
+    step = d.intern(d.RUN('pip install y', mount=[d.CacheMount('/root/.cache/x'), d.SecretMount(id='x')]))
+    assert step.mounts[0] is mount
+    assert str(step) == 'RUN --mount=type=cache,target=/root/.cache/x --mount=type=secret,id=x pip install y'
+
+
+def test_stage_references_are_not_shared() -> None:
+    def make() -> d.Image:
+        build = d.Stage(base=d.BaseImage('golang'), name='build', build=[d.RUN('go build')])
+        mount = d.BindMount('/src', from_stage=build)
+        main = d.Stage(base=d.BaseImage('alpine'), build=[
+            d.COPY('/app', '/app', from_stage=build),
+            d.RUN('ls /src', mount=mount),
+            d.COPY('/bin/go', '/bin/go', from_stage=d.BaseImage('golang')),
+            d.ONBUILD(d.COPY('/app', '/srv', from_stage=build)),
+        ])
+        return d.Image(build, main)
+
+    first, second = make(), make()
+    assert d.Fleet(d.Target(first), d.Target(second)).intern() == 2
+    assert first.stages[0].build[0] is second.stages[0].build[0]
+    copy, run, copy_image, onbuild = second.stages[1].build
+    assert onbuild is not first.stages[1].build[3]
+    assert copy.from_stage is second.stages[0]
+    assert run.mount.from_stage is second.stages[0]
+    assert copy_image is first.stages[1].build[2]
+    assert second.graph[second.stages[1]] == (second.stages[0],)
+
+
+def test_image_intern() -> None:
+    stage = d.Stage(base=d.BaseImage('debian'), build=[d.WORKDIR('/app') for _ in range(3)])
+    image = d.Image(stage)
+    rendered = image.as_str()
+    assert image.intern() == 2
+    assert len({id(step) for step in stage.build}) == 1
+    assert image.intern() == 0
+    assert image.as_str() == rendered
+
+
+def test_weak_table() -> None:
+    d.intern(d.USER('intern-test'))
+    gc.collect()
+    assert (d.USER, 'USER intern-test') not in _table
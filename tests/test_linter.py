@@ -1,8 +1,14 @@
 from io import StringIO
+from logging import INFO
+from pathlib import Path
+from typing import Iterator
 
 import pytest
 
 import docked as d
+from docked._linter import (
+    RULES, Context, StageInfo, Violation, _checks, lint, rule,
+)
 
 
 @pytest.mark.parametrize('given, expected', [
@@ -50,6 +56,18 @@ import docked as d
         [d.RUN('apt-get update')],
         'W1204: Combine `apt-get update` with `apt-get install` in a single RUN',
     ),
+    (
+        [d.RUN('echo 1 && /usr/bin/vim ./hi.txt')],
+        'I1201: Do not RUN `vim`',
+    ),
+    (
+        [d.RUN('DEBIAN_FRONTEND=noninteractive apt-get -y dist-upgrade')],
+        'I1203: Avoid running `apt-get dist-upgrade`',
+    ),
+    (
+        [d.RUN('apt-get install -y curl && apt-get update')],
+        'W1204: Combine `apt-get update` with `apt-get install` in a single RUN',
+    ),
 
     # SHELL         13
     # STOPSIGNAL    14
@@ -76,3 +94,60 @@ def test_linter(given: list, expected: str) -> None:
     stdout.seek(0)
     actual = stdout.read().rstrip()
     assert actual == expected
+
+
+def test_first_and_last() -> None:
+    stage = d.Stage(base=d.BaseImage('alpine'), build=[
+        d.USER('root'),
+        d.RUN('echo 1'),
+        d.USER('app'),
+    ], run=[d.CMD('echo 1'), d.CMD('echo 2'), d.CMD('echo 3')])
+    info = StageInfo.from_steps(stage.all_steps)
+    assert info.first == {'USER': 0, 'RUN': 1, 'CMD': 3}
+    assert info.last == {'USER': 2, 'RUN': 1, 'CMD': 5}
+    assert info.counts == {'USER': 2, 'RUN': 1, 'CMD': 3}
+    ctx = Context(stage=info, index=4)
+    assert ctx.step == 'CMD'
+    assert not ctx.is_first
+    assert not ctx.is_last
+    assert ctx.count == 3
+    codes = [v.code for v in lint(d.Image(stage))]
+    assert codes == [301, 301]
+
+
+def test_rule_registry() -> None:
+    @rule(d.Step)
+    def check_everything(step: d.Step, ctx: Context) -> Iterator[Violation]:
+        yield Violation(code=9999, severity=INFO, summary=ctx.step)
+
+    try:
+        image = d.Image(d.Stage(base=d.BaseImage('alpine'), build=[d.WORKDIR('app')]))
+        assert [str(v) for v in lint(image)] == [
+            'W1701: WORKDIR path should be absolute',
+            'I9999: WORKDIR',
+        ]
+    finally:
+        RULES[d.Step].remove(check_everything)
+        _checks._resolved.clear()
+
+
+def test_lint_many() -> None:
+    images = [
+        d.Image(d.Stage(base=d.BaseImage('alpine'), build=[d.WORKDIR(f'app{i}')] * i))
+        for i in range(5)
+    ]
+    results = d.lint_many(images, jobs=2)
+    assert [len(violations) for violations in results] == [0, 1, 2, 3, 4]
+    assert results == [list(lint(image)) for image in images]
+
+
+def test_lint_many_modules(tmp_path: Path) -> None:
+    module = tmp_path / 'image.py'
+    module.write_text(
+        'import docked as d\n'
+        "image = d.Image(d.Stage(base=d.BaseImage('alpine'), build=[d.WORKDIR('app')]))\n",
+    )
+    results = d.lint_many([module, module], jobs=2)
+    assert [[str(v) for v in violations] for violations in results] == [
+        ['W1701: WORKDIR path should be absolute'],
+    ] * 2
@@ -0,0 +1,321 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import docked as d
+
+
+def make_stage(*build: d.BuildStep) -> d.Stage:
+    return d.Stage(base=d.BaseImage('debian'), build=list(build))
+
+
+def test_reorder() -> None:
+    stage = make_stage(
+        d.WORKDIR('/build'),
+        d.COPY('app', '/app'),
+        d.RUN('make -C /opt/tools'),
+        d.RUN('make -C /opt/lib'),
+        d.RUN('cp -r /app /srv'),
+        d.ARG('VERSION'),
+        d.USER('app'),
+    )
+    result = stage.reorder(explicit_paths=True)
+    assert [str(step) for step in result.build] == [
+        'WORKDIR /build',
+        'RUN make -C /opt/tools',
+        'RUN make -C /opt/lib',
+        'COPY app /app',
+        'RUN cp -r /app /srv',
+        'USER app',
+        'ARG VERSION',
+    ]
+    assert len(result.moves) == 2
+    assert result.layers_gained > 1
+    assert str(result).endswith(f'estimated cached layers gained: {result.layers_gained:.2f}')
+    # the stage itself is not changed
+    assert str(stage.build[1]) == 'COPY app /app'
+
+
+@pytest.mark.parametrize('build', [
+    # RUN uses the copied files
+    [d.COPY('app', '/app'), d.RUN('python3 /app/main.py')],
+    # RUN runs in the directory where the files are copied
+    [d.WORKDIR('/app'), d.COPY('.', '.'), d.RUN('pip install .')],
+    # RUN uses the variable
+    [d.ARG('VERSION'), d.RUN('echo $VERSION')],
+    [d.ARG('VERSION'), d.RUN('echo ${VERSION}')],
+    # RUN implicitly uses the variable
+    [d.ENV('PIP_INDEX_URL', '$INDEX'), d.RUN('pip install requests')],
+    # RUN sees all build arguments as environment variables
+    [d.ARG('SETUPTOOLS_SCM_PRETEND_VERSION'), d.RUN('pip install /app')],
+    # COPY writes into the same directory
+    [d.COPY('app', '/app'), d.COPY('config.toml', '/app/config/')],
+    # WORKDIR changes the meaning of relative paths
+    [d.COPY('app', 'app'), d.WORKDIR('/app')],
+    # unknown steps are barriers
+    [d.COPY('app', '/app'), d.ONBUILD(d.RUN('echo 1'))],
+])
+def test_reorder_keeps_dependencies(build: list) -> None:
+    build.append(d.RUN('touch /stable'))
+    result = make_stage(*build).reorder(explicit_paths=True)
+    assert result.build[:-1] == build[:-1]
+
+
+@pytest.mark.parametrize('build', [
+    [d.COPY('sources.list', '/etc/apt/'), d.RUN('apt-get update')],
+    [d.COPY('pip.conf', '/etc/'), d.RUN('pip install requests')],
+    [d.WORKDIR('/app'), d.COPY('app', '/srv/app'), d.RUN('make')],
+])
+def test_reorder_run_reads_any_file(build: list) -> None:
+    result = make_stage(*build).reorder()
+    assert result.build == build
+    assert not result.moves
+
+
+@pytest.mark.parametrize('step', [d.ARG('VERSION'), d.ENV('VERSION', '$TAG')])
+def test_reorder_run_reads_variables(step: d.BuildStep) -> None:
+    stage = make_stage(step, d.COPY('app', '/app'), d.RUN('make -C /app'), d.USER('app'))
+    result = stage.reorder(churn={'app/main.c': .1})
+    assert [str(step) for step in result.build] == [
+        'COPY app /app',
+        str(step),
+        'RUN make -C /app',
+        'USER app',
+    ]
+
+
+def test_reorder_copy_past_unrelated_run() -> None:
+    build = [d.WORKDIR('/build'), d.COPY('app', '/app'), d.RUN('apt-get install -y curl')]
+    # by default, RUN may read the copied files
+    assert make_stage(*build).reorder().build == build
+    result = make_stage(*build).reorder(explicit_paths=True)
+    assert result.build == [build[0], build[2], build[1]]
+    assert len(result.moves) == 1
+
+
+def test_reorder_churn() -> None:
+    stage = make_stage(
+        d.WORKDIR('/build'),
+        d.COPY('docs', '/app/docs'),
+        d.COPY('src', '/app/src'),
+        d.COPY('README.md', '/app/README.md'),
+    )
+    churn = {'src/main.py': .9, 'src/lib/utils.py': .1, 'docs/index.md': .2}
+    result = stage.reorder(churn=churn)
+    assert [str(step) for step in result.build] == [
+        'WORKDIR /build',
+        'COPY README.md /app/README.md',
+        'COPY docs /app/docs',
+        'COPY src /app/src',
+    ]
+
+
+def test_git_churn(tmp_path: Path) -> None:
+    def git(*args: str) -> None:
+        subprocess.run(['git', '-C', str(tmp_path), *args], check=True, capture_output=True)
+
+    git('init')
+    git('config', 'user.email', 'test@example.com')
+    git('config', 'user.name', 'test')
+    for i in range(4):
+        (tmp_path / 'often.txt').write_text(str(i))
+        if i == 0:
+            (tmp_path / 'rarely.txt').write_text(str(i))
+        git('add', '.')
+        git('commit', '-m', str(i))
+    assert d.git_churn(str(tmp_path)) == {'often.txt': 1, 'rarely.txt': .25}
+
+
+@pytest.mark.parametrize('given, expected', [
+    (
+        [d.RUN('echo 1'), d.RUN('echo 2', 'echo 3'), d.RUN(['echo', '4 5'])],
+        ["RUN echo 1 && \\\n    echo 2 && \\\n    echo 3 && \\\n    echo '4 5'"],
+    ),
+    (
+        [d.RUN('echo 1'), d.ENV('A', '1'), d.RUN('echo 2'), d.RUN('echo 3')],
+        ['RUN echo 1', 'ENV A=1', 'RUN echo 2 && \\\n    echo 3'],
+    ),
+    # exec form is never merged
+    (
+        [d.RUN('echo 1'), d.RUN('echo 2', shell=False), d.RUN('echo 3')],
+        ['RUN echo 1', 'RUN ["echo", "2"]', 'RUN echo 3'],
+    ),
+    # different options
+    (
+        [
+            d.RUN('echo 1', mount=d.CacheMount('/root/.cache')),
+            d.RUN('echo 2', mount=d.CacheMount('/root/.cache')),
+            d.RUN('echo 3', mount=d.CacheMount('/var/cache')),
+            d.RUN('echo 4', network='none'),
+        ],
+        [
+            'RUN --mount=type=cache,target=/root/.cache echo 1 && \\\n    echo 2',
+            'RUN --mount=type=cache,target=/var/cache echo 3',
+            'RUN --network=none echo 4',
+        ],
+    ),
+    # the shell state would leak into the next commands
+    (
+        [d.RUN('echo 1'), d.RUN('cd /app'), d.RUN('make')],
+        ['RUN echo 1 && \\\n    cd /app', 'RUN make'],
+    ),
+    (
+        [d.RUN('export A=1'), d.RUN('make')],
+        ['RUN export A=1', 'RUN make'],
+    ),
+    # the next commands would never run
+    (
+        [d.RUN('echo 1'), d.RUN('exit 0'), d.RUN('make')],
+        ['RUN echo 1 && \\\n    exit 0', 'RUN make'],
+    ),
+    (
+        [d.RUN('exec make'), d.RUN('make install')],
+        ['RUN exec make', 'RUN make install'],
+    ),
+    # chaining would change the meaning of the commands
+    (
+        [d.RUN('echo 1'), d.RUN('false; echo 2'), d.RUN('a || b'), d.RUN('a & b')],
+        ['RUN echo 1', 'RUN false; echo 2', 'RUN a || b', 'RUN a & b'],
+    ),
+    (
+        [d.RUN('echo 1 # hi'), d.RUN('echo 2')],
+        ['RUN echo 1 # hi', 'RUN echo 2'],
+    ),
+    (
+        [d.RUN('echo "a;b"'), d.RUN('echo "#"')],
+        ['RUN echo "a;b" && \\\n    echo "#"'],
+    ),
+])
+def test_merge_runs(given: list, expected: list) -> None:
+    stage = make_stage(*given)
+    removed = stage.merge_runs()
+    assert [str(step) for step in stage.build] == expected
+    assert removed == len(given) - len(expected)
+
+
+@pytest.mark.parametrize('command', [
+    'A=1',
+    'A=1 B=2',
+    'eval "$(pyenv init -)"',
+    'trap "rm -rf /tmp/build" EXIT',
+    'declare -x A=1',
+    'typeset A=1',
+    'readonly A=1',
+    'local A=1',
+    'let A=1',
+    'read A < /etc/hostname',
+    'shift',
+    'getopts ab opt',
+    'set -eux',
+    'shopt -s globstar',
+    'hash -r',
+    'echo 1 && A=1',
+])
+def test_merge_runs_stateful(command: str) -> None:
+    stage = make_stage(d.RUN('echo 0'), d.RUN(command), d.RUN('make'))
+    assert stage.merge_runs() == 1
+    assert str(stage.build[-1]) == 'RUN make'
+
+
+def test_image_merge_runs() -> None:
+    image = d.Image(
+        make_stage(d.RUN('echo 1'), d.RUN('echo 2')),
+        make_stage(d.RUN('echo 1'), d.RUN('echo 2'), d.RUN('echo 3')),
+    )
+    assert image.merge_runs() == 3
+    assert image.merge_runs() == 0
+
+
+SETUP = [d.RUN('apt-get update'), d.RUN('apt-get install -y curl')]
+
+
+def test_find_shared_prefixes() -> None:
+    pip = d.RUN('pip install flask')
+    images = [
+        d.Image(make_stage(*SETUP, pip, d.COPY('a', '/app'))),
+        d.Image(make_stage(*SETUP, pip, d.RUN('pip install b'))),
+        d.Image(make_stage(*SETUP, d.WORKDIR('/c'))),
+        d.Image(make_stage(d.RUN('apt-get update'), d.RUN('echo other'))),
+        d.Image(d.Stage(base=d.BaseImage('alpine'), build=list(SETUP))),
+    ]
+    durations = {SETUP[1]: 10., pip: 2.}
+    result = d.find_shared_prefixes(images, durations=durations)
+    update, install, flask = result.prefixes
+    assert update.stage.base == d.BaseImage('debian')
+    assert [str(step) for step in update.stage.build] == ['RUN apt-get update']
+    assert update.users == (images[3].stages[0],)
+    assert (update.builds, update.layers, update.seconds) == (4, 3, 0.)
+    assert install.stage.base is update.stage
+    assert install.stage.build == [SETUP[1]]
+    assert install.users == (images[2].stages[0],)
+    assert (install.depth, install.builds, install.layers, install.seconds) == (2, 3, 2, 20.)
+    assert flask.stage.base is install.stage
+    assert flask.stage.build == [pip]
+    assert (flask.depth, flask.builds, flask.layers, flask.seconds) == (3, 2, 1, 2.)
+    assert (result.layers, result.seconds) == (6, 22.)
+    assert str(result).splitlines()[-1].split() == ['6', '22.0s', 'total']
+    # the images are not changed yet
+    assert len(images[0].stages[0].build) == 4
+
+    result.apply()
+    first = images[0]
+    assert first.stages == (update.stage, install.stage, flask.stage, flask.users[0])
+    assert [str(step) for step in first.stages[-1].build] == ['COPY a /app']
+    assert images[2].stages == (update.stage, install.stage, install.users[0])
+    assert str(images[2].stages[-1].build[0]) == 'WORKDIR /c'
+    assert [str(step) for step in images[3].stages[-1].build] == ['RUN echo other']
+    assert len(images[4].stages) == 1
+    # applying again changes nothing
+    result.apply()
+    assert len(first.stages) == 4
+    assert len(first.stages[-1].build) == 1
+
+    # the shared stages are built only once
+    fleet = d.Fleet()
+    for image in images[:3]:
+        fleet.add(image)
+    bake = fleet.as_bake()['target']
+    assert sum(name.startswith('shared-') for name in bake) == 3
+
+
+@pytest.mark.parametrize('step', [
+    d.ARG('VERSION'),
+    d.COPY('app', '/app'),
+    d.EXTRACT('app.tar', '/app'),
+    d.RUN('make', mount=d.BindMount('/src')),
+])
+def test_shared_prefix_ends_on_context(step: d.BuildStep) -> None:
+    images = [d.Image(make_stage(step, *SETUP)) for _ in range(3)]
+    assert d.find_shared_prefixes(images).prefixes == ()
+
+
+def test_shared_prefix_tags() -> None:
+    images = [d.Image(make_stage(*SETUP, d.RUN(f'echo {i}'))) for i in range(3)]
+    result = d.find_shared_prefixes(images)
+    prefix, = result.prefixes
+    base = result.as_image(prefix)
+    assert base.stages == (prefix.stage,)
+    result.apply(tags={prefix.stage.name: 'registry/base:1'})
+    for image in images:
+        stage, = image.stages
+        assert stage.base == d.BaseImage('registry/base:1')
+        assert [str(step) for step in stage.build] == [f'RUN echo {images.index(image)}']
+
+
+def test_shared_prefix_min_users() -> None:
+    images = [d.Image(make_stage(*SETUP)) for _ in range(2)]
+    assert len(d.find_shared_prefixes(images).prefixes) == 1
+    assert d.find_shared_prefixes(images, min_users=3).prefixes == ()
+
+
+def test_shared_prefix_fork() -> None:
+    images = [d.Image(make_stage(*SETUP, d.RUN(f'pip install {i % 2}'), d.RUN(f'echo {i}'))) for i in range(4)]
+    result = d.find_shared_prefixes(images)
+    setup, *groups = result.prefixes
+    assert setup.users == ()
+    assert (setup.builds, setup.layers) == (4, 6)
+    assert [(p.stage.base, p.builds, p.layers) for p in groups] == [(setup.stage, 2, 1)] * 2
+    assert result.as_image(groups[0]).stages == (setup.stage, groups[0].stage)
+    result.apply()
+    assert images[0].stages == (setup.stage, groups[0].stage, groups[0].users[0])
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+
+import pytest
+
+import docked as d
+from benchmarks.generators import make_image
+
+
+def parse(text: str) -> d.Image:
+    return d.parse_dockerfile(StringIO(text))
+
+
+def steps(text: str) -> list[str]:
+    image = parse(f'FROM alpine\n{text}\n')
+    return [str(step) for step in image.stages[0].all_steps]
+
+
+@pytest.mark.parametrize('name', [
+    'cowsay',
+    'hello_world',
+    'httpie',
+    'hugo',
+    'ipython',
+])
+def test_roundtrip_examples(name: str) -> None:
+    module = import_module(f'examples.{name}')
+    try:
+        image = module.image
+    except AttributeError:
+        image = module.get_image()
+    expected = list(image.iter_lines())
+    actual = d.parse_dockerfile(image.iter_lines())
+    assert list(actual.iter_lines()) == expected
+    assert actual.syntax == image.syntax
+
+
+def test_roundtrip_file(tmp_path: Path) -> None:
+    image = make_image(stages=5, steps=50)
+    path = tmp_path / 'Dockerfile'
+    image.save(path)
+    with path.open() as stream:
+        actual = d.parse_dockerfile(stream)
+    assert actual.as_str() == image.as_str()
+    assert [stage.name for stage in actual.stages] == [stage.name for stage in image.stages]
+    assert actual.stages[1].base is actual.stages[0]
+    assert actual.stages[1].dependencies == (actual.stages[0],)
+
+
+@pytest.mark.parametrize('given, expected', [
+    # flags and exec form
+    ('RUN echo 1', 'RUN echo 1'),
+    ('RUN ["echo", "1"]', 'RUN ["echo", "1"]'),
+    ('RUN --network=none --security=insecure make', 'RUN --network=none --security=insecure make'),
+    (
+        'RUN --mount=type=cache,target=/root/.cache,ro --mount=type=tmpfs,dst=/tmp make',
+        'RUN --mount=type=cache,target=/root/.cache,ro=true --mount=type=tmpfs,target=/tmp make',
+    ),
+    (
+        'RUN --mount=type=secret,id=token,mode=0440 cat /run/secrets/token',
+        'RUN --mount=type=secret,id=token,mode=0440 cat /run/secrets/token',
+    ),
+    ('RUN --mount=target=/src,rw make', 'RUN --mount=type=bind,target=/src,rw=true make'),
+
+    # line continuations
+    ('RUN apt-get update && \\\n  apt-get install -y curl', 'RUN apt-get update && \\\n    apt-get install -y curl'),
+    ('RUN apt-get update \\\n  && apt-get install -y curl', 'RUN apt-get update && \\\n    apt-get install -y curl'),
+    ('RUN apt-get install \\\n  curl', 'RUN apt-get install   curl'),
+    ('RUN echo 1 && \\\n  # comment\n\n  echo 2', 'RUN echo 1 && \\\n    echo 2'),
+    ('RUN echo "1 && \\\n  2"', 'RUN echo "1 &&   2"'),
+    ('CMD ["echo", \\\n  "1"]', 'CMD ["echo", "1"]'),
+
+    # instructions that produce multiple steps
+    ('ENV A=1 B="2 3"', 'ENV A=1\nENV B="2 3"'),
+    ('ENV A 1 2', 'ENV A="1 2"'),
+    ('ENV A=\\$HOME', 'ENV A=\\$HOME'),
+    # the value refers to the variable set before the instruction
+    ('ENV B=$A A=1', 'ENV B=$A\nENV A=1'),
+    ('ENV A=1 B=\\$A', 'ENV A=1\nENV B=\\$A'),
+    ('ARG A B=2', 'ARG A\nARG B=2'),
+    ('EXPOSE 80 53/UDP', 'EXPOSE 80/tcp\nEXPOSE 53/udp'),
+
+    # ADD
+    ('ADD app.tar.gz /opt/', 'ADD app.tar.gz /opt/'),
+    ('ADD https://example.com/a.txt /a.txt', 'ADD https://example.com/a.txt /a.txt'),
+    ('ADD --checksum=sha256:ab12 https://example.com/a /a', 'ADD --checksum=sha256:ab12 https://example.com/a /a'),
+    ('ADD --keep-git-dir=true https://github.com/a/b.git /b', 'ADD --keep-git-dir=true https://github.com/a/b.git /b'),
+
+    # the rest
+    ('COPY --chown=1:2 --link a b /app/', 'COPY --chown=1:2 --link a b /app/'),
+    ('COPY ["my file", "/app/"]', 'COPY ["my file", "/app/"]'),
+    ('COPY --from=python:3.11 /usr/bin/python3 /bin/', 'COPY --from=python:3.11 /usr/bin/python3 /bin/'),
+    ('CMD python3 -m app', 'CMD python3 -m app'),
+    ('ENTRYPOINT ["/bin/app"]', 'ENTRYPOINT ["/bin/app"]'),
+    ('SHELL ["/bin/bash", "-c"]', 'SHELL ["/bin/bash", "-c"]'),
+    ('HEALTHCHECK NONE', 'HEALTHCHECK NONE'),
+    ('HEALTHCHECK --interval=5s --retries=2 CMD curl .', 'HEALTHCHECK --interval=5s --retries=2 CMD curl .'),
+    ('HEALTHCHECK CMD ["curl", "."]', 'HEALTHCHECK CMD ["curl", "."]'),
+    ('USER app:app', 'USER app:app'),
+    ('VOLUME ["/data", "/logs"]', 'VOLUME /data /logs'),
+    ('WORKDIR /app', 'WORKDIR /app'),
+    ('STOPSIGNAL SIGKILL', 'STOPSIGNAL SIGKILL'),
+    ('onbuild run echo 1', 'ONBUILD RUN echo 1'),
+])
+def test_parse_step(given: str, expected: str) -> None:
+    assert '\n'.join(steps(given)) == expected
+
+
+def test_step_types() -> None:
+    image = parse('''
+FROM alpine
+ADD https://github.com/a/b.git /b
+ADD https://example.com/a.txt /a.txt
+ADD app.tar.gz /opt/
+CMD ["sh"]
+RUN ["echo", "1"]
+''')
+    stage = image.stages[0]
+    assert [type(step) for step in stage.build] == [d.CLONE, d.DOWNLOAD, d.EXTRACT, d.RUN]
+    assert [type(step) for step in stage.run] == [d.CMD]
+    run = stage.build[-1]
+    assert isinstance(run, d.RUN)
+    assert not run.shell
+
+
+def test_stages() -> None:
+    image = parse('''# syntax=docker/dockerfile:1.4
+ARG VERSION=3.11
+FROM --platform=linux/amd64 python:${VERSION}-slim AS build
+ARG VERSION
+RUN --mount=type=cache,target=/root/.cache pip install app
+FROM gcr.io/distroless/python3@sha256:abcd
+COPY --from=build /app /app
+RUN --mount=from=0,target=/mnt cat /mnt/a
+''')
+    build, main = image.stages
+    assert build.name == 'build'
+    assert build.platform == 'linux/amd64'
+    assert build.base == d.BaseImage('python', '3.11-slim')
+    assert str(build.build[0]) == 'ARG VERSION=3.11'
+    assert main.name == ''
+    assert main.base == d.BaseImage('gcr.io/distroless/python3', digest='sha256:abcd')
+    assert main.dependencies == (build,)
+    assert image.syntax_version == '1.4'
+    assert image.stages[1].as_str().startswith('FROM gcr.io/distroless/python3@sha256:abcd\n')
+
+
+def test_labels() -> None:
+    image = parse('FROM alpine\nMAINTAINER me\nLABEL a=1 "b"="2 3"\n')
+    assert image.stages[0].labels == {'maintainer': 'me', 'a': '1', 'b': '2 3'}
+
+
+def test_escape_directive() -> None:
+    image = parse('# escape=`\nFROM alpine\nRUN echo 1 && `\n    echo 2\nENV A=`$B\n')
+    assert image.escape == '`'
+    assert [str(step) for step in image.stages[0].build] == ['RUN echo 1 &&     echo 2', 'ENV A=`$B']
+
+
+def test_syntax_version() -> None:
+    # the version that docked would pick anyway isn't pinned
+    assert parse('# syntax=docker/dockerfile:1.0\nFROM alpine').syntax_version is None
+    assert parse('# syntax=docker/dockerfile:1\nFROM alpine').syntax_version == '1'
+    image = parse('# syntax=docker/dockerfile-upstream:master\nFROM alpine')
+    assert image.syntax == 'docker/dockerfile-upstream:master'
+
+
+def test_mounts_are_shared() -> None:
+    image = parse('FROM alpine\nRUN --mount=type=cache,target=/c a\nRUN --mount=type=cache,target=/c b\n')
+    first, second = image.stages[0].build
+    assert isinstance(first, d.RUN)
+    assert isinstance(second, d.RUN)
+    assert first.mounts[0] is second.mounts[0]
+
+
+@pytest.mark.parametrize('given, error', [
+    ('', 'no FROM instruction'),
+    ('RUN echo 1', 'line 1: RUN before FROM'),
+    ('FROM alpine\n\nDANCE', 'line 3: unknown instruction DANCE'),
+    ('FROM alpine\nCOPY --chmod=644 a b', 'line 2: unsupported flag --chmod'),
+    ('FROM alpine\nRUN --mount=type=bind make', 'line 2: target is required for bind mount'),
+    ('FROM alpine\nEXPOSE 80-90', 'line 2: invalid literal'),
+    ('FROM alpine\nLABEL a', 'line 2: expected key=value'),
+    ('FROM alpine\nENV A=1 B=$A', 'line 2: ENV value refers to A set by the same instruction'),
+    ('FROM alpine\nENV A=1 B="${A:-2} 3"', 'line 2: ENV value refers to A'),
+    ('FROM alpine AS', 'line 1: invalid FROM'),
+    ('FROM alpine\nRUN --network=bridge make', "line 2: unsupported network 'bridge'"),
+    ('FROM alpine\nRUN --mount=type=cache,target=/a,sharing=all make', "line 2: unsupported sharing 'all'"),
+    ('FROM alpine\nADD --checksum=md5:00 https://a.b/c /', "line 2: unsupported checksum algorithm 'md5'"),
+])
+def test_errors(given: str, error: str) -> None:
+    with pytest.raises(ValueError, match=error):
+        parse(given)
@@ -0,0 +1,111 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+import docked as d
+
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+
+
+def make_image() -> d.Image:
+    deps = d.Stage(base=d.BaseImage('python', '3.11-slim'), name='deps', build=[
+        d.WORKDIR('/app'),
+        d.ENV('PIP_NO_CACHE_DIR', '1'),
+        d.COPY('requirements.txt', '.'),
+        d.RUN('pip install -r requirements.txt'),
+    ])
+    final = d.Stage(base=deps, name='final', build=[
+        d.COPY('src', '/app/src'),
+        d.RUN('python -m compileall /app/src'),
+    ])
+    return d.Image(deps, final)
+
+
+def test_parse_progress() -> None:
+    image = make_image()
+    deps, final = image.stages
+    with (FIXTURES / 'progress.jsonl').open() as stream:
+        profile = d.parse_progress(stream, image)
+    assert len(profile.timings) == 11
+    assert [t.step for t in profile.steps] == [
+        None, deps.build[0], deps.build[2], deps.build[3], final.build[0], final.build[1],
+    ]
+    assert [t.stage for t in profile.steps] == [deps] * 4 + [final] * 2
+    assert [t.step for t in profile.misses] == final.build
+
+    slowest = profile.slowest(2)
+    assert slowest[0].step is final.build[1]
+    assert slowest[0].duration == pytest.approx(2.5)
+    assert not slowest[0].cached
+    assert profile.get(deps.build[3]).cached
+    assert profile.get(deps.build[1]) is None
+    timing = profile.timings[0]
+    assert timing.stage is None
+    assert timing.duration == pytest.approx(.052381)
+
+
+@pytest.mark.parametrize('name, stage, step', [
+    ('[final 2/2] RUN python -m compileall /app/src', 1, 1),
+    ('[linux/arm64 final 1/2] COPY src /app/src', 1, 0),
+    ('[stage-0  2/4] WORKDIR /app', 0, 0),
+    ('[deps 1/4] FROM docker.io/library/python:3.11-slim', 0, None),
+    ('[other 1/2] RUN make', None, None),
+    ('[internal] load build context', None, None),
+])
+def test_find_step(name: str, stage: int, step: int) -> None:
+    image = make_image()
+    event = f'{{"vertexes":[{{"digest":"x","name":"{name}","started":"2024-05-14T10:00:00Z"}}]}}'
+    timing, = d.parse_progress([event], image).timings
+    if stage is None:
+        assert timing.stage is None
+        return
+    assert timing.stage is image.stages[stage]
+    if step is None:
+        assert timing.step is None
+    else:
+        ops = [s for s in image.stages[stage].build if not isinstance(s, d.ENV)]
+        assert timing.step is ops[step]
+
+
+STUB = f'''#!{sys.executable}
+import sys
+sys.stderr.write(open({str(FIXTURES / 'progress.jsonl')!r}).read())
+sys.exit(0 if '--progress=rawjson' in sys.argv else 1)
+'''
+
+
+def test_image_profile(tmp_path: Path) -> None:
+    binary = tmp_path / 'docker'
+    binary.write_text(STUB)
+    binary.chmod(0o755)
+    image = make_image()
+    with (tmp_path / 'out.log').open('w') as stdout:
+        profile = image.profile(['.'], binary=str(binary), stdout=stdout)
+    assert profile.ok
+    assert profile.slowest(1)[0].step is image.stages[1].build[1]
+    assert 'RUN python -m compileall /app/src' in str(profile)
+
+
+def test_platforms() -> None:
+    image = make_image()
+    vertices = [
+        ('a', '[internal] load build context', '00', '01'),
+        ('b', '[linux/amd64 deps 2/4] WORKDIR /app', '01', '03'),
+        ('c', '[linux/arm64 deps 2/4] WORKDIR /app', '01', '02'),
+        ('d', '[linux/amd64->arm64 final 2/2] RUN python -m compileall /app/src', '02', '07'),
+        ('e', '[linux/amd64->arm/v7 final 2/2] RUN python -m compileall /app/src', '02', '04'),
+    ]
+    lines = [
+        f'{{"vertexes":[{{"digest":"{digest}","name":"{name}",'
+        f'"started":"2024-05-14T10:00:{start}Z","completed":"2024-05-14T10:00:{end}Z"}}]}}'
+        for digest, name, start, end in vertices
+    ]
+    profile = d.parse_progress(lines, image)
+    assert [t.platform for t in profile.timings] == [
+        None, 'linux/amd64', 'linux/arm64', 'linux/arm64', 'linux/arm/v7',
+    ]
+    assert [t.start for t in profile.timings] == [0, 1, 1, 2, 2]
+    assert profile.timings[3].step is image.stages[1].build[1]
+    assert profile.platforms == {'linux/amd64': 2, 'linux/arm64': 6, 'linux/arm/v7': 2}
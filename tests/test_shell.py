@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import shlex
+
+import pytest
+
+import docked as d
+from docked._shell import parse_run, tokenize
+
+
+@pytest.mark.parametrize('given, expected', [
+    ('echo 1', [('echo', ('1',))]),
+    ('/usr/bin/vim a.txt', [('vim', ('a.txt',))]),
+    ('sudo -u app vim', [('vim', ())]),
+    ('sudo -E FOO=1 make', [('make', ())]),
+    ('A=1 B=2 make all', [('make', ('all',))]),
+    ('python3 -m pip install x', [('pip', ('install', 'x'))]),
+    ('echo 1 && echo 2', [('echo', ('1',)), ('echo', ('2',))]),
+    ('cat a | grep b > out.txt', [('cat', ('a',)), ('grep', ('b',))]),
+    ('echo "a && b" # comment', [('echo', ('a && b',))]),
+    ('{ echo 1; } || true', [('echo', ('1',)), ('true', ())]),
+])
+def test_parse_commands(given: str, expected: list) -> None:
+    parsed = parse_run(given)
+    assert parsed.valid
+    assert [(cmd.program, cmd.args) for cmd in parsed.commands] == expected
+
+
+@pytest.mark.parametrize('given', [
+    'make -j4 all&&make install',
+    'cat a|grep b>>out 2>&1 &',
+    '(cd /app; make) || exit 1',
+    'echo $HOME ~/x *.py [ab] {c,d}',
+    'a\tb\nc\r d',
+    # shlex handles these
+    'echo "a b" \'c\'',
+    'echo a\\ b',
+    'echo 1 # comment',
+])
+def test_tokenize_like_shlex(given: str) -> None:
+    lexer = shlex.shlex(given, posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    assert tokenize(given) == list(lexer)
+
+
+@pytest.mark.parametrize('given, expected', [
+    ('apt-get install -y curl', 'install'),
+    ('apt-get -y -q install curl', 'install'),
+    ('sudo apt update', 'update'),
+    ('apt-get', None),
+])
+def test_subcommand(given: str, expected: str | None) -> None:
+    cmd, = parse_run(given).commands
+    assert cmd.subcommand == expected
+
+
+def test_sudo_and_env() -> None:
+    cmd, = parse_run('X=1 sudo -u root Y=2 apt-get update').commands
+    assert cmd.sudo
+    assert cmd.env == ('X=1', 'Y=2')
+    assert cmd.argv[0] == 'X=1'
+    assert not parse_run('apt-get update').commands[0].sudo
+
+
+def test_chains_and_operators() -> None:
+    parsed = parse_run('a && b; c || d', ('e',))
+    assert [[cmd.program for cmd in chain] for chain in parsed.chains] == [['a', 'b'], ['c'], ['d', 'e']]
+    assert parsed.operators == {'&&', ';', '||'}
+    assert [cmd.program for cmd in parsed.find('b')] == ['b']
+
+
+def test_exec_form() -> None:
+    parsed = parse_run(['python3', '-c', 'print(1) && 2'], shell=False)
+    assert parsed.operators == frozenset()
+    cmd, = parsed.commands
+    assert cmd.program == 'python3'
+    assert cmd.args == ('-c', 'print(1) && 2')
+
+
+def test_invalid() -> None:
+    parsed = parse_run('echo "unclosed')
+    assert not parsed.valid
+    assert parsed.commands == ()
+
+
+def test_cached_on_step() -> None:
+    step = d.RUN('apt-get update', 'apt-get install -y curl')
+    parsed = step.parsed
+    assert step.parsed is parsed
+    assert [cmd.subcommand for cmd in parsed.find('apt-get')] == ['update', 'install']
@@ -1,3 +1,4 @@
+import pickle
 from datetime import timedelta
 from pathlib import PosixPath
 from signal import SIGKILL
@@ -5,6 +6,7 @@ from signal import SIGKILL
 import pytest
 
 import docked as d
+from docked._types import TmpFSMount, replace
 
 
 @pytest.mark.parametrize('given, expected', [
@@ -119,3 +121,79 @@ import docked as d
 def test_as_str(given: d.Step, expected: str) -> None:
     assert given.as_str() == expected
     assert str(given) == expected
+
+
+@pytest.mark.parametrize('step, attr', [
+    (d.ARG('user', 'root'), 'default'),
+    (d.RUN('echo 1', 'echo 2', mount=d.CacheMount('/root/.cache')), 'first'),
+    (d.COPY('src', '/app', link=True), 'dst'),
+    (d.EXTRACT('a/b/c.gz', '/'), 'src'),
+    (d.DOWNLOAD('https://a.b/c', '/c'), 'checksum'),
+    (d.CLONE('https://a.b/c.git', '/c'), 'keep_git_dir'),
+    (d.HEALTHCHECK('echo 1', retries=9), 'retries'),
+])
+def test_immutable(step: d.Step, attr: str) -> None:
+    rendered = str(step)
+    with pytest.raises(AttributeError):
+        setattr(step, attr, 'oh no')
+    assert str(step) == step.as_str() == rendered
+
+
+@pytest.mark.parametrize('left, right', [
+    (d.RUN('echo 1'), d.RUN('echo 1')),
+    (d.RUN(['echo', '1']), d.RUN('echo 1')),
+    (d.COPY('src', '/app'), d.COPY('src', PosixPath('/app'))),
+    (d.ENV('user', 'root'), d.ENV('user', 'root')),
+])
+def test_equal(left: d.Step, right: d.Step) -> None:
+    assert left == right
+    assert hash(left) == hash(right)
+    assert left.fingerprint == right.fingerprint
+
+
+@pytest.mark.parametrize('left, right', [
+    (d.RUN('echo 1'), d.RUN('echo 2')),
+    (d.COPY('src', '/app'), d.COPY('src', '/app', link=True)),
+    (d.EXTRACT('a.gz', '/'), d.DOWNLOAD('a.gz', '/')),
+])
+def test_not_equal(left: d.Step, right: d.Step) -> None:
+    assert left != right
+    assert left.fingerprint != right.fingerprint
+
+
+@pytest.mark.parametrize('value', [
+    d.COPY('src', '/app', from_stage=d.BaseImage('python')),
+    d.DOWNLOAD('https://a.b/c', '/c', checksum=d.Checksum('ab12')),
+    d.CLONE('https://a.b/c.git', '/c', keep_git_dir=True),
+    d.EXTRACT('a.gz', '/', chown=1),
+    d.BindMount('/mnt', source='/src', from_stage=d.BaseImage('python')),
+    d.CacheMount('/root/.cache', sharing='locked', uid=1),
+    d.SecretMount(id='token', required=True),
+    d.SSHMount(mode=0o400),
+])
+def test_slotted_values(value: object) -> None:
+    assert not hasattr(value, '__dict__')
+    copy = pickle.loads(pickle.dumps(value))
+    assert copy == value
+    assert hash(copy) == hash(value)
+    assert str(copy) == str(value)
+
+
+def test_mount_values() -> None:
+    mount = d.CacheMount('/root/.cache', sharing='locked')
+    assert mount == d.CacheMount(PosixPath('/root/.cache'), sharing='locked')
+    assert mount != d.CacheMount('/root/.cache')
+    assert mount != d.BindMount('/root/.cache')
+    assert len({mount, d.CacheMount('/root/.cache', sharing='locked')}) == 1
+    assert repr(TmpFSMount('/tmp', size='1G')) == "TmpFSMount(target='/tmp', size='1G')"
+    with pytest.raises(AttributeError):
+        mount.target = '/tmp'  # type: ignore[misc]
+
+
+def test_add_values() -> None:
+    copy = d.COPY('app', '/app', link=True)
+    assert repr(copy) == "COPY(src='app', dst='/app', chown=None, link=True, from_stage=None)"
+    assert repr(d.EXTRACT('a.tar', '/')) == "EXTRACT(src='a.tar', dst='/', chown=None, link=False)"
+    changed = replace(copy, dst='/srv')
+    assert str(changed) == 'COPY --link app /srv'
+    assert changed.link